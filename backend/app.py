@@ -1,17 +1,40 @@
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify, request, send_file, stream_with_context
 from flask_cors import CORS
+from werkzeug.middleware.proxy_fix import ProxyFix
 import os
+import json
+import threading
+from contextlib import ExitStack
 from dotenv import load_dotenv
-import re
 
 # Load .env variables
 load_dotenv()
 
-from db_helper import get_table_data, execute_query
+from db_helper import get_table_data
+import snapshot
+import semantic
+import query_governor
+import sql_guard
+import jobs
+import warmup
+import health
+import ev_profile
+import resilience
+from semantic import measure
+from compression import init_compression, cached_response
+from tracing import init_tracing
 
 app = Flask(__name__)
 CORS(app)
 
+# Number of reverse proxies in front of the app whose X-Forwarded-* headers are
+# trusted (0: use the socket peer address as the client address)
+TRUSTED_PROXY_HOPS = int(os.getenv("TRUSTED_PROXY_HOPS", "0"))
+if TRUSTED_PROXY_HOPS > 0:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXY_HOPS, x_proto=TRUSTED_PROXY_HOPS)
+init_tracing(app)
+init_compression(app)
+
 # IMPORTANT DATABASE CONFIG STUFF LOADING FROM ENV
 DB_SERVER = os.getenv("DB_SERVER") 
 DB_NAME = os.getenv("DB_NAME")
@@ -31,27 +54,70 @@ ALLOWED_TABLES = {
     'vehicle_dim'
 }
 
+# Serving mode: 'database' queries Azure SQL per request, 'snapshot' answers the
+# analytics routes from an in-process copy of ALLOWED_TABLES
+SERVING_MODE = os.getenv("SERVING_MODE", "database").lower()
+SNAPSHOT_POLL_SECONDS = int(os.getenv("SNAPSHOT_POLL_SECONDS", "60"))
+
+# Pre-request the dashboard's first-paint routes at startup and after each ETL load
+WARMUP_ON_START = os.getenv("WARMUP_ON_START", "true").lower() in ("1", "true", "yes")
+
+# Startup work (database I/O and background threads) runs once per serving
+# process, on a background thread so no request waits for it: from __main__,
+# or from the WSGI entry point (wsgi.py) in each worker. Importing this module
+# does neither.
+_services_lock = threading.Lock()
+_services_started = False
+
+def _load_services():
+    # The snapshot first, so the suburb index is built from it rather than the database
+    if SERVING_MODE == "snapshot":
+        snapshot.start(ALLOWED_TABLES, poll_seconds=SNAPSHOT_POLL_SECONDS)
+
+    # Load the suburb search index up front; it is rebuilt lazily if this fails
+    try:
+        import suburb_index
+        suburb_index.load()
+    except Exception as e:
+        print(f"Suburb index not loaded at startup: {e}")
+
+    # Warm the pool and response cache now and after every ETL load
+    if WARMUP_ON_START:
+        warmup.start(app)
+
+def start_services():
+    """Load the suburb index and snapshot and start warm-up in the background.
+
+    Only the first call does anything; it returns without waiting for the
+    database.
+    """
+    global _services_started
+    with _services_lock:
+        if _services_started:
+            return
+        _services_started = True
+    threading.Thread(target=_load_services, name="start-services", daemon=True).start()
+
 # API Routes
 
 @app.route('/api/dashboard-data')
+@cached_response()
 def dashboard_data():
     """Get all data needed for dashboard initialization."""
     try:
         from db_helper import dataframe_to_json_serializable
         
-        # Energy metrics - using actual column names
-        energy_query = """
-        SELECT 
-            COUNT(*) as total_records,
-            AVG(ENERGY_CONSUMPTION) as avg_energy_consumption,
-            SUM(ENERGY_CONSUMPTION) as total_energy_consumption,
-            AVG(NO2_LEVEL) as avg_no2_level,
-            AVG(EV_PER_ENERGY_UNIT) as avg_ev_per_energy_unit
-        FROM dbo.energy_fact
-        WHERE ENERGY_CONSUMPTION IS NOT NULL
-        """
-        energy_df = execute_query(energy_query)
-        energy_data = dataframe_to_json_serializable(energy_df)[0]
+        # Energy metrics
+        energy_data = semantic.query(
+            measures=[
+                measure('energy_records', 'total_records'),
+                measure('avg_energy', 'avg_energy_consumption'),
+                measure('total_energy', 'total_energy_consumption'),
+                measure('avg_no2', 'avg_no2_level'),
+                'avg_ev_per_energy_unit',
+            ],
+            filters=[('energy_fact.ENERGY_CONSUMPTION', 'not_null', None)],
+        )[0]
         
         # EV metrics
         ev_query = """
@@ -62,7 +128,7 @@ def dashboard_data():
             COUNT(*) as total_records
         FROM dbo.ev_fact
         """
-        ev_df = execute_query(ev_query)
+        ev_df = snapshot.query('dashboard_ev', ev_query)
         ev_data = dataframe_to_json_serializable(ev_df)[0]
         
         # Calculate percentages
@@ -73,10 +139,10 @@ def dashboard_data():
         dashboard_data = {
             'energy': {
                 'total_records': energy_data['total_records'] or 0,
-                'avg_energy_consumption': round(energy_data['avg_energy_consumption'] or 0, 2),
-                'total_energy_consumption': round(energy_data['total_energy_consumption'] or 0, 2),
-                'avg_no2_level': round(energy_data['avg_no2_level'] or 0, 2),
-                'avg_ev_per_energy_unit': round(energy_data['avg_ev_per_energy_unit'] or 0, 4)
+                'avg_energy_consumption': energy_data['avg_energy_consumption'] or 0,
+                'total_energy_consumption': energy_data['total_energy_consumption'] or 0,
+                'avg_no2_level': energy_data['avg_no2_level'] or 0,
+                'avg_ev_per_energy_unit': energy_data['avg_ev_per_energy_unit'] or 0
             },
             'ev': {
                 'total_evs': total_evs,
@@ -93,45 +159,28 @@ def dashboard_data():
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/energy-trends')
+@cached_response()
 def energy_trends():
     """Get energy consumption trends by year."""
     try:
-        from db_helper import dataframe_to_json_serializable
-        
-        query = """
-        SELECT 
-            t.YEAR,
-            COUNT(*) as record_count,
-            AVG(e.ENERGY_CONSUMPTION) as avg_energy_consumption,
-            SUM(e.ENERGY_CONSUMPTION) as total_energy_consumption,
-            AVG(e.NO2_LEVEL) as avg_no2_level,
-            AVG(e.ENERGY_CHANGE_PCT) as avg_energy_change_pct
-        FROM dbo.energy_fact e
-        JOIN dbo.time_dim t ON e.time_id = t.time_id
-        WHERE e.ENERGY_CONSUMPTION IS NOT NULL
-        GROUP BY t.YEAR
-        ORDER BY t.YEAR
-        """
-        
-        df = execute_query(query)
-        result = dataframe_to_json_serializable(df)
-        
-        # Round the float values for better display
-        for row in result:
-            if row['avg_energy_consumption']:
-                row['avg_energy_consumption'] = round(row['avg_energy_consumption'], 2)
-            if row['total_energy_consumption']:
-                row['total_energy_consumption'] = round(row['total_energy_consumption'], 2)
-            if row['avg_no2_level']:
-                row['avg_no2_level'] = round(row['avg_no2_level'], 2)
-            if row['avg_energy_change_pct']:
-                row['avg_energy_change_pct'] = round(row['avg_energy_change_pct'], 2)
-        
+        result = semantic.query(
+            measures=[
+                measure('energy_records', 'record_count'),
+                measure('avg_energy', 'avg_energy_consumption'),
+                measure('total_energy', 'total_energy_consumption'),
+                measure('avg_no2', 'avg_no2_level'),
+                'avg_energy_change_pct',
+            ],
+            dimensions=['year'],
+            filters=[('energy_fact.ENERGY_CONSUMPTION', 'not_null', None)],
+            order_by=['year'],
+        )
         return jsonify(result)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/ev-trends')
+@cached_response()
 def ev_trends():
     """Get EV adoption trends by year."""
     try:
@@ -150,60 +199,39 @@ def ev_trends():
         ORDER BY t.YEAR
         """
         
-        df = execute_query(query)
+        df = snapshot.query('ev_trends', query)
         result = dataframe_to_json_serializable(df)
         return jsonify(result)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/suburb-data')
+@cached_response()
 def suburb_data():
     """Get data by suburb with optional filtering."""
     try:
-        from db_helper import dataframe_to_json_serializable
-        
         # Get query parameters
         limit = request.args.get('limit', 50, type=int)
         year = request.args.get('year', type=int)
         
-        # Build the query with joins - using correct column names
-        where_clause = ""
-        if year:
-            where_clause = f"WHERE t.YEAR = {year}"
-        
-        query = f"""
-        SELECT TOP {limit}
-            s.SUBURB_NAME,
-            t.YEAR,
-            COUNT(*) as energy_records,
-            AVG(e.ENERGY_CONSUMPTION) as avg_energy_consumption,
-            AVG(e.NO2_LEVEL) as avg_no2_level,
-            AVG(e.EV_PER_ENERGY_UNIT) as avg_ev_per_energy_unit
-        FROM dbo.energy_fact e
-        JOIN dbo.suburb_dim s ON e.suburb_id = s.suburb_id
-        JOIN dbo.time_dim t ON e.time_id = t.time_id
-        {where_clause}
-        GROUP BY s.SUBURB_NAME, t.YEAR
-        ORDER BY avg_energy_consumption DESC
-        """
-        
-        df = execute_query(query)
-        result = dataframe_to_json_serializable(df)
-        
-        # Round float values
-        for row in result:
-            if row['avg_energy_consumption']:
-                row['avg_energy_consumption'] = round(row['avg_energy_consumption'], 2)
-            if row['avg_no2_level']:
-                row['avg_no2_level'] = round(row['avg_no2_level'], 2)
-            if row['avg_ev_per_energy_unit']:
-                row['avg_ev_per_energy_unit'] = round(row['avg_ev_per_energy_unit'], 4)
-        
+        result = semantic.query(
+            measures=[
+                'energy_records',
+                measure('avg_energy', 'avg_energy_consumption'),
+                measure('avg_no2', 'avg_no2_level'),
+                'avg_ev_per_energy_unit',
+            ],
+            dimensions=['suburb', 'year'],
+            filters=[('year', '=', year)] if year else [],
+            order_by=['-avg_energy_consumption'],
+            limit=limit,
+        )
         return jsonify(result)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 @app.route("/api/energy-data")
+@cached_response()
 def energy_data():
     """Get energy data with optional filtering."""
     try:
@@ -214,18 +242,36 @@ def energy_data():
         suburb = request.args.get('suburb')
         limit = request.args.get('limit', 100, type=int)
         
-        # Build where clause
+        # Build where clause - values are bound as parameters, never interpolated
         where_clauses = []
+        params = [limit]
         if year:
-            where_clauses.append(f"t.YEAR = {year}")
+            where_clauses.append("t.YEAR = ?")
+            params.append(year)
+        suburb_ids = None
         if suburb:
-            where_clauses.append(f"s.SUBURB_NAME LIKE '%{suburb}%'")
+            # Resolve the name through the suburb index so the fact query filters
+            # on the indexed suburb_id instead of a leading-wildcard LIKE scan
+            from suburb_index import get_index
+            suburb_ids = sorted(get_index().resolve(suburb))
+            if not suburb_ids:
+                return jsonify({
+                    "filters": {
+                        "year": year,
+                        "suburb": suburb,
+                        "limit": limit
+                    },
+                    "row_count": 0,
+                    "data": []
+                })
+            where_clauses.append(f"e.suburb_id IN ({','.join('?' for _ in suburb_ids)})")
+            params.extend(suburb_ids)
         
         where_clause = " AND ".join(where_clauses) if where_clauses else "1=1"
         
         # Get the data with joins - using correct column names
         query = f"""
-        SELECT TOP {limit}
+        SELECT TOP (?)
             e.energy_fact_id,
             e.ENERGY_CONSUMPTION,
             e.ENERGY_CHANGE_PCT,
@@ -244,7 +290,7 @@ def energy_data():
         ORDER BY t.YEAR DESC, s.SUBURB_NAME
         """
         
-        df = execute_query(query)
+        df = snapshot.query('energy_data', query, params=params, limit=limit, year=year, suburb_ids=suburb_ids)
         result = dataframe_to_json_serializable(df)
         
         return jsonify({
@@ -260,417 +306,229 @@ def energy_data():
         return jsonify({"error": str(e)}), 500
     
 @app.route('/api/ev-price-scatter', methods=['GET'])
+@cached_response()
 def ev_price_scatter():
     """Get EV adoption vs average price scatter plot data."""
     try:
-        from db_helper import dataframe_to_json_serializable
-        
-        query = """
-        SELECT 
-            s.SUBURB_NAME,
-            AVG(e.AVG_PRICE) as avg_price,
-            SUM(e.TOTAL_EVs) as total_evs
-        FROM dbo.ev_fact e
-        JOIN dbo.suburb_dim s ON e.suburb_id = s.suburb_id
-        JOIN dbo.time_dim t ON e.time_id = t.time_id
-        WHERE e.AVG_PRICE IS NOT NULL 
-        AND e.TOTAL_EVs IS NOT NULL 
-        AND e.TOTAL_EVs > 0
-        GROUP BY s.SUBURB_NAME
-        HAVING AVG(e.AVG_PRICE) > 0
-        ORDER BY total_evs DESC
-        """
-        
-        df = execute_query(query)
-        result = dataframe_to_json_serializable(df)
-        
-        # Round values for better display
-        for row in result:
-            if row['avg_price']:
-                row['avg_price'] = round(row['avg_price'], 0)
-            if row['total_evs']:
-                row['total_evs'] = round(row['total_evs'], 1)
-        
         return jsonify({
-            "data": result,
+            "data": ev_profile.scatter('avg_price'),
             "x_key": "avg_price",
             "y_key": "total_evs"
         })
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-
 @app.route('/api/ev-range-scatter', methods=['GET'])
+@cached_response()
 def ev_range_scatter():
     """Get EV adoption vs average range scatter plot data."""
     try:
-        from db_helper import dataframe_to_json_serializable
-        
-        query = """
-        SELECT 
-            s.SUBURB_NAME,
-            AVG(e.AVG_RANGE_KM) as avg_range,
-            SUM(e.TOTAL_EVs) as total_evs
-        FROM dbo.ev_fact e
-        JOIN dbo.suburb_dim s ON e.suburb_id = s.suburb_id
-        JOIN dbo.time_dim t ON e.time_id = t.time_id
-        WHERE e.AVG_RANGE_KM IS NOT NULL 
-        AND e.TOTAL_EVs IS NOT NULL 
-        AND e.TOTAL_EVs > 0
-        GROUP BY s.SUBURB_NAME
-        HAVING AVG(e.AVG_RANGE_KM) > 0
-        ORDER BY total_evs DESC
-        """
-        
-        df = execute_query(query)
-        result = dataframe_to_json_serializable(df)
-        
-        # Round values for better display
-        for row in result:
-            if row['avg_range']:
-                row['avg_range'] = round(row['avg_range'], 1)
-            if row['total_evs']:
-                row['total_evs'] = round(row['total_evs'], 1)
-        
         return jsonify({
-            "data": result,
+            "data": ev_profile.scatter('avg_range'),
             "x_key": "avg_range",
             "y_key": "total_evs"
         })
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+# Both scatters above are projections of this per-suburb profile
+@app.route('/api/ev-suburb-profile', methods=['GET'])
+@cached_response()
+def ev_suburb_profile():
+    """Get EV count, BEV/PHEV split, average price and average range per suburb."""
+    try:
+        return jsonify(ev_profile.records())
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
 @app.route('/api/energy-vs-no2', methods=['GET'])
+@cached_response()
 def energy_vs_no2():
     """Get energy consumption vs NO2 pollution data."""
     try:
-        from db_helper import dataframe_to_json_serializable
-        
-        query = """
-        SELECT 
-            s.SUBURB_NAME,
-            AVG(en.ENERGY_CONSUMPTION) as ENERGY_CONSUMPTION,
-            AVG(en.NO2_LEVEL) as NO2_LEVEL
-        FROM dbo.energy_fact en
-        JOIN dbo.suburb_dim s ON en.suburb_id = s.suburb_id
-        JOIN dbo.time_dim t ON en.time_id = t.time_id
-        WHERE en.ENERGY_CONSUMPTION IS NOT NULL
-        AND en.NO2_LEVEL IS NOT NULL
-        GROUP BY s.SUBURB_NAME
-        HAVING AVG(en.ENERGY_CONSUMPTION) > 0 AND AVG(en.NO2_LEVEL) > 0
-        ORDER BY s.SUBURB_NAME
-        """
-        
-        df = execute_query(query)
-        result = dataframe_to_json_serializable(df)
-        
-        # Round values for better display
-        for row in result:
-            if row['ENERGY_CONSUMPTION']:
-                row['ENERGY_CONSUMPTION'] = round(row['ENERGY_CONSUMPTION'], 2)
-            if row['NO2_LEVEL']:
-                row['NO2_LEVEL'] = round(row['NO2_LEVEL'], 2)
-        
+        result = semantic.query(
+            measures=[measure('avg_energy', 'ENERGY_CONSUMPTION'), measure('avg_no2', 'NO2_LEVEL')],
+            dimensions=['suburb'],
+            filters=[('energy_fact.ENERGY_CONSUMPTION', 'not_null', None), ('energy_fact.NO2_LEVEL', 'not_null', None)],
+            having=[('ENERGY_CONSUMPTION', '>', 0), ('NO2_LEVEL', '>', 0)],
+            order_by=['suburb'],
+        )
         return jsonify(result)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/no2-trends', methods=['GET'])
+@cached_response()
 def no2_trends():
     """Get NO2 levels over years by suburb."""
     try:
-        from db_helper import dataframe_to_json_serializable
-        from flask import request
-        
         # Get years from query parameters, default to 2022 and 2023
         years = request.args.getlist('years')
         if not years:
             years = ['2022', '2023']
-        
-        # Convert to integers and create SQL IN clause
         year_list = [int(year) for year in years]
-        year_placeholders = ','.join(['?' for _ in year_list])
-        
-        query = f"""
-        SELECT 
-            s.SUBURB_NAME,
-            t.YEAR,
-            AVG(en.NO2_LEVEL) as NO2_LEVEL
-        FROM dbo.energy_fact en
-        JOIN dbo.suburb_dim s ON en.suburb_id = s.suburb_id
-        JOIN dbo.time_dim t ON en.time_id = t.time_id
-        WHERE en.NO2_LEVEL IS NOT NULL
-        AND t.YEAR IN ({year_placeholders})
-        GROUP BY s.SUBURB_NAME, t.YEAR
-        HAVING AVG(en.NO2_LEVEL) > 0
-        ORDER BY t.YEAR, s.SUBURB_NAME
-        """
-        
-        df = execute_query(query, params=year_list)
-        result = dataframe_to_json_serializable(df)
-        
-        # Round values for better display
-        for row in result:
-            if row['NO2_LEVEL']:
-                row['NO2_LEVEL'] = round(row['NO2_LEVEL'], 2)
         
+        result = semantic.query(
+            measures=[measure('avg_no2', 'NO2_LEVEL')],
+            dimensions=['suburb', 'year'],
+            filters=[('energy_fact.NO2_LEVEL', 'not_null', None), ('year', 'in', year_list)],
+            having=[('NO2_LEVEL', '>', 0)],
+            order_by=['year', 'suburb'],
+        )
         return jsonify(result)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/metrics')
+@cached_response()
+def metrics():
+    """Any combination of semantic-layer measures and dimensions.
+
+    ?measures=avg_energy,avg_no2&dimensions=suburb,year&year=2023&order_by=-avg_energy&limit=10
+    Without measures, lists the available measures and dimensions.
+    """
+    if not request.args.get('measures'):
+        return jsonify(semantic.catalog())
+    try:
+        spec = semantic.parse_request_args(request.args)
+        return jsonify(semantic.query(**spec))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/aggregate')
+@cached_response()
+def aggregate():
+    """Several groupings of the same measures in one request, one scan per fact table.
+
+    ?measures=avg_energy,total_evs&grouping_sets=year;suburb,year;suburb&cube=fuel,year
+    Returns {"year": [...], "suburb,year": [...], ...} keyed by grouping.
+    """
+    try:
+        spec = semantic.parse_grouping_args(request.args)
+        return jsonify(semantic.grouping_sets_query(**spec))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
 @app.route('/api/ev-distribution', methods=['GET'])
+@cached_response()
 def ev_distribution():
     """Get EV distribution by suburb (Top 10) split by BEV and PHEV."""
     try:
-        from db_helper import dataframe_to_json_serializable
+        from query_builder import EV_DISTRIBUTION, build_top_n_pivot_query, series_payload
         
-        query = """
-        WITH SuburbTotals AS (
-            SELECT 
-                s.SUBURB_NAME,
-                SUM(e.TOTAL_EVs) as total_evs
-            FROM dbo.ev_fact e
-            JOIN dbo.suburb_dim s ON e.suburb_id = s.suburb_id
-            WHERE e.TOTAL_EVs IS NOT NULL AND e.TOTAL_EVs > 0
-            GROUP BY s.SUBURB_NAME
-        ),
-        TopSuburbs AS (
-            SELECT TOP 10 SUBURB_NAME
-            FROM SuburbTotals
-            ORDER BY total_evs DESC
-        )
-        SELECT 
-            s.SUBURB_NAME,
-            e.FUEL_TYPE,
-            SUM(e.TOTAL_EVs) as total_evs
-        FROM dbo.ev_fact e
-        JOIN dbo.suburb_dim s ON e.suburb_id = s.suburb_id
-        WHERE e.TOTAL_EVs IS NOT NULL 
-        AND e.TOTAL_EVs > 0
-        AND s.SUBURB_NAME IN (SELECT SUBURB_NAME FROM TopSuburbs)
-        AND e.FUEL_TYPE IN ('BEV', 'PHEV')
-        GROUP BY s.SUBURB_NAME, e.FUEL_TYPE
-        ORDER BY s.SUBURB_NAME, e.FUEL_TYPE
-        """
-        
-        df = execute_query(query)
-        result = dataframe_to_json_serializable(df)
-        
-        # Get top 10 suburbs by total EVs first
-        suburb_totals = {}
-        for row in result:
-            suburb = row['SUBURB_NAME']
-            count = int(row['total_evs'])
-            if suburb not in suburb_totals:
-                suburb_totals[suburb] = 0
-            suburb_totals[suburb] += count
-        
-        # Sort suburbs by total and take top 10
-        top_suburbs = sorted(suburb_totals.items(), key=lambda x: x[1], reverse=True)[:10]
-        top_suburb_names = [suburb[0] for suburb in top_suburbs]
-        
-        # Organize data by suburb and fuel type
-        suburbs = {}
-        for suburb_name in top_suburb_names:
-            suburbs[suburb_name] = {'BEV': 0, 'PHEV': 0}
+        # Top 10 suburbs by total EVs with BEV/PHEV pivoted in the same query
+        query, params = build_top_n_pivot_query(EV_DISTRIBUTION, n=10)
+        df = snapshot.query('ev_distribution', query, params=params, n=10)
         
-        for row in result:
-            suburb = row['SUBURB_NAME']
-            if suburb in suburbs:
-                fuel_type = row['FUEL_TYPE']
-                count = int(row['total_evs'])
-                suburbs[suburb][fuel_type] = count
-        
-        # Create the format expected by the component
-        labels = top_suburb_names
-        bev_data = [suburbs[suburb]['BEV'] for suburb in labels]
-        phev_data = [suburbs[suburb]['PHEV'] for suburb in labels]
-        
-        return jsonify({
-            "labels": labels,
-            "bev_data": bev_data,
-            "phev_data": phev_data
-        })
+        # {"labels": [...], "bev_data": [...], "phev_data": [...]}
+        return jsonify(series_payload(df, EV_DISTRIBUTION))
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 # Also add an endpoint to get EV summary by fuel type
 @app.route('/api/ev-summary-by-fuel')
+@cached_response()
 def ev_summary_by_fuel():
     """Get EV summary grouped by fuel type."""
     try:
-        from db_helper import dataframe_to_json_serializable
-        
-        query = """
-        SELECT 
-            e.FUEL_TYPE,
-            t.YEAR,
-            SUM(e.TOTAL_EVs) as total_evs,
-            AVG(e.AVG_RANGE_KM) as avg_range_km,
-            AVG(e.AVG_PRICE) as avg_price,
-            AVG(e.EV_ADOPTION_SCORE) as avg_adoption_score,
-            COUNT(*) as record_count,
-            COUNT(DISTINCT s.suburb_id) as suburb_count
-        FROM dbo.ev_fact e
-        JOIN dbo.suburb_dim s ON e.suburb_id = s.suburb_id
-        JOIN dbo.time_dim t ON e.time_id = t.time_id
-        WHERE e.TOTAL_EVs IS NOT NULL AND e.TOTAL_EVs > 0
-        GROUP BY e.FUEL_TYPE, t.YEAR
-        ORDER BY t.YEAR DESC, total_evs DESC
-        """
-        
-        df = execute_query(query)
-        result = dataframe_to_json_serializable(df)
-        
-        # Round float values
-        for row in result:
-            if row['total_evs']:
-                row['total_evs'] = round(row['total_evs'], 1)
-            if row['avg_range_km']:
-                row['avg_range_km'] = round(row['avg_range_km'], 1)
-            if row['avg_price']:
-                row['avg_price'] = round(row['avg_price'], 0)
-            if row['avg_adoption_score']:
-                row['avg_adoption_score'] = round(row['avg_adoption_score'], 2)
-        
+        result = semantic.query(
+            measures=[
+                'total_evs', 'avg_range_km', 'avg_price', 'avg_adoption_score',
+                measure('ev_records', 'record_count'),
+                measure('ev_suburb_count', 'suburb_count'),
+            ],
+            dimensions=['fuel', 'year'],
+            filters=[('ev_fact.TOTAL_EVs', '>', 0)],
+            order_by=['-year', '-total_evs'],
+        )
         return jsonify(result)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/environmental-impact')
+@cached_response()
 def environmental_impact():
     """Get environmental impact data showing relationship between energy and NO2."""
     try:
-        from db_helper import dataframe_to_json_serializable
-        
-        query = """
-        SELECT 
-            s.SUBURB_NAME,
-            t.YEAR,
-            AVG(e.ENERGY_CONSUMPTION) as avg_energy_consumption,
-            AVG(e.NO2_LEVEL) as avg_no2_level,
-            AVG(e.NO2_CHANGE_PCT) as avg_no2_change_pct,
-            AVG(e.EV_PER_ENERGY_UNIT) as avg_ev_per_energy_unit,
-            AVG(e.NO2_PER_EV) as avg_no2_per_ev
-        FROM dbo.energy_fact e
-        JOIN dbo.suburb_dim s ON e.suburb_id = s.suburb_id
-        JOIN dbo.time_dim t ON e.time_id = t.time_id
-        WHERE e.ENERGY_CONSUMPTION IS NOT NULL 
-        AND e.NO2_LEVEL IS NOT NULL
-        GROUP BY s.SUBURB_NAME, t.YEAR
-        ORDER BY t.YEAR, avg_energy_consumption DESC
-        """
-        
-        df = execute_query(query)
-        result = dataframe_to_json_serializable(df)
-        
-        # Round float values
-        for row in result:
-            for key in ['avg_energy_consumption', 'avg_no2_level', 'avg_no2_change_pct', 'avg_ev_per_energy_unit', 'avg_no2_per_ev']:
-                if row[key] is not None:
-                    row[key] = round(row[key], 4)
-        
+        result = semantic.query(
+            measures=[
+                measure('avg_energy', 'avg_energy_consumption', 4),
+                measure('avg_no2', 'avg_no2_level', 4),
+                measure('avg_no2_change_pct', decimals=4),
+                measure('avg_ev_per_energy_unit', decimals=4),
+                measure('avg_no2_per_ev', decimals=4),
+            ],
+            dimensions=['suburb', 'year'],
+            filters=[('energy_fact.ENERGY_CONSUMPTION', 'not_null', None), ('energy_fact.NO2_LEVEL', 'not_null', None)],
+            order_by=['year', '-avg_energy_consumption'],
+        )
         return jsonify(result)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
-    
+
 @app.route('/api/ev-efficiency-analysis', methods=['GET'])
+@cached_response()
 def ev_efficiency_analysis():
     """Analyze EV efficiency (EVs per energy unit) vs NO2 reduction."""
     try:
-        from db_helper import dataframe_to_json_serializable
-        
-        query = """
-        SELECT 
-            s.SUBURB_NAME,
-            t.YEAR,
-            AVG(en.EV_PER_ENERGY_UNIT) as EV_EFFICIENCY,
-            AVG(en.NO2_CHANGE_PCT) as NO2_REDUCTION_PCT,
-            AVG(en.ENERGY_CHANGE_PCT) as ENERGY_CHANGE_PCT,
-            AVG(en.NO2_PER_EV) as NO2_PER_EV
-        FROM dbo.energy_fact en
-        JOIN dbo.suburb_dim s ON en.suburb_id = s.suburb_id
-        JOIN dbo.time_dim t ON en.time_id = t.time_id
-        WHERE en.EV_PER_ENERGY_UNIT IS NOT NULL
-        AND en.NO2_CHANGE_PCT IS NOT NULL
-        GROUP BY s.SUBURB_NAME, t.YEAR
-        ORDER BY t.YEAR DESC, EV_EFFICIENCY DESC
-        """
-        
-        df = execute_query(query)
-        result = dataframe_to_json_serializable(df)
-        
-        # Round values for better display
-        for row in result:
-            if row['EV_EFFICIENCY']:
-                row['EV_EFFICIENCY'] = round(row['EV_EFFICIENCY'], 6)
-            if row['NO2_REDUCTION_PCT']:
-                row['NO2_REDUCTION_PCT'] = round(row['NO2_REDUCTION_PCT'], 2)
-            if row['ENERGY_CHANGE_PCT']:
-                row['ENERGY_CHANGE_PCT'] = round(row['ENERGY_CHANGE_PCT'], 2)
-            if row['NO2_PER_EV']:
-                row['NO2_PER_EV'] = round(row['NO2_PER_EV'], 3)
-        
+        result = semantic.query(
+            measures=[
+                measure('avg_ev_per_energy_unit', 'EV_EFFICIENCY', 6),
+                measure('avg_no2_change_pct', 'NO2_REDUCTION_PCT'),
+                measure('avg_energy_change_pct', 'ENERGY_CHANGE_PCT'),
+                measure('avg_no2_per_ev', 'NO2_PER_EV'),
+            ],
+            dimensions=['suburb', 'year'],
+            filters=[('energy_fact.EV_PER_ENERGY_UNIT', 'not_null', None), ('energy_fact.NO2_CHANGE_PCT', 'not_null', None)],
+            order_by=['-year', '-EV_EFFICIENCY'],
+        )
         return jsonify(result)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
-    
+
+def environmental_performance(no2_change_pct):
+    """Performance category for an average NO2 change percentage."""
+    no2_change = no2_change_pct or 0
+    if no2_change < -10:
+        return 'Excellent'
+    elif no2_change < 0:
+        return 'Good'
+    elif no2_change < 10:
+        return 'Moderate'
+    return 'Needs Improvement'
+
 @app.route('/api/energy-environmental-impact', methods=['GET'])
+@cached_response()
 def energy_environmental_impact():
     """Compare energy consumption changes with environmental impact."""
     try:
-        from db_helper import dataframe_to_json_serializable
-        
-        query = """
-        SELECT 
-            s.SUBURB_NAME,
-            AVG(en.ENERGY_CONSUMPTION) as AVG_ENERGY_CONSUMPTION,
-            AVG(en.ENERGY_CHANGE_PCT) as ENERGY_CHANGE_PCT,
-            AVG(en.NO2_LEVEL) as AVG_NO2_LEVEL,
-            AVG(en.NO2_CHANGE_PCT) as NO2_CHANGE_PCT,
-            AVG(en.EV_PER_ENERGY_UNIT) as EV_EFFICIENCY,
-            COUNT(*) as data_points
-        FROM dbo.energy_fact en
-        JOIN dbo.suburb_dim s ON en.suburb_id = s.suburb_id
-        JOIN dbo.time_dim t ON en.time_id = t.time_id
-        WHERE en.ENERGY_CONSUMPTION IS NOT NULL
-        AND en.NO2_LEVEL IS NOT NULL
-        GROUP BY s.SUBURB_NAME
-        HAVING COUNT(*) > 1  -- Ensure we have multiple data points
-        ORDER BY NO2_CHANGE_PCT ASC  -- Best NO2 improvement first
-        """
-        
-        df = execute_query(query)
-        result = dataframe_to_json_serializable(df)
+        result = semantic.query(
+            measures=[
+                measure('avg_energy', 'AVG_ENERGY_CONSUMPTION', 0),
+                measure('avg_energy_change_pct', 'ENERGY_CHANGE_PCT'),
+                measure('avg_no2', 'AVG_NO2_LEVEL'),
+                measure('avg_no2_change_pct', 'NO2_CHANGE_PCT'),
+                measure('avg_ev_per_energy_unit', 'EV_EFFICIENCY', 6),
+                measure('energy_records', 'data_points'),
+            ],
+            dimensions=['suburb'],
+            filters=[('energy_fact.ENERGY_CONSUMPTION', 'not_null', None), ('energy_fact.NO2_LEVEL', 'not_null', None)],
+            having=[('data_points', '>', 1)],  # Ensure we have multiple data points
+            order_by=['NO2_CHANGE_PCT'],  # Best NO2 improvement first
+        )
         
-        # Round values and add performance categories
+        # Add performance category
         for row in result:
-            if row['AVG_ENERGY_CONSUMPTION']:
-                row['AVG_ENERGY_CONSUMPTION'] = round(row['AVG_ENERGY_CONSUMPTION'], 0)
-            if row['ENERGY_CHANGE_PCT']:
-                row['ENERGY_CHANGE_PCT'] = round(row['ENERGY_CHANGE_PCT'], 2)
-            if row['AVG_NO2_LEVEL']:
-                row['AVG_NO2_LEVEL'] = round(row['AVG_NO2_LEVEL'], 2)
-            if row['NO2_CHANGE_PCT']:
-                row['NO2_CHANGE_PCT'] = round(row['NO2_CHANGE_PCT'], 2)
-            if row['EV_EFFICIENCY']:
-                row['EV_EFFICIENCY'] = round(row['EV_EFFICIENCY'], 6)
-            
-            # Add performance category
-            no2_change = row['NO2_CHANGE_PCT'] or 0
-            if no2_change < -10:
-                row['ENVIRONMENTAL_PERFORMANCE'] = 'Excellent'
-            elif no2_change < 0:
-                row['ENVIRONMENTAL_PERFORMANCE'] = 'Good'
-            elif no2_change < 10:
-                row['ENVIRONMENTAL_PERFORMANCE'] = 'Moderate'
-            else:
-                row['ENVIRONMENTAL_PERFORMANCE'] = 'Needs Improvement'
+            row['ENVIRONMENTAL_PERFORMANCE'] = environmental_performance(row['NO2_CHANGE_PCT'])
         
         return jsonify(result)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
-    
+
     ## BELOW IS EVERYTHING RELATED TO DEBUGGING THE TABLES, IF THINGS ARENT SHOWING CORRECTLY, USE THESE PATHS HELP DEBUG.
 
 # Secure table access with whitelist
@@ -689,28 +547,40 @@ def get_table(table_name):
         # Get query parameters - limit is optional now
         limit = request.args.get('limit', type=int)  # No default limit
         
-        # Check if table exists first
-        from db_helper import check_table_exists, get_table_row_count, dataframe_to_json_serializable
+        # Check if table exists first (metadata is cached per ETL load)
+        from db_helper import dataframe_to_json_serializable
+        import metadata_cache
         
-        if not check_table_exists(table_name):
+        if not metadata_cache.table_exists(table_name):
             return jsonify({
                 "error": f"Table dbo.{table_name} does not exist",
                 "hint": "Use /api/list-tables to see available tables"
             }), 404
         
-        # Get row count for info
-        row_count = get_table_row_count(table_name)
-        
-        # Get the data (entire table unless limit specified)
-        from db_helper import get_table_data
-        df = get_table_data(table_name, limit=limit)
+        # Get row count for info - approximate by default, ?count=exact to scan
+        from row_counts import get_row_count
+        try:
+            row_count, row_count_mode = get_row_count(table_name, request.args.get('count', 'approx'))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        
+        # Get the data (entire table unless limit specified), only the requested
+        # columns and rows: ?columns=a,b&order_by=-a&<col>=v&<col>__gte=v&<col>__in=v1,v2
+        from db_helper import get_table_data, parse_table_args
+        columns, filters, order_by = parse_table_args(request.args, reserved=('limit', 'count'))
+        try:
+            df = get_table_data(table_name, limit=limit, columns=columns, filters=filters, order_by=order_by,
+                                schema=metadata_cache.get_table_schema(table_name))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
         
         # Convert to JSON serializable format
-        result = dataframe_to_json_serializable(df)
+        result = dataframe_to_json_serializable(df, table_name)
         
         return jsonify({
             "table_name": f"dbo.{table_name}",
             "total_rows_in_table": row_count,
+            "row_count_mode": row_count_mode,
             "rows_returned": len(result),
             "limited": limit is not None,
             "data": result
@@ -723,16 +593,14 @@ def get_table(table_name):
 def list_tables():
     """List all available tables in the database."""
     try:
-        from db_helper import get_all_tables
-        all_tables = get_all_tables()
+        import metadata_cache
+        all_tables = metadata_cache.list_tables()
         
         # Filter to only show allowed tables
-        filtered_tables = []
-        if isinstance(all_tables, dict) and 'tables' in all_tables:
-            for table in all_tables['tables']:
-                table_name = table.get('table_name', '').replace('dbo.', '')
-                if table_name in ALLOWED_TABLES:
-                    filtered_tables.append(table)
+        filtered_tables = [
+            table for table in all_tables
+            if table['TABLE_SCHEMA'] == 'dbo' and table['TABLE_NAME'] in ALLOWED_TABLES
+        ]
         
         return jsonify({
             "schema": "dbo",
@@ -755,8 +623,8 @@ def check_table(table_name):
         }), 403
     
     try:
-        from db_helper import check_table_exists, get_table_row_count
-        exists = check_table_exists(table_name)
+        import metadata_cache
+        exists = metadata_cache.table_exists(table_name)
         
         response = {
             "table_name": f"dbo.{table_name}",
@@ -764,10 +632,13 @@ def check_table(table_name):
         }
         
         if exists:
+            from row_counts import get_row_count
             try:
-                response["row_count"] = get_table_row_count(table_name)
-            except:
-                response["row_count"] = "Unable to determine"
+                row_count, row_count_mode = get_row_count(table_name, request.args.get('count', 'approx'))
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+            response["row_count"] = row_count if row_count is not None else "Unable to determine"
+            response["row_count_mode"] = row_count_mode
         
         return jsonify(response)
     except Exception as e:
@@ -786,17 +657,22 @@ def table_info(table_name):
         }), 403
     
     try:
-        from db_helper import check_table_exists, get_table_schema, get_table_row_count
+        import metadata_cache
         
-        if not check_table_exists(table_name):
+        if not metadata_cache.table_exists(table_name):
             return jsonify({"error": f"Table dbo.{table_name} does not exist"}), 404
         
-        schema_data = get_table_schema(table_name)  # This now returns JSON serializable data
-        row_count = get_table_row_count(table_name)
+        from row_counts import get_row_count
+        schema_data = metadata_cache.get_table_schema(table_name)
+        try:
+            row_count, row_count_mode = get_row_count(table_name, request.args.get('count', 'approx'))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
         
         return jsonify({
             "table_name": f"dbo.{table_name}",
             "row_count": row_count,
+            "row_count_mode": row_count_mode,
             "columns": schema_data
         })
     except Exception as e:
@@ -814,14 +690,21 @@ def explore_table(table_name):
         }), 403
     
     try:
-        from db_helper import get_table_schema, get_table_data, dataframe_to_json_serializable
+        from db_helper import get_table_data, dataframe_to_json_serializable
+        import metadata_cache
         
         # Get schema
-        schema = get_table_schema(table_name)
-        
-        # Get sample data (first 5 rows)
-        sample_df = get_table_data(table_name, limit=5)
-        sample_data = dataframe_to_json_serializable(sample_df)
+        schema = metadata_cache.get_table_schema(table_name)
+        
+        # Get sample data (first 5 rows), optionally projected/filtered like /api/tables
+        from db_helper import parse_table_args
+        columns, filters, order_by = parse_table_args(request.args)
+        try:
+            sample_df = get_table_data(table_name, limit=5, columns=columns, filters=filters, order_by=order_by,
+                                       schema=schema)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        sample_data = dataframe_to_json_serializable(sample_df, table_name)
         
         return jsonify({
             "table_name": f"dbo.{table_name}",
@@ -836,12 +719,12 @@ def explore_table(table_name):
 def get_all_schemas():
     """Get schemas for all allowed tables."""
     try:
-        from db_helper import get_table_schema
+        import metadata_cache
         
         schemas = {}
         for table_name in ALLOWED_TABLES:
             try:
-                schemas[table_name] = get_table_schema(table_name)
+                schemas[table_name] = metadata_cache.get_table_schema(table_name)
             except Exception as e:
                 schemas[table_name] = {"error": str(e)}
         
@@ -854,9 +737,10 @@ def get_all_schemas():
 def custom_query():
     """Execute a custom query with security restrictions."""
     try:
-        from db_helper import dataframe_to_json_serializable
+        from db_helper import dataframe_to_json_serializable, convert_numpy_types, execute_limited, iter_query_batches, current_generation
         
         # Get query from either GET or POST
+        data = None
         if request.method == 'POST':
             data = request.get_json()
             query = data.get('query') if data else None
@@ -866,76 +750,204 @@ def custom_query():
         if not query:
             return jsonify({"error": "No query provided"}), 400
         
-        # Basic security checks
-        query_upper = query.upper().strip()
-        
-        # Only allow SELECT statements
-        if not query_upper.startswith('SELECT'):
-            return jsonify({"error": "Only SELECT statements are allowed"}), 400
-        
-        # Block dangerous keywords
-        dangerous_keywords = ['DROP', 'DELETE', 'INSERT', 'UPDATE', 'ALTER', 'CREATE', 'TRUNCATE', 'EXEC', 'EXECUTE']
-        for keyword in dangerous_keywords:
-            if keyword in query_upper:
-                return jsonify({"error": f"Keyword '{keyword}' is not allowed"}), 400
-        
-        # Ensure query only references allowed tables
-        query_words = re.findall(r'\b\w+\b', query_upper)
-        referenced_tables = set()
-        
-        # Look for table references after FROM and JOIN
-        for i, word in enumerate(query_words):
-            if word in ['FROM', 'JOIN'] and i + 1 < len(query_words):
-                next_word = query_words[i + 1]
-                if next_word.startswith('DBO.'):
-                    table_name = next_word[4:]  # Remove 'DBO.' prefix
-                else:
-                    table_name = next_word
-                referenced_tables.add(table_name.lower())
-        
-        # Check if all referenced tables are allowed
-        for table in referenced_tables:
-            if table not in {t.lower() for t in ALLOWED_TABLES}:
-                return jsonify({
-                    "error": f"Access to table '{table}' is not allowed",
-                    "allowed_tables": list(ALLOWED_TABLES)
-                }), 403
+        # Parse into an AST: a single SELECT over allowed tables only (CTEs and subqueries included)
+        parsed = sql_guard.parse_select(query, ALLOWED_TABLES)
         
-        # Execute the query
-        df = execute_query(query)
-        result = dataframe_to_json_serializable(df)
+        # Execute the query under the governor's limits
+        # remote_addr is the peer address, or the client address vouched for by
+        # TRUSTED_PROXY_HOPS proxies (ProxyFix); X-Forwarded-For alone is not trusted
+        client_id = request.remote_addr
+        max_rows = query_governor.row_limit(
+            (data or {}).get('max_rows') if request.method == 'POST' else request.args.get('max_rows')
+        )
+        stream = str((data or {}).get('stream') if request.method == 'POST' else request.args.get('stream', '')).lower() in ('1', 'true')
+        
+        # Repeated queries differing only in literals share the normalized text, so
+        # they share a server plan; identical ones are answered from the result cache
+        cache_key = (parsed.sql, tuple(parsed.params), max_rows)
+        generation = current_generation()
+        if not stream:
+            cached = sql_guard.cached_result(cache_key, generation)
+            if cached is not None:
+                response = jsonify({"query": query, **cached})
+                response.headers['X-Cache'] = 'HIT'
+                return response
+        
+        limits = ExitStack()
+        limits.enter_context(query_governor.client_slot(client_id))
+        try:
+            estimated_cost = query_governor.check_cost(parsed.sql, parsed.params)
+        except Exception:
+            limits.close()
+            raise
+        
+        if stream:
+            # NDJSON: one row object per line, then a summary line
+            def generate():
+                row_count, truncated = 0, False
+                for columns, rows, truncated in iter_query_batches(
+                        parsed.sql, parsed.params, max_rows=max_rows, timeout=query_governor.CUSTOM_QUERY_TIMEOUT):
+                    names = [name for name, _ in columns]
+                    for row in rows:
+                        yield json.dumps(dict(zip(names, map(convert_numpy_types, row))), default=str) + "\n"
+                    row_count += len(rows)
+                yield json.dumps({"row_count": row_count, "truncated": truncated, "max_rows": max_rows}) + "\n"
+            # The slot is already held; it is released when the server closes the
+            # response, whether or not the body was ever iterated
+            try:
+                response = Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+                response.call_on_close(limits.close)
+            except Exception:
+                limits.close()
+                raise
+            return response
+        
+        with limits:
+            df, truncated = execute_limited(
+                parsed.sql, parsed.params, max_rows=max_rows, timeout=query_governor.CUSTOM_QUERY_TIMEOUT
+            )
+        result = {
+            "normalized_query": parsed.sql,
+            "tables": sorted(parsed.tables),
+            "row_count": len(df),
+            "truncated": truncated,
+            "max_rows": max_rows,
+            "estimated_cost": estimated_cost,
+            "data": dataframe_to_json_serializable(df)
+        }
+        sql_guard.store_result(cache_key, generation, result)
         
-        return jsonify({
-            "query": query,
-            "row_count": len(result),
-            "data": result
-        })
+        return jsonify({"query": query, **result})
+    except (sql_guard.UnsafeQuery, query_governor.QueryRejected) as e:
+        return jsonify({"error": str(e), **e.details}), e.status
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+# Background jobs: large exports and heavy queries are written to disk off the request thread
+@app.route("/api/jobs", methods=['GET', 'POST'])
+def job_collection():
+    """List jobs, or submit one.
+
+    {"type": "export", "table": "energy_fact", "args": {"columns": "a,b", "YEAR": "2023"}, "format": "csv"}
+    {"type": "query", "query": "SELECT ...", "format": "parquet"}
+    """
+    if request.method == 'GET':
+        return jsonify({"jobs": [job.to_dict() for job in jobs.list_jobs()], **jobs.status()})
+    try:
+        data = request.get_json() or {}
+        fmt = data.get('format', 'parquet')
+        if data.get('type') == 'export':
+            import metadata_cache
+            from db_helper import build_table_query, parse_table_args
+            from row_counts import get_row_count
+            table_name = data.get('table')
+            if table_name not in ALLOWED_TABLES or not metadata_cache.table_exists(table_name):
+                return jsonify({"error": f"Access to table '{table_name}' is not allowed",
+                                "allowed_tables": list(ALLOWED_TABLES)}), 403
+            args = {key: str(value) for key, value in (data.get('args') or {}).items()}
+            limit = int(data['limit']) if data.get('limit') is not None else None
+            columns, filters, order_by = parse_table_args(args)
+            sql, params = build_table_query(table_name, metadata_cache.get_table_schema(table_name), limit=limit,
+                                            columns=columns, filters=filters, order_by=order_by)
+            # Expected rows for progress: the table's approximate count, capped by the limit
+            total_rows = None if filters else get_row_count(table_name)[0]
+            if limit is not None:
+                total_rows = min(limit, total_rows) if total_rows is not None else limit
+            job = jobs.submit('export', f"dbo.{table_name}", sql, params, fmt, total_rows=total_rows)
+        elif data.get('type') == 'query':
+            if not data.get('query'):
+                return jsonify({"error": "No query provided"}), 400
+            parsed = sql_guard.parse_select(data['query'], ALLOWED_TABLES)
+            query_governor.check_cost(parsed.sql, parsed.params)
+            job = jobs.submit('query', data['query'], parsed.sql, parsed.params, fmt)
+        else:
+            return jsonify({"error": "type must be 'export' or 'query'"}), 400
+        response = jsonify(job.to_dict())
+        response.status_code = 202
+        response.headers['Location'] = f"/api/jobs/{job.id}"
+        return response
+    except (sql_guard.UnsafeQuery, query_governor.QueryRejected) as e:
+        return jsonify({"error": str(e), **e.details}), e.status
+    except jobs.JobQueueFull as e:
+        return jsonify({"error": str(e)}), 429
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-# Health check endpoint
+@app.route("/api/jobs/<job_id>", methods=['GET', 'DELETE'])
+def job_detail(job_id):
+    """Job status and progress; DELETE cancels it or removes its result."""
+    job = jobs.cancel(job_id) if request.method == 'DELETE' else jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": f"Job '{job_id}' not found"}), 404
+    return jsonify(job.to_dict())
+
+@app.route("/api/jobs/<job_id>/download")
+def job_download(job_id):
+    """Download a finished job's result file."""
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": f"Job '{job_id}' not found"}), 404
+    if job.status == 'expired':
+        return jsonify({"error": "Job result has expired", **job.to_dict()}), 410
+    if job.status != 'succeeded':
+        return jsonify({"error": f"Job is {job.status}", **job.to_dict()}), 409
+    return send_file(job.path, mimetype=jobs.MIMETYPES[job.format], as_attachment=True,
+                     download_name=f"{job.kind}-{job.id}.{job.format}")
+
+# Liveness: no I/O and no service start-up, so frequent probes cost nothing
 @app.route("/api/health")
+@app.route("/api/live")
 def health_check():
-    """Health check endpoint."""
+    """Liveness check. Database and cache state are reported by /api/ready."""
+    return jsonify({**health.liveness(), "allowed_tables": list(ALLOWED_TABLES)})
+
+# Per-template query timings from the db_helper query layer
+@app.route("/api/query-stats")
+def query_stats():
+    """Get call counts and timings for every query template."""
     try:
-        # Test database connection
-        test_query = "SELECT 1 as test"
-        execute_query(test_query)
-        
+        from db_helper import get_query_stats, pool_status, single_flight_status
+        from compression import cache_status
+        from tracing import slow_queries
         return jsonify({
-            "status": "healthy",
-            "database": "connected",
-            "allowed_tables": list(ALLOWED_TABLES)
+            "pool": pool_status(),
+            "single_flight": single_flight_status(),
+            "ev_profile": ev_profile.status(),
+            "response_cache": cache_status(),
+            "custom_query": {**query_governor.status(), "result_cache": sql_guard.cache_status()},
+            "jobs": jobs.status(),
+            "circuit_breaker": resilience.db_breaker.status(),
+            "slow_queries": slow_queries(),
+            "templates": get_query_stats()
         })
     except Exception as e:
-        return jsonify({
-            "status": "unhealthy",
-            "database": "disconnected",
-            "error": str(e)
-        }), 500
+        return jsonify({"error": str(e)}), 500
+
+# Per-route request metrics for Prometheus-compatible scrapers
+@app.route("/metrics")
+def metrics_endpoint():
+    from tracing import render_metrics
+    return Response(render_metrics(), mimetype='application/openmetrics-text',
+                    headers={'Content-Type': 'application/openmetrics-text; version=1.0.0; charset=utf-8'})
+
+# Snapshot status and manual hot reload
+@app.route("/api/snapshot", methods=['GET', 'POST'])
+def snapshot_status():
+    """Get the in-memory snapshot status, or reload it with POST."""
+    try:
+        if request.method == 'POST':
+            if SERVING_MODE != "snapshot":
+                return jsonify({"error": "Snapshot serving mode is not enabled"}), 400
+            snapshot.load(ALLOWED_TABLES)
+        return jsonify({"serving_mode": SERVING_MODE, **snapshot.status()})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
 
 # Get available years for filtering
 @app.route("/api/available-years")
+@cached_response()
 def available_years():
     """Get all available years from the time dimension."""
     try:
@@ -948,7 +960,7 @@ def available_years():
         ORDER BY YEAR
         """
         
-        df = execute_query(query)
+        df = snapshot.query('available_years', query)
         result = dataframe_to_json_serializable(df)
         years = [row['YEAR'] for row in result]
         
@@ -961,21 +973,13 @@ def available_years():
 
 # Get available suburbs for filtering
 @app.route("/api/available-suburbs")
+@cached_response()
 def available_suburbs():
     """Get all available suburbs."""
     try:
-        from db_helper import dataframe_to_json_serializable
-        
-        query = """
-        SELECT DISTINCT SUBURB_NAME 
-        FROM dbo.suburb_dim 
-        WHERE SUBURB_NAME IS NOT NULL 
-        ORDER BY SUBURB_NAME
-        """
+        from suburb_index import get_index
         
-        df = execute_query(query)
-        result = dataframe_to_json_serializable(df)
-        suburbs = [row['SUBURB_NAME'] for row in result]
+        suburbs = get_index().suburb_names()
         
         return jsonify({
             "suburbs": suburbs,
@@ -984,6 +988,34 @@ def available_suburbs():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+# Suburb autocomplete backed by the in-memory suburb index
+@app.route("/api/suburbs/autocomplete")
+def suburb_autocomplete():
+    """Suggest suburbs by prefix, substring and fuzzy match."""
+    try:
+        from suburb_index import get_index
+        
+        q = request.args.get('q', '').strip()
+        limit = request.args.get('limit', 10, type=int)
+        fuzzy = request.args.get('fuzzy', 'true').lower() != 'false'
+        
+        if not q:
+            return jsonify({"query": q, "suggestions": []})
+        
+        return jsonify({
+            "query": q,
+            "suggestions": get_index().autocomplete(q, limit=limit, fuzzy=fuzzy)
+        })
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+# Readiness: 503 until the database answers and the first warm-up has primed the cache
+@app.route("/api/ready")
+def readiness_check():
+    from compression import cache_status
+    payload, ready = health.readiness(warmup.status(), cache_status(), snapshot.status())
+    return jsonify(payload), 200 if ready else 503
+
 # Error handlers
 @app.errorhandler(404)
 def not_found(error):
@@ -996,5 +1028,9 @@ def internal_error(error):
 # --- Run the App ---
 
 if __name__ == "__main__":
+    # The debug reloader re-runs this file in a child process that serves the
+    # requests; only that child (WERKZEUG_RUN_MAIN) starts the services
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        start_services()
     app.run(debug=True)
     print(f"Connection string: {conn_str}")
\ No newline at end of file
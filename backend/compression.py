@@ -0,0 +1,397 @@
+import gzip
+import os
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from functools import wraps
+from flask import current_app, request, Response
+
+from db_helper import current_generation
+import resilience
+
+# Optional codecs: brotli and zstd are used when installed, gzip always works
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Responses smaller than this are sent uncompressed
+COMPRESS_MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", "1024"))
+COMPRESS_LEVEL = int(os.getenv("COMPRESS_LEVEL", "6"))
+COMPRESSIBLE_MIMETYPES = {'application/json', 'application/x-ndjson', 'text/csv', 'text/plain', 'text/html'}
+
+# Preferred order when the client accepts several encodings equally
+_PREFERENCE = ['zstd', 'br', 'gzip']
+
+
+def available_encodings():
+    encodings = []
+    if zstandard is not None:
+        encodings.append('zstd')
+    if brotli is not None:
+        encodings.append('br')
+    encodings.append('gzip')
+    return encodings
+
+
+def compress(data, encoding):
+    if encoding == 'gzip':
+        return gzip.compress(data, compresslevel=COMPRESS_LEVEL)
+    if encoding == 'br':
+        return brotli.compress(data, quality=min(COMPRESS_LEVEL, 11))
+    if encoding == 'zstd':
+        return zstandard.ZstdCompressor(level=COMPRESS_LEVEL).compress(data)
+    raise ValueError(f"Unsupported encoding: {encoding}")
+
+
+def _stream_compressor(encoding):
+    """Return (compress_chunk, flush) callables for incremental compression."""
+    if encoding == 'gzip':
+        compressor = zlib.compressobj(COMPRESS_LEVEL, zlib.DEFLATED, 31)
+        return compressor.compress, compressor.flush
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=min(COMPRESS_LEVEL, 11))
+        return compressor.process, compressor.finish
+    if encoding == 'zstd':
+        compressor = zstandard.ZstdCompressor(level=COMPRESS_LEVEL).compressobj()
+        return compressor.compress, compressor.flush
+    raise ValueError(f"Unsupported encoding: {encoding}")
+
+
+def negotiate_encoding(accept_encoding):
+    """Pick the best supported encoding from an Accept-Encoding header, or None."""
+    if not accept_encoding:
+        return None
+    accepted = {}
+    for part in accept_encoding.split(','):
+        pieces = part.strip().split(';')
+        name = pieces[0].strip().lower()
+        q = 1.0
+        for param in pieces[1:]:
+            param = param.strip()
+            if param.startswith('q='):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        if name:
+            accepted[name] = q
+    best, best_q = None, 0.0
+    for encoding in available_encodings():
+        q = accepted.get(encoding, accepted.get('*', 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def _compress_stream(chunks, encoding):
+    compress_chunk, flush = _stream_compressor(encoding)
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode('utf-8')
+        data = compress_chunk(chunk)
+        if data:
+            yield data
+    yield flush()
+
+
+def compress_response(response):
+    """after_request hook: compress eligible responses for the negotiated encoding."""
+    # File downloads (send_file) and range responses are passed through as-is:
+    # re-encoding them would make Content-Range describe the wrong bytes
+    if (response.status_code < 200 or response.status_code >= 300 or response.status_code == 206
+            or response.direct_passthrough
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = negotiate_encoding(request.headers.get('Accept-Encoding', ''))
+    if encoding is None:
+        return response
+
+    if response.is_streamed:
+        response.response = _compress_stream(response.response, encoding)
+        response.headers.pop('Content-Length', None)
+        response.headers['Content-Encoding'] = encoding
+        return response
+
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_SIZE:
+        return response
+    response.set_data(compress(data, encoding))
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+
+def init_compression(app):
+    app.after_request(compress_response)
+
+
+class CachedPayload:
+    """A response body stored with its pre-compressed variants."""
+
+    def __init__(self, body, mimetype, generation, lifetime=None):
+        self.body = body
+        self.mimetype = mimetype
+        self.generation = generation
+        self.lifetime = lifetime      # seconds the entry may be served at all (TTL plus staleness)
+        self.created_at = time.monotonic()
+        self.encoded = {}
+        if len(body) >= COMPRESS_MIN_SIZE:
+            for encoding in available_encodings():
+                self.encoded[encoding] = compress(body, encoding)
+        self.size = len(body) + sum(len(data) for data in self.encoded.values())
+
+    def expired(self, generation):
+        """Whether the entry can no longer be served: from an older load and past its lifetime."""
+        return (self.generation != generation and self.lifetime is not None
+                and time.monotonic() - self.created_at >= self.lifetime)
+
+    def to_response(self, encoding):
+        body = self.encoded.get(encoding) if encoding else None
+        response = Response(body if body is not None else self.body, mimetype=self.mimetype)
+        if body is not None:
+            response.headers['Content-Encoding'] = encoding
+        response.vary.add('Accept-Encoding')
+        response.headers['X-Cache'] = 'HIT'
+        return response
+
+
+# Bounded LRU keyed on path and query args. Entries from an older load
+# generation are dropped once they are past their staleness window.
+#
+#   RESPONSE_CACHE_TTL         - seconds a response is fresh
+#   RESPONSE_CACHE_MAX_ENTRIES - most responses kept
+#   RESPONSE_CACHE_MAX_BYTES   - most bytes kept, counting the compressed copies
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+_cache_bytes = 0
+RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", "300"))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "512"))
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+# WSGI environ key that makes a request skip the cache and refresh it. Only
+# in-process callers (warm-up) can set it; HTTP clients cannot.
+REVALIDATE_ENVIRON_KEY = 'backend.cache.revalidate'
+# While the database circuit breaker is open, answer failed requests with the
+# last good response still cached (any age or generation) instead of an error
+SERVE_STALE_WHEN_OPEN = os.getenv("SERVE_STALE_WHEN_OPEN", "true").lower() in ("1", "true", "yes")
+
+# Stale-while-revalidate: once an entry is older than its TTL (or from an older
+# load generation) it is still served for up to RESPONSE_CACHE_STALE more
+# seconds while one background refresh replaces it. Misses for the same key are
+# coalesced: one request runs the view, the others wait for its result.
+#
+#   RESPONSE_CACHE_STALE        - default staleness bound in seconds (0 disables)
+#   RESPONSE_CACHE_STALE_ROUTES - per-route overrides, e.g. "/api/dashboard-data=60,/api/ev-trends=900"
+#   RESPONSE_CACHE_WAIT         - seconds a coalesced miss waits before running the view itself
+RESPONSE_CACHE_STALE = int(os.getenv("RESPONSE_CACHE_STALE", "300"))
+RESPONSE_CACHE_STALE_ROUTES = {
+    path.strip(): int(seconds)
+    for path, seconds in (part.split('=', 1) for part in os.getenv("RESPONSE_CACHE_STALE_ROUTES", "").split(',')
+                          if '=' in part)
+}
+RESPONSE_CACHE_WAIT = float(os.getenv("RESPONSE_CACHE_WAIT", "30"))
+
+_inflight = {}   # key -> threading.Event, set when the running refresh finishes
+_stats = {"fresh": 0, "stale": 0, "misses": 0, "coalesced": 0, "refreshes": 0, "refresh_errors": 0,
+          "evicted": 0}
+
+
+def _cache_key():
+    return (request.path, tuple(sorted(request.args.items(multi=True))))
+
+
+def _count(name):
+    with _cache_lock:
+        _stats[name] += 1
+
+
+def _claim(key):
+    """(event, leader) for a key. Only the leader computes; it must call _release."""
+    with _cache_lock:
+        event = _inflight.get(key)
+        if event is not None:
+            return event, False
+        event = _inflight[key] = threading.Event()
+        return event, True
+
+
+def _release(key, event):
+    with _cache_lock:
+        _inflight.pop(key, None)
+    event.set()
+
+
+def _lookup(key):
+    with _cache_lock:
+        entry = _cache.get(key)
+        if entry is not None:
+            _cache.move_to_end(key)
+        return entry
+
+
+def _evict(key):
+    """Remove a key; the caller holds _cache_lock."""
+    global _cache_bytes
+    entry = _cache.pop(key)
+    _cache_bytes -= entry.size
+    _stats["evicted"] += 1
+
+
+def _insert(key, entry):
+    global _cache_bytes
+    with _cache_lock:
+        if key in _cache:
+            _cache_bytes -= _cache.pop(key).size
+        if entry.size > RESPONSE_CACHE_MAX_BYTES:
+            return False
+        _cache[key] = entry
+        _cache_bytes += entry.size
+        for old_key in [k for k, e in _cache.items() if e.expired(entry.generation)]:
+            _evict(old_key)
+        while len(_cache) > RESPONSE_CACHE_MAX_ENTRIES or _cache_bytes > RESPONSE_CACHE_MAX_BYTES:
+            _evict(next(iter(_cache)))
+    return True
+
+
+def _store(key, rv, generation, lifetime=None):
+    """Cache a view's return value if it is a complete 200 response. Returns whether it was."""
+    response = _as_response(rv)
+    if response is None or response.status_code != 200 or response.is_streamed:
+        return False
+    return _insert(key, CachedPayload(response.get_data(), response.mimetype, generation, lifetime))
+
+
+def _refresh_in_background(view, args, kwargs, key, generation, lifetime):
+    """Re-run a view outside the request, unless a refresh for the key is already running."""
+    event, leader = _claim(key)
+    if not leader:
+        return
+    app = current_app._get_current_object()
+    path, query_string = request.path, request.query_string
+
+    def run():
+        try:
+            with app.test_request_context(path, query_string=query_string):
+                stored = _store(key, view(*args, **kwargs), generation, lifetime)
+        except Exception as e:
+            print(f"Background refresh of {path} failed: {e}")
+            stored = False
+        finally:
+            _release(key, event)
+        _count("refreshes" if stored else "refresh_errors")
+
+    threading.Thread(target=run, name='cache-refresh', daemon=True).start()
+
+
+def cached_response(ttl=None, stale=None):
+    """Cache a route's successful JSON response, pre-compressed, per ETL load generation.
+
+    ttl is how long a response is fresh; stale is how much longer it may be
+    served while a background refresh runs (RESPONSE_CACHE_STALE_ROUTES wins
+    over both the argument and RESPONSE_CACHE_STALE). A request with
+    REVALIDATE_ENVIRON_KEY set in its WSGI environ skips the cache and refreshes it.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            max_age = RESPONSE_CACHE_TTL if ttl is None else ttl
+            max_stale = RESPONSE_CACHE_STALE_ROUTES.get(
+                request.path, RESPONSE_CACHE_STALE if stale is None else stale)
+            key = _cache_key()
+            generation = current_generation()
+            encoding = negotiate_encoding(request.headers.get('Accept-Encoding', ''))
+            revalidate = bool(request.environ.get(REVALIDATE_ENVIRON_KEY))
+            lifetime = max_age + max_stale
+            entry = _lookup(key)
+            if entry is not None and not revalidate:
+                age = time.monotonic() - entry.created_at
+                if entry.generation == generation and age < max_age:
+                    _count("fresh")
+                    return entry.to_response(encoding)
+                if age < lifetime:
+                    _count("stale")
+                    _refresh_in_background(view, args, kwargs, key, generation, lifetime)
+                    response = entry.to_response(encoding)
+                    response.headers['X-Cache'] = 'STALE'
+                    response.headers['Age'] = str(int(age))
+                    return response
+
+            event, leader = _claim(key)
+            if not leader:
+                # Another request (or a background refresh) is computing this key
+                _count("coalesced")
+                event.wait(RESPONSE_CACHE_WAIT)
+                fresh = _lookup(key)
+                if fresh is not None and fresh is not entry and fresh.generation == generation:
+                    return fresh.to_response(encoding)
+            _count("misses")
+            try:
+                try:
+                    rv = view(*args, **kwargs)
+                except Exception:
+                    if _can_serve_stale(entry):
+                        return _stale_response(entry)
+                    raise
+                response = _as_response(rv)
+                if response is not None and response.status_code >= 500 and _can_serve_stale(entry):
+                    return _stale_response(entry)
+                _store(key, rv, generation, lifetime)
+                return rv
+            finally:
+                if leader:
+                    _release(key, event)
+        return wrapper
+    return decorator
+
+
+def _can_serve_stale(entry):
+    return entry is not None and SERVE_STALE_WHEN_OPEN and resilience.db_breaker.is_open()
+
+
+def _stale_response(entry):
+    response = entry.to_response(negotiate_encoding(request.headers.get('Accept-Encoding', '')))
+    response.headers['X-Cache'] = 'STALE'
+    response.headers['Warning'] = '110 - "Response is stale: database unavailable"'
+    return response
+
+
+def _as_response(rv):
+    """The Response in a view's return value, including (response, status) tuples."""
+    if isinstance(rv, Response):
+        return rv
+    if isinstance(rv, tuple) and rv and isinstance(rv[0], Response):
+        response = rv[0]
+        if len(rv) > 1 and isinstance(rv[1], int):
+            response.status_code = rv[1]
+        return response
+    return None
+
+
+def clear_cache():
+    global _cache_bytes
+    with _cache_lock:
+        _cache.clear()
+        _cache_bytes = 0
+
+
+def cache_status():
+    with _cache_lock:
+        return {
+            "entries": len(_cache),
+            "bytes": _cache_bytes,
+            "max_entries": RESPONSE_CACHE_MAX_ENTRIES,
+            "max_bytes": RESPONSE_CACHE_MAX_BYTES,
+            "encodings": available_encodings(),
+            "ttl_seconds": RESPONSE_CACHE_TTL,
+            "stale_seconds": RESPONSE_CACHE_STALE,
+            "stale_routes": RESPONSE_CACHE_STALE_ROUTES,
+            "refreshing": len(_inflight),
+            **_stats
+        }
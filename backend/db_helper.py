@@ -1,35 +1,388 @@
-import pyodbc
 import os
+import sys
+import queue
+import re
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from decimal import Decimal
 import pandas as pd
 import numpy as np
 from dotenv import load_dotenv
 
+# The typed schema registry is shared with the ETL in the repository root
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from utils.schema_registry import apply_dtypes
+import resilience
+
 # Load environment variables
 load_dotenv()
 
 # Connection string
 conn_str = os.getenv("AZURE_SQL_CONNECTIONSTRING")
 
+# Idle connections kept for reuse, and prepared statements cached per connection
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+STATEMENT_CACHE_SIZE = int(os.getenv("STATEMENT_CACHE_SIZE", "64"))
+
 def get_db_connection():
-    """Create and return a connection to the database."""
+    """Create and return a connection to the database (login timeout DB_CONNECT_TIMEOUT)."""
     try:
-        conn = pyodbc.connect(conn_str)
+        conn = resilience.connect(conn_str)
         return conn
     except Exception as e:
         print(f"Error connecting to database: {e}")
         raise
 
+class PooledConnection:
+    """A database connection plus the prepared statements cached on it."""
+
+    def __init__(self, conn):
+        # Reads only: autocommit avoids holding an open transaction while idle in the pool
+        conn.autocommit = True
+        # Applies to every cursor opened on this connection
+        conn.timeout = resilience.DB_QUERY_TIMEOUT
+        self.conn = conn
+        self.statements = OrderedDict()
+
+    def cursor_for(self, template):
+        """Get the cursor holding the prepared statement for a query template.
+
+        pyodbc skips SQLPrepare when a cursor re-executes the same SQL text, so
+        keeping one cursor per template reuses the prepared statement (and the
+        server-side plan) across requests.
+        """
+        cursor = self.statements.pop(template, None)
+        if cursor is None:
+            cursor = self.conn.cursor()
+            if len(self.statements) >= STATEMENT_CACHE_SIZE:
+                _, evicted = self.statements.popitem(last=False)
+                evicted.close()
+        self.statements[template] = cursor
+        return cursor
+
+    def close(self):
+        try:
+            self.conn.close()
+        except Exception:
+            pass
+
+_pool = queue.LifoQueue()
+
+@contextmanager
+def pooled_connection():
+    """Borrow a connection from the pool. Broken connections are discarded."""
+    try:
+        pooled = _pool.get_nowait()
+    except queue.Empty:
+        pooled = PooledConnection(get_db_connection())
+    healthy = False
+    try:
+        yield pooled
+        healthy = True
+    finally:
+        if healthy and _pool.qsize() < DB_POOL_SIZE:
+            _pool.put(pooled)
+        else:
+            pooled.close()
+
+def pool_status():
+    return {"idle_connections": _pool.qsize(), "max_idle": DB_POOL_SIZE}
+
+def probe(timeout):
+    """Health probe: (latency_ms, generation_id, loaded_at) from one pooled connection.
+
+    Runs once with a short query timeout and bypasses retries and the circuit
+    breaker, so it reports the database as it is and its failures never open
+    the breaker. generation_id and loaded_at are None when no load is recorded.
+    """
+    with pooled_connection() as pooled, _timed_cursor(pooled, timeout) as cursor:
+        start = time.perf_counter()
+        cursor.execute("SELECT 1")
+        cursor.fetchone()
+        latency_ms = (time.perf_counter() - start) * 1000
+        try:
+            cursor.execute(
+                "SELECT TOP (1) generation_id, loaded_at FROM dbo.etl_load_generation ORDER BY generation_id DESC"
+            )
+            row = cursor.fetchone()
+        except Exception as e:
+            print(f"Error getting ETL load info: {e}")
+            row = None
+    if row is None:
+        return latency_ms, None, None
+    return latency_ms, int(row[0]), row[1]
+
+def prefill_pool(size=None):
+    """Open connections until the pool holds `size` idle ones (default DB_POOL_SIZE)."""
+    target = min(size or DB_POOL_SIZE, DB_POOL_SIZE)
+    opened = 0
+    while _pool.qsize() < target:
+        _pool.put(PooledConnection(get_db_connection()))
+        opened += 1
+    return opened
+
+_query_stats = {}
+_query_stats_lock = threading.Lock()
+
+def normalize_template(query):
+    """Whitespace-collapsed query text, used to key statistics and cached cursors.
+
+    Only a key: queries are always executed as written, since collapsing
+    newlines would let a -- comment swallow the rest of the statement and
+    would change whitespace inside string literals.
+    """
+    return " ".join(query.split())
+
+# Callbacks notified of every query and serialization, e.g. for request tracing:
+#   hook('query', template=..., params=..., elapsed_ms=..., rows=...)
+#   hook('serialize', elapsed_ms=..., rows=...)
+_trace_hooks = []
+
+def add_trace_hook(hook):
+    _trace_hooks.append(hook)
+
+def _notify(event, **fields):
+    for hook in _trace_hooks:
+        try:
+            hook(event, **fields)
+        except Exception as e:
+            print(f"Error in trace hook: {e}")
+
+def _record_timing(template, elapsed_ms, rows, params=None):
+    _notify('query', template=template, params=params, elapsed_ms=elapsed_ms, rows=rows)
+    with _query_stats_lock:
+        stats = _query_stats.setdefault(template, {"calls": 0, "total_ms": 0.0, "max_ms": 0.0, "rows": 0})
+        stats["calls"] += 1
+        stats["total_ms"] += elapsed_ms
+        stats["max_ms"] = max(stats["max_ms"], elapsed_ms)
+        stats["rows"] += rows
+
+def get_query_stats():
+    """Get per-template call counts and timings, slowest total first."""
+    with _query_stats_lock:
+        stats = [
+            {"template": template, **values, "avg_ms": round(values["total_ms"] / values["calls"], 2)}
+            for template, values in _query_stats.items()
+        ]
+    for entry in stats:
+        entry["total_ms"] = round(entry["total_ms"], 2)
+        entry["max_ms"] = round(entry["max_ms"], 2)
+    return sorted(stats, key=lambda entry: entry["total_ms"], reverse=True)
+
+# Single-flight: identical queries (same SQL text and parameters) running at the
+# same time share one execution. The first caller runs it; callers arriving
+# while it is in flight wait and get a copy of its result (or its error).
+SINGLE_FLIGHT = os.getenv("SINGLE_FLIGHT", "true").lower() in ("1", "true", "yes")
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+_flights = {}
+_flights_lock = threading.Lock()
+_flight_stats = {"executed": 0, "coalesced": 0, "max_waiters": 0}
+
+def _flight_key(query, params):
+    key = (query, tuple(params or ()))
+    try:
+        hash(key)
+    except TypeError:
+        return None
+    return key
+
+def _private_copy(result):
+    return result.copy() if isinstance(result, pd.DataFrame) else result
+
+def single_flight(key, run):
+    """Return run(), sharing one execution between concurrent callers with the same key.
+
+    The shared DataFrame is never handed out while followers may still read
+    it: every follower gets its own copy, and so does the leader when it had
+    followers, so callers cannot modify each other's data.
+    """
+    if not SINGLE_FLIGHT or key is None:
+        return run()
+    with _flights_lock:
+        flight = _flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _flights[key] = _Flight()
+            _flight_stats["executed"] += 1
+        else:
+            flight.waiters += 1
+            _flight_stats["coalesced"] += 1
+            _flight_stats["max_waiters"] = max(_flight_stats["max_waiters"], flight.waiters)
+    if not leader:
+        flight.done.wait()
+        if flight.error is not None:
+            raise flight.error
+        return _private_copy(flight.result)
+    try:
+        flight.result = run()
+    except Exception as e:
+        flight.error = e
+        raise
+    finally:
+        with _flights_lock:
+            _flights.pop(key, None)
+            # No follower can join once the flight is removed, so this count is final
+            shared = flight.waiters > 0
+        flight.done.set()
+    return _private_copy(flight.result) if shared else flight.result
+
+def single_flight_status():
+    with _flights_lock:
+        return {"enabled": SINGLE_FLIGHT, "in_flight": len(_flights), **_flight_stats}
+
 def execute_query(query, params=None):
-    """Execute a query and return the results as a pandas DataFrame."""
+    """Execute a parameterized query and return the results as a pandas DataFrame.
+
+    Values must be passed through `params` using `?` placeholders, never
+    interpolated into the query text, so each template compiles a single plan.
+    Concurrent calls with the same query text and parameters share one execution.
+    """
+    template = normalize_template(query)
+
+    def run():
+        with pooled_connection() as pooled:
+            cursor = pooled.cursor_for(template)
+            start = time.perf_counter()
+            cursor.execute(query, list(params or []))
+            rows = cursor.fetchall() if cursor.description else []
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            columns = [column[0] for column in cursor.description] if cursor.description else []
+        return rows, columns, elapsed_ms
+
+    def execute():
+        # Transient failures are retried with backoff; an open breaker fails fast
+        rows, columns, elapsed_ms = resilience.call(run)
+        _record_timing(template, elapsed_ms, len(rows), params)
+        return pd.DataFrame.from_records([tuple(row) for row in rows], columns=columns)
+
     try:
-        conn = get_db_connection()
-        df = pd.read_sql(query, conn, params=params)
-        conn.close()
-        return df
+        return single_flight(_flight_key(query, params), execute)
     except Exception as e:
         print(f"Error executing query: {e}")
         raise
 
+@contextmanager
+def _timed_cursor(pooled, timeout):
+    """A one-off cursor with an ODBC query timeout (seconds, 0 for none, None for the default).
+
+    pyodbc applies Connection.timeout to cursors as they are created, so the
+    timeout is set for this cursor only and the pooled connection is left as it was.
+    """
+    previous = pooled.conn.timeout
+    pooled.conn.timeout = int(timeout) if timeout is not None else previous
+    try:
+        cursor = pooled.conn.cursor()
+    finally:
+        pooled.conn.timeout = previous
+    try:
+        yield cursor
+    finally:
+        cursor.close()
+
+def execute_limited(query, params=None, max_rows=None, timeout=None):
+    """Execute a query returning at most `max_rows` rows.
+
+    Returns (DataFrame, truncated). Rows past the cap are never fetched; the
+    statement is cancelled instead.
+    """
+    template = normalize_template(query)
+
+    def run():
+        with pooled_connection() as pooled, _timed_cursor(pooled, timeout) as cursor:
+            start = time.perf_counter()
+            cursor.execute(query, list(params or []))
+            truncated = False
+            if not cursor.description:
+                rows = []
+            elif max_rows is None:
+                rows = cursor.fetchall()
+            else:
+                rows = cursor.fetchmany(max_rows + 1)
+                truncated = len(rows) > max_rows
+                if truncated:
+                    rows = rows[:max_rows]
+                    cursor.cancel()
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            columns = [column[0] for column in cursor.description] if cursor.description else []
+        return rows, columns, truncated, elapsed_ms
+
+    # Governed (ad-hoc) queries are not retried: a timeout would cost the timeout again
+    rows, columns, truncated, elapsed_ms = resilience.call(run, retries=0)
+    _record_timing(template, elapsed_ms, len(rows), params)
+    return pd.DataFrame.from_records([tuple(row) for row in rows], columns=columns), truncated
+
+def iter_query_batches(query, params=None, max_rows=None, timeout=None, batch_size=1000):
+    """Yield (columns, rows, truncated) batches of a query, holding one pooled connection throughout.
+
+    columns is a list of (name, Python type) pairs from the cursor description.
+    At most `max_rows` rows are yielded. If more were available, a last empty
+    batch with truncated=True follows and the statement is cancelled.
+    Not retried (rows may already have been sent), but gated by the circuit breaker.
+    """
+    template = normalize_template(query)
+    if not resilience.db_breaker.allow():
+        raise resilience.CircuitOpenError("Database circuit breaker is open; failing fast")
+    start = time.perf_counter()
+    sent = 0
+    try:
+        with pooled_connection() as pooled, _timed_cursor(pooled, timeout) as cursor:
+            try:
+                cursor.execute(query, list(params or []))
+            except Exception as e:
+                if resilience.is_transient(e):
+                    resilience.db_breaker.record_failure()
+                else:
+                    resilience.db_breaker.release_trial()
+                raise
+            resilience.db_breaker.record_success()
+            if not cursor.description:
+                return
+            columns = [(column[0], column[1]) for column in cursor.description]
+            while max_rows is None or sent < max_rows:
+                size = batch_size if max_rows is None else min(batch_size, max_rows - sent)
+                rows = cursor.fetchmany(size)
+                if not rows:
+                    return
+                sent += len(rows)
+                yield columns, [tuple(row) for row in rows], False
+            if cursor.fetchone() is not None:
+                cursor.cancel()
+                yield columns, [], True
+    finally:
+        # Includes time spent by the consumer between batches
+        _record_timing(template, (time.perf_counter() - start) * 1000, sent, params)
+
+def estimate_query_cost(query, params=None):
+    """Estimated subtree cost of a query from its showplan, without running it.
+
+    Returns the cost of the first statement in the plan, or None if it has none.
+    """
+    def run():
+        with pooled_connection() as pooled:
+            cursor = pooled.conn.cursor()
+            try:
+                cursor.execute("SET SHOWPLAN_XML ON")
+                try:
+                    cursor.execute(query, list(params or []))
+                    return cursor.fetchone()[0]
+                finally:
+                    cursor.execute("SET SHOWPLAN_XML OFF")
+            finally:
+                cursor.close()
+
+    plan = resilience.call(run, retries=0)
+    match = re.search(r'StatementSubTreeCost="([0-9.Ee+-]+)"', plan or '')
+    return float(match.group(1)) if match else None
+
 def convert_numpy_types(obj):
     """Convert numpy types to native Python types for JSON serialization."""
     if isinstance(obj, np.integer):
@@ -40,12 +393,21 @@ def convert_numpy_types(obj):
         return bool(obj)
     elif isinstance(obj, np.ndarray):
         return obj.tolist()
+    elif isinstance(obj, Decimal):
+        return float(obj)
     elif pd.isna(obj):
         return None
     return obj
 
-def dataframe_to_json_serializable(df):
-    """Convert DataFrame to JSON serializable format."""
+def dataframe_to_json_serializable(df, table_name=None):
+    """Convert DataFrame to JSON serializable format.
+
+    When `table_name` is in the schema registry, columns are first cast to
+    their registry dtypes (DECIMAL values become floats, keys become ints).
+    """
+    start = time.perf_counter()
+    if table_name is not None:
+        df = apply_dtypes(table_name, df)
     # Replace NaN values with None
     df = df.where(pd.notnull(df), None)
     
@@ -57,24 +419,128 @@ def dataframe_to_json_serializable(df):
         for key, value in record.items():
             record[key] = convert_numpy_types(value)
     
+    _notify('serialize', elapsed_ms=(time.perf_counter() - start) * 1000, rows=len(records))
     return records
 
-def get_table_data(table_name, limit=None, columns=None, where_clause=None):
-    """Get data from a specific table. Loads entire table by default."""
-    try:
-        # Build the query
-        cols = "*" if not columns else ", ".join(columns)
-        
-        # Only add TOP clause if limit is specified
-        limit_clause = f"TOP {limit}" if limit else ""
-        where_str = f"WHERE {where_clause}" if where_clause else ""
-        
-        # Keep the dbo. schema prefix as it worked before
-        query = f"SELECT {limit_clause} {cols} FROM dbo.{table_name} {where_str}".strip()
-        
-        print(f"Executing query: {query}")  # Debug print to see the actual query
-        
-        return execute_query(query)
+# Filter operators accepted by get_table_data, e.g. {"YEAR": {"gte": 2022}}
+FILTER_OPERATORS = {
+    'eq': '=',
+    'ne': '<>',
+    'gt': '>',
+    'gte': '>=',
+    'lt': '<',
+    'lte': '<=',
+    'in': 'IN',
+}
+
+_INT_TYPES = {'tinyint', 'smallint', 'int', 'bigint'}
+_FLOAT_TYPES = {'real', 'float', 'decimal', 'numeric', 'money', 'smallmoney'}
+
+def _coerce_value(value, data_type, column):
+    """Convert a filter value to the Python type matching the column's SQL type."""
+    try:
+        if data_type in _INT_TYPES:
+            return int(value)
+        if data_type in _FLOAT_TYPES:
+            return float(value)
+        if data_type == 'bit':
+            if isinstance(value, str):
+                return value.strip().lower() in ('1', 'true', 'yes')
+            return bool(value)
+        return str(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid value {value!r} for column '{column}' ({data_type})")
+
+def build_table_query(table_name, schema, limit=None, columns=None, filters=None, order_by=None):
+    """Compile a validated, parameterized SELECT for one table.
+
+    schema:   rows from get_table_schema, used to validate every column name
+    columns:  list of columns to project (default: all)
+    filters:  {column: value} for equality, or {column: {op: value}} with ops
+              from FILTER_OPERATORS; 'in' takes a list
+    order_by: list of columns, prefix with '-' for descending
+    Returns (query, params). Raises ValueError for unknown columns or operators.
+    """
+    types = {row['COLUMN_NAME'].lower(): (row['COLUMN_NAME'], row['DATA_TYPE'].lower()) for row in schema}
+    if not types:
+        raise ValueError(f"Table dbo.{table_name} has no columns or does not exist")
+
+    def resolve(column):
+        if column.lower() not in types:
+            raise ValueError(f"Unknown column '{column}' for table {table_name}")
+        return types[column.lower()]
+
+    params = []
+    if limit is not None:
+        if int(limit) < 0:
+            raise ValueError("limit must not be negative")
+        limit_clause = "TOP (?) "
+        params.append(int(limit))
+    else:
+        limit_clause = ""
+
+    cols = ", ".join(f"[{resolve(c)[0]}]" for c in columns) if columns else "*"
+
+    where = []
+    for column, condition in (filters or {}).items():
+        name, data_type = resolve(column)
+        if not isinstance(condition, dict):
+            condition = {'eq': condition}
+        for op, value in condition.items():
+            if op not in FILTER_OPERATORS:
+                raise ValueError(f"Unknown filter operator '{op}'")
+            if op == 'in':
+                values = list(value) if isinstance(value, (list, tuple, set)) else [value]
+                if not values:
+                    raise ValueError(f"Empty IN filter for column '{column}'")
+                where.append(f"[{name}] IN ({', '.join('?' for _ in values)})")
+                params.extend(_coerce_value(v, data_type, name) for v in values)
+            else:
+                where.append(f"[{name}] {FILTER_OPERATORS[op]} ?")
+                params.append(_coerce_value(value, data_type, name))
+    where_str = f" WHERE {' AND '.join(where)}" if where else ""
+
+    order = []
+    for column in order_by or []:
+        descending = column.startswith('-')
+        name, _ = resolve(column.lstrip('-'))
+        order.append(f"[{name}] {'DESC' if descending else 'ASC'}")
+    order_str = f" ORDER BY {', '.join(order)}" if order else ""
+
+    query = f"SELECT {limit_clause}{cols} FROM dbo.[{table_name}]{where_str}{order_str}"
+    return query, params
+
+def parse_table_args(args, reserved=('limit',)):
+    """Parse request args into (columns, filters, order_by) for get_table_data.
+
+    ?columns=a,b  ?order_by=-YEAR,SUBURB_NAME  ?YEAR=2023  ?suburb_id__in=1,2  ?NO2_LEVEL__gte=1.5
+    """
+    columns = [c.strip() for c in args.get('columns', '').split(',') if c.strip()] or None
+    order_by = [c.strip() for c in args.get('order_by', '').split(',') if c.strip()] or None
+    filters = {}
+    for key, value in args.items():
+        if key in ('columns', 'order_by') or key in reserved:
+            continue
+        column, _, op = key.partition('__')
+        op = op or 'eq'
+        if op == 'in':
+            value = [v.strip() for v in value.split(',') if v.strip()]
+        filters.setdefault(column, {})[op] = value
+    return columns, filters or None, order_by
+
+def get_table_data(table_name, limit=None, columns=None, filters=None, order_by=None, schema=None):
+    """Get data from a specific table. Loads entire table by default.
+
+    Column names in `columns`, `filters` and `order_by` are validated against the
+    table schema and every value is bound as a parameter (see build_table_query).
+    Pass `schema` (e.g. from the metadata cache) to skip the INFORMATION_SCHEMA lookup.
+    """
+    try:
+        if schema is None:
+            schema = get_table_schema(table_name)
+        query, params = build_table_query(table_name, schema, limit=limit, columns=columns,
+                                          filters=filters, order_by=order_by)
+        return execute_query(query, params=params)
     except Exception as e:
         print(f"Error getting data from {table_name}: {e}")
         raise
@@ -130,12 +596,83 @@ def get_table_schema(table_name):
         print(f"Error getting schema for table {table_name}: {e}")
         raise
 
+def get_all_columns():
+    """Get the columns of every table in the dbo schema in one query."""
+    try:
+        query = """
+        SELECT 
+            TABLE_NAME,
+            COLUMN_NAME,
+            DATA_TYPE,
+            IS_NULLABLE,
+            COLUMN_DEFAULT
+        FROM INFORMATION_SCHEMA.COLUMNS 
+        WHERE TABLE_SCHEMA = 'dbo'
+        ORDER BY TABLE_NAME, ORDINAL_POSITION
+        """
+        df = execute_query(query)
+        return dataframe_to_json_serializable(df)
+    except Exception as e:
+        print(f"Error getting columns: {e}")
+        raise
+
+def get_approx_row_counts():
+    """Get approximate row counts for every dbo table from partition metadata (no table scans)."""
+    queries = [
+        # Needs VIEW DATABASE STATE
+        """
+        SELECT t.name as table_name, SUM(ps.row_count) as row_count
+        FROM sys.dm_db_partition_stats ps
+        JOIN sys.tables t ON ps.object_id = t.object_id
+        JOIN sys.schemas sc ON t.schema_id = sc.schema_id
+        WHERE sc.name = 'dbo' AND ps.index_id IN (0, 1)
+        GROUP BY t.name
+        """,
+        # Readable by any user with access to the tables
+        """
+        SELECT t.name as table_name, SUM(p.rows) as row_count
+        FROM sys.partitions p
+        JOIN sys.tables t ON p.object_id = t.object_id
+        JOIN sys.schemas sc ON t.schema_id = sc.schema_id
+        WHERE sc.name = 'dbo' AND p.index_id IN (0, 1)
+        GROUP BY t.name
+        """
+    ]
+    for query in queries:
+        try:
+            df = execute_query(query)
+            return {row['table_name']: int(row['row_count']) for row in dataframe_to_json_serializable(df)}
+        except Exception as e:
+            print(f"Error getting approximate row counts: {e}")
+    raise RuntimeError("Approximate row counts are unavailable")
+
 def get_table_row_count(table_name):
-    """Get the number of rows in a table."""
+    """Get the exact number of rows in a table. This scans the table; see row_counts for cheaper counts."""
     try:
-        query = f"SELECT COUNT(*) as row_count FROM dbo.{table_name}"
+        query = f"SELECT COUNT_BIG(*) as row_count FROM dbo.[{table_name}]"
         df = execute_query(query)
         return int(df.iloc[0]['row_count'])  # Explicitly convert to Python int
     except Exception as e:
         print(f"Error getting row count for {table_name}: {e}")
         raise
+
+
+_generation_cache = {"value": None, "checked_at": None}
+
+def current_generation(max_age=30):
+    """Get the ETL load generation, re-reading it from the database at most every `max_age` seconds."""
+    checked_at = _generation_cache["checked_at"]
+    if checked_at is None or time.monotonic() - checked_at > max_age:
+        _generation_cache["value"] = get_load_generation()
+        _generation_cache["checked_at"] = time.monotonic()
+    return _generation_cache["value"]
+
+def get_load_generation():
+    """Get the id of the latest ETL load, or None if no load has been recorded."""
+    try:
+        df = execute_query("SELECT MAX(generation_id) as generation_id FROM dbo.etl_load_generation")
+        value = df.iloc[0]['generation_id']
+        return None if pd.isna(value) else int(value)
+    except Exception as e:
+        print(f"Error getting ETL load generation: {e}")
+        return None
@@ -0,0 +1,103 @@
+import threading
+import time
+
+from db_helper import current_generation, dataframe_to_json_serializable
+import snapshot
+
+# EV per-suburb profile.
+# One scan of ev_fact grouped by suburb gives everything the EV scatter panels
+# need: EV count, BEV/PHEV split, average price and average range. It is built
+# once per ETL load generation and /api/ev-price-scatter, /api/ev-range-scatter
+# and /api/ev-suburb-profile are projections of it. Concurrent rebuilds share
+# one database execution through single-flight.
+#
+# The scatters only count EVs on rows that have the plotted value, so the
+# profile also carries priced_evs and ranged_evs next to total_evs.
+
+PROFILE_SQL = """
+    SELECT
+        s.SUBURB_NAME,
+        SUM(f.TOTAL_EVs) AS total_evs,
+        SUM(CASE WHEN f.FUEL_TYPE = 'BEV' THEN f.TOTAL_EVs ELSE 0 END) AS bev_count,
+        SUM(CASE WHEN f.FUEL_TYPE = 'PHEV' THEN f.TOTAL_EVs ELSE 0 END) AS phev_count,
+        COUNT(*) AS record_count,
+        AVG(CAST(f.AVG_PRICE AS FLOAT)) AS avg_price,
+        SUM(CASE WHEN f.AVG_PRICE IS NOT NULL THEN f.TOTAL_EVs END) AS priced_evs,
+        AVG(CAST(f.AVG_RANGE_KM AS FLOAT)) AS avg_range,
+        SUM(CASE WHEN f.AVG_RANGE_KM IS NOT NULL THEN f.TOTAL_EVs END) AS ranged_evs
+    FROM dbo.ev_fact f
+    JOIN dbo.suburb_dim s ON f.suburb_id = s.suburb_id
+    WHERE f.TOTAL_EVs > 0
+    GROUP BY s.SUBURB_NAME
+"""
+
+# Rounding applied to each column in responses
+DECIMALS = {'total_evs': 1, 'priced_evs': 1, 'ranged_evs': 1, 'avg_price': 0, 'avg_range': 1}
+
+# value column -> column holding the EV count of rows that have that value
+SCATTER_COUNTS = {'avg_price': 'priced_evs', 'avg_range': 'ranged_evs'}
+
+_lock = threading.Lock()
+_state = {"generation": None, "frame": None, "computed_at": None, "compute_ms": None}
+
+
+def profile():
+    """The per-suburb profile frame for the current load generation, built on first use.
+
+    It is computed outside the lock, so status() never waits for a rebuild.
+    With no load generation to key on, the frame is not cached.
+    """
+    generation = current_generation()
+    with _lock:
+        if _state["frame"] is not None and generation is not None and _state["generation"] == generation:
+            return _state["frame"]
+    start = time.perf_counter()
+    frame = snapshot.query('ev_suburb_profile', PROFILE_SQL)
+    compute_ms = round((time.perf_counter() - start) * 1000, 1)
+    if generation is not None:
+        with _lock:
+            _state.update({
+                "generation": generation,
+                "frame": frame,
+                "computed_at": time.time(),
+                "compute_ms": compute_ms,
+            })
+    return frame
+
+
+def _rounded(df):
+    df = df.copy()
+    for column, decimals in DECIMALS.items():
+        if column in df.columns:
+            df[column] = df[column].astype(float).round(decimals)
+    return df
+
+
+def scatter(value_key):
+    """Records of SUBURB_NAME, value_key and total_evs for suburbs with a positive value.
+
+    total_evs counts only rows that have the value, ordered by it descending.
+    """
+    count_column = SCATTER_COUNTS[value_key]
+    df = profile()
+    df = df[df[value_key].notna() & (df[value_key] > 0)]
+    df = df.sort_values(count_column, ascending=False)
+    df = df[['SUBURB_NAME', value_key, count_column]].rename(columns={count_column: 'total_evs'})
+    return dataframe_to_json_serializable(_rounded(df))
+
+
+def records():
+    """The whole profile, largest suburbs first."""
+    df = profile().sort_values('total_evs', ascending=False)
+    return dataframe_to_json_serializable(_rounded(df))
+
+
+def status():
+    with _lock:
+        frame = _state["frame"]
+        return {
+            "generation": _state["generation"],
+            "suburbs": len(frame) if frame is not None else None,
+            "computed_at": _state["computed_at"],
+            "compute_ms": _state["compute_ms"],
+        }
@@ -0,0 +1,97 @@
+import datetime
+import os
+import threading
+import time
+
+from db_helper import probe, pool_status
+import resilience
+
+# Liveness and readiness.
+# Liveness (/api/health, /api/live) does no I/O. Readiness (/api/ready) checks
+# the database on a pooled connection, but at most once per
+# READINESS_CHECK_SECONDS: probes arriving in between, from any number of
+# orchestrators, share the last result. While a check is running, other probes
+# get the previous result instead of waiting for it.
+#
+#   READINESS_CHECK_SECONDS - how long a database check result is reused
+#   READINESS_TIMEOUT       - query timeout in seconds for the check (not retried)
+#   LOAD_MAX_AGE_HOURS      - flag the data as stale when the last ETL load is older (0 disables)
+READINESS_CHECK_SECONDS = float(os.getenv("READINESS_CHECK_SECONDS", "5"))
+READINESS_TIMEOUT = int(os.getenv("READINESS_TIMEOUT", "3"))
+LOAD_MAX_AGE_HOURS = float(os.getenv("LOAD_MAX_AGE_HOURS", "0"))
+
+STARTED_AT = time.time()
+
+_lock = threading.Lock()
+_last_check = None
+_last_checked_at = None
+_checking = False
+
+
+def liveness():
+    return {"status": "alive", "uptime_seconds": round(time.time() - STARTED_AT, 1)}
+
+
+def _check():
+    result = {"connected": False, "latency_ms": None, "error": None}
+    try:
+        latency_ms, generation, loaded_at = probe(READINESS_TIMEOUT)
+        result["latency_ms"] = round(latency_ms, 2)
+        result["connected"] = True
+    except Exception as e:
+        result["error"] = str(e)
+        return result
+
+    age = None
+    if loaded_at is not None:
+        # loaded_at is stored in UTC (SYSUTCDATETIME)
+        loaded_at = loaded_at.replace(tzinfo=datetime.timezone.utc)
+        age = (datetime.datetime.now(datetime.timezone.utc) - loaded_at).total_seconds()
+    result["generation"] = {
+        "id": generation,
+        "loaded_at": loaded_at.isoformat() if loaded_at is not None else None,
+        "age_seconds": round(age) if age is not None else None,
+        "stale": bool(LOAD_MAX_AGE_HOURS) and age is not None and age > LOAD_MAX_AGE_HOURS * 3600,
+    }
+    return result
+
+
+def check_database():
+    """Database status, re-checked at most every READINESS_CHECK_SECONDS.
+
+    The lock only guards the cached result; the check itself runs outside it,
+    in one caller at a time, while concurrent callers get the last result.
+    """
+    global _last_check, _last_checked_at, _checking
+    with _lock:
+        due = _last_checked_at is None or time.monotonic() - _last_checked_at >= READINESS_CHECK_SECONDS
+        if not due or _checking:
+            if _last_check is not None:
+                return dict(_last_check)
+            return {"connected": False, "latency_ms": None, "error": "First database check in progress"}
+        _checking = True
+    try:
+        result = _check()
+        result["checked_at"] = datetime.datetime.now(datetime.timezone.utc).isoformat()
+    finally:
+        with _lock:
+            _checking = False
+    with _lock:
+        _last_check = result
+        _last_checked_at = time.monotonic()
+    return dict(result)
+
+
+def readiness(warmup_status, cache_status, snapshot_status):
+    """(payload, ready) for the readiness probe."""
+    database = check_database()
+    ready = database["connected"] and warmup_status["ready"]
+    return {
+        "status": "ready" if ready else "not ready",
+        "database": database,
+        "pool": pool_status(),
+        "circuit_breaker": resilience.db_breaker.status(),
+        "response_cache": cache_status,
+        "snapshot": snapshot_status,
+        "warmup": warmup_status,
+    }, ready
@@ -0,0 +1,267 @@
+import csv
+import datetime
+import decimal
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from db_helper import iter_query_batches, convert_numpy_types
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+# Background jobs for large table exports and heavy ad-hoc queries.
+# Jobs run on a small bounded worker pool, separate from the request threads,
+# and stream their rows to a Parquet or CSV file under JOB_RESULTS_DIR, so a
+# long export never holds a Flask worker or builds the whole result in memory.
+#
+#   JOB_WORKERS       - concurrent jobs (each holds one database connection)
+#   JOB_MAX_QUEUED    - jobs waiting for a worker before submissions are refused
+#   JOB_RESULT_TTL    - seconds a finished result is kept before it expires
+#   JOB_QUERY_TIMEOUT - ODBC query timeout for a job's query (0 disables)
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_MAX_QUEUED = int(os.getenv("JOB_MAX_QUEUED", "20"))
+JOB_RESULT_TTL = int(os.getenv("JOB_RESULT_TTL", "3600"))
+JOB_QUERY_TIMEOUT = int(os.getenv("JOB_QUERY_TIMEOUT", "0"))
+JOB_BATCH_SIZE = int(os.getenv("JOB_BATCH_SIZE", "5000"))
+JOB_RESULTS_DIR = os.getenv("JOB_RESULTS_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "job_results"))
+
+JOB_FORMATS = ('parquet', 'csv') if pa is not None else ('csv',)
+MIMETYPES = {'parquet': 'application/vnd.apache.parquet', 'csv': 'text/csv'}
+
+
+class JobQueueFull(Exception):
+    """Raised when JOB_MAX_QUEUED jobs are already waiting."""
+
+
+class Job:
+    def __init__(self, kind, description, sql, params, fmt, total_rows=None):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.description = description
+        self.sql = sql
+        self.params = list(params or [])
+        self.format = fmt
+        self.total_rows = total_rows
+        self.rows_written = 0
+        self.status = 'queued'
+        self.error = None
+        self.path = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.future = None
+        self.cancelled = threading.Event()
+
+    @property
+    def expires_at(self):
+        return self.finished_at + JOB_RESULT_TTL if self.finished_at else None
+
+    def to_dict(self):
+        progress = None
+        if self.status == 'succeeded':
+            progress = 1.0
+        elif self.total_rows:
+            progress = round(min(self.rows_written / self.total_rows, 0.99), 3)
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "description": self.description,
+            "format": self.format,
+            "status": self.status,
+            "rows_written": self.rows_written,
+            "total_rows": self.total_rows,
+            "progress": progress,
+            "bytes": os.path.getsize(self.path) if self.path and os.path.exists(self.path) else None,
+            "error": self.error,
+            "created_at": _isoformat(self.created_at),
+            "started_at": _isoformat(self.started_at),
+            "finished_at": _isoformat(self.finished_at),
+            "expires_at": _isoformat(self.expires_at),
+        }
+
+
+def _isoformat(timestamp):
+    if timestamp is None:
+        return None
+    return datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc).isoformat()
+
+
+_jobs = {}
+_lock = threading.Lock()
+_executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix='job')
+
+
+_ARROW_TYPES = {}
+if pa is not None:
+    _ARROW_TYPES = {
+        bool: pa.bool_(), int: pa.int64(), float: pa.float64(), decimal.Decimal: pa.float64(),
+        str: pa.string(), bytes: pa.binary(), bytearray: pa.binary(),
+        datetime.datetime: pa.timestamp('us'), datetime.date: pa.date32(), datetime.time: pa.time64('us'),
+    }
+
+
+class _ParquetSink:
+    def __init__(self, path, columns):
+        # Types come from the cursor description so every row group shares one schema
+        self.schema = pa.schema([(name, _ARROW_TYPES.get(type_code, pa.string())) for name, type_code in columns])
+        self.writer = pq.ParquetWriter(path, self.schema, compression='zstd')
+
+    def write(self, rows):
+        data = {}
+        for i, field in enumerate(self.schema):
+            values = [row[i] for row in rows]
+            if pa.types.is_floating(field.type):
+                values = [float(v) if v is not None else None for v in values]
+            elif pa.types.is_string(field.type):
+                values = [str(v) if v is not None else None for v in values]
+            data[field.name] = values
+        self.writer.write_table(pa.table(data, schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+
+class _CsvSink:
+    def __init__(self, path, columns):
+        self.file = open(path, 'w', newline='', encoding='utf-8')
+        self.writer = csv.writer(self.file)
+        self.writer.writerow([name for name, _ in columns])
+
+    def write(self, rows):
+        self.writer.writerows([convert_numpy_types(v) for v in row] for row in rows)
+
+    def close(self):
+        self.file.close()
+
+
+def _run(job):
+    if job.cancelled.is_set():
+        return
+    job.status = 'running'
+    job.started_at = time.time()
+    path = os.path.join(JOB_RESULTS_DIR, f"{job.id}.{job.format}")
+    partial = path + ".partial"
+    sink = None
+    try:
+        os.makedirs(JOB_RESULTS_DIR, exist_ok=True)
+        for columns, rows, _ in iter_query_batches(job.sql, job.params, timeout=JOB_QUERY_TIMEOUT,
+                                                   batch_size=JOB_BATCH_SIZE):
+            if job.cancelled.is_set():
+                raise RuntimeError("Job cancelled")
+            if sink is None:
+                sink = (_ParquetSink if job.format == 'parquet' else _CsvSink)(partial, columns)
+            sink.write(rows)
+            job.rows_written += len(rows)
+        if sink is None:
+            # No rows or no result set: still produce an empty, readable file
+            sink = (_ParquetSink if job.format == 'parquet' else _CsvSink)(partial, [])
+        sink.close()
+        sink = None
+        # Under the lock so a cancel either stops the result being published or sees its path
+        with _lock:
+            if job.cancelled.is_set():
+                raise RuntimeError("Job cancelled")
+            os.replace(partial, path)
+            job.path = path
+            job.status = 'succeeded'
+    except Exception as e:
+        with _lock:
+            job.status = 'cancelled' if job.cancelled.is_set() else 'failed'
+        job.error = str(e)
+        print(f"Job {job.id} {job.status}: {e}")
+    finally:
+        if sink is not None:
+            try:
+                sink.close()
+            except Exception:
+                pass
+        if os.path.exists(partial):
+            os.remove(partial)
+        job.finished_at = time.time()
+
+
+def submit(kind, description, sql, params=None, fmt='parquet', total_rows=None):
+    """Queue a query whose result is written to disk. Returns the Job."""
+    if fmt not in JOB_FORMATS:
+        raise ValueError(f"Unsupported format '{fmt}', expected one of {', '.join(JOB_FORMATS)}")
+    expire()
+    with _lock:
+        queued = sum(1 for job in _jobs.values() if job.status == 'queued')
+        if queued >= JOB_MAX_QUEUED:
+            raise JobQueueFull(f"{queued} jobs are already queued")
+        job = Job(kind, description, sql, params, fmt, total_rows)
+        _jobs[job.id] = job
+    job.future = _executor.submit(_run, job)
+    return job
+
+
+def get(job_id):
+    expire()
+    with _lock:
+        return _jobs.get(job_id)
+
+
+def list_jobs():
+    expire()
+    with _lock:
+        jobs = list(_jobs.values())
+    return sorted(jobs, key=lambda job: job.created_at, reverse=True)
+
+
+def cancel(job_id):
+    """Cancel a queued or running job, or delete a finished job's result.
+
+    A running job reports 'cancelling' until its worker stops; it then
+    becomes 'cancelled' and never publishes a result.
+    """
+    with _lock:
+        job = _jobs.pop(job_id, None)
+        if job is None:
+            return None
+        job.cancelled.set()
+        if job.future is not None and job.future.cancel():
+            job.status = 'cancelled'
+            job.finished_at = time.time()
+        elif job.status in ('queued', 'running'):
+            job.status = 'cancelling'
+    _remove_result(job)
+    return job
+
+
+def _remove_result(job):
+    if job.path and os.path.exists(job.path):
+        try:
+            os.remove(job.path)
+        except OSError as e:
+            print(f"Could not remove job result {job.path}: {e}")
+
+
+def expire():
+    """Delete results older than JOB_RESULT_TTL; forget the job after another TTL."""
+    now = time.time()
+    with _lock:
+        jobs = list(_jobs.values())
+    for job in jobs:
+        if job.expires_at is None or now < job.expires_at:
+            continue
+        if job.status == 'succeeded':
+            _remove_result(job)
+            job.status = 'expired'
+        if now >= job.expires_at + JOB_RESULT_TTL:
+            with _lock:
+                _jobs.pop(job.id, None)
+
+
+def status():
+    with _lock:
+        counts = {}
+        for job in _jobs.values():
+            counts[job.status] = counts.get(job.status, 0) + 1
+    return {"workers": JOB_WORKERS, "max_queued": JOB_MAX_QUEUED, "result_ttl_seconds": JOB_RESULT_TTL,
+            "formats": list(JOB_FORMATS), "jobs": counts}
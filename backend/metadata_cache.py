@@ -0,0 +1,63 @@
+import threading
+
+from db_helper import current_generation, get_all_tables, get_all_columns
+
+# Table metadata (existence, columns) loaded in two queries and kept until the
+# ETL load generation changes, so the debug routes are answered from memory
+# instead of INFORMATION_SCHEMA on every call. Row counts live in row_counts.
+
+
+class Metadata:
+    def __init__(self, tables, columns, generation):
+        self.generation = generation
+        self.tables = tables
+        self.columns = {}
+        for column in columns:
+            table_name = column.pop('TABLE_NAME')
+            self.columns.setdefault(table_name, []).append(column)
+
+    def table_names(self):
+        return {table['TABLE_NAME'] for table in self.tables if table['TABLE_SCHEMA'] == 'dbo'}
+
+
+_lock = threading.Lock()
+_metadata = None
+
+
+def load():
+    """Load all metadata and swap it in."""
+    global _metadata
+    generation = current_generation()
+    tables = get_all_tables()
+    columns = get_all_columns()
+    metadata = Metadata(tables, columns, generation)
+    with _lock:
+        _metadata = metadata
+    return metadata
+
+
+def get_metadata():
+    """Get cached metadata, reloading it when a new ETL load is detected."""
+    metadata = _metadata
+    if metadata is None or metadata.generation != current_generation():
+        metadata = load()
+    return metadata
+
+
+def table_exists(table_name):
+    return table_name in get_metadata().table_names()
+
+
+def get_table_schema(table_name):
+    """Columns of a dbo table, in the same shape as db_helper.get_table_schema."""
+    return [dict(column) for column in get_metadata().columns.get(table_name, [])]
+
+
+def list_tables():
+    return [dict(table) for table in get_metadata().tables]
+
+
+def invalidate():
+    global _metadata
+    with _lock:
+        _metadata = None
@@ -0,0 +1,86 @@
+from collections import namedtuple
+import pandas as pd
+
+# "Top N groups by a measure, pivoted by a category" in a single database pass.
+# The SQL ranks groups by the measure total and pivots the requested category
+# values with conditional aggregates, so the result is already chart-shaped:
+# one row per label with one column per series.
+#
+# fact          - fact table and alias, e.g. ('ev_fact', 'e')
+# joins         - JOIN clauses needed for the label column
+# label         - SQL expression for the group label
+# pivot         - SQL expression for the category to pivot on
+# measure       - SQL expression that is summed
+# series        - {pivot value: payload key} for each pivoted series
+# where         - extra WHERE conditions (no user values; those go in params)
+# label_column / pivot_column / measure_column - column names for the pandas path
+TopNPivot = namedtuple('TopNPivot', [
+    'fact', 'joins', 'label', 'pivot', 'measure', 'series', 'where',
+    'label_column', 'pivot_column', 'measure_column', 'label_key'
+], defaults=['labels'])
+
+EV_DISTRIBUTION = TopNPivot(
+    fact=('ev_fact', 'e'),
+    joins=('JOIN dbo.suburb_dim s ON e.suburb_id = s.suburb_id',),
+    label='s.SUBURB_NAME',
+    pivot='e.FUEL_TYPE',
+    measure='e.TOTAL_EVs',
+    series={'BEV': 'bev_data', 'PHEV': 'phev_data'},
+    where=('e.TOTAL_EVs IS NOT NULL', 'e.TOTAL_EVs > 0'),
+    label_column='SUBURB_NAME',
+    pivot_column='FUEL_TYPE',
+    measure_column='TOTAL_EVs',
+)
+
+
+def build_top_n_pivot_query(spec, n):
+    """Compile a TopNPivot into (query, params). Columns: label, series_0..k, total."""
+    params = [int(n)]
+    series_sql = []
+    for i, value in enumerate(spec.series):
+        series_sql.append(f"SUM(CASE WHEN {spec.pivot} = ? THEN {spec.measure} ELSE 0 END) as series_{i}")
+        params.append(value)
+    table, alias = spec.fact
+    where = f"WHERE {' AND '.join(spec.where)}" if spec.where else ""
+    query = f"""
+    SELECT TOP (?)
+        {spec.label} as label,
+        {', '.join(series_sql)},
+        SUM({spec.measure}) as total
+    FROM dbo.{table} {alias}
+    {' '.join(spec.joins)}
+    {where}
+    GROUP BY {spec.label}
+    ORDER BY total DESC, label
+    """
+    return query, params
+
+
+def top_n_pivot_frame(df, spec, n):
+    """Vectorized pandas equivalent of build_top_n_pivot_query over a joined fact frame.
+
+    `df` must already have the spec's `where` conditions applied.
+    """
+    totals = df.groupby(spec.label_column)[spec.measure_column].sum()
+    top = totals.sort_index().sort_values(ascending=False, kind='stable').head(n)
+    pivot = df[df[spec.label_column].isin(top.index)].pivot_table(
+        index=spec.label_column, columns=spec.pivot_column, values=spec.measure_column,
+        aggfunc='sum', fill_value=0
+    )
+    out = pd.DataFrame({'label': top.index})
+    for i, value in enumerate(spec.series):
+        column = pivot[value] if value in pivot.columns else pd.Series(0, index=pivot.index)
+        out[f'series_{i}'] = column.reindex(top.index, fill_value=0).to_numpy()
+    out['total'] = top.to_numpy()
+    return out
+
+
+def series_payload(df, spec):
+    """Turn a top-N pivot result into {label_key: [...], series key: [...]} arrays."""
+    payload = {spec.label_key: df['label'].tolist()}
+    for i, key in enumerate(spec.series.values()):
+        values = pd.to_numeric(df[f'series_{i}']).fillna(0)
+        if (values % 1 == 0).all():
+            values = values.astype(int)
+        payload[key] = values.tolist()
+    return payload
@@ -0,0 +1,100 @@
+import os
+import threading
+from contextlib import contextmanager
+
+from db_helper import estimate_query_cost
+
+# Execution limits for ad-hoc queries (/api/custom-query).
+#   CUSTOM_QUERY_TIMEOUT        - ODBC query timeout in seconds (0 disables)
+#   CUSTOM_QUERY_MAX_ROWS       - rows returned before the result is cut off and flagged as truncated
+#   CUSTOM_QUERY_MAX_COST       - reject queries whose estimated plan cost exceeds this (0 disables)
+#   CUSTOM_QUERY_MAX_CONCURRENT - queries a single client may have running at once
+CUSTOM_QUERY_TIMEOUT = int(os.getenv("CUSTOM_QUERY_TIMEOUT", "30"))
+CUSTOM_QUERY_MAX_ROWS = int(os.getenv("CUSTOM_QUERY_MAX_ROWS", "10000"))
+CUSTOM_QUERY_MAX_COST = float(os.getenv("CUSTOM_QUERY_MAX_COST", "0"))
+CUSTOM_QUERY_MAX_CONCURRENT = int(os.getenv("CUSTOM_QUERY_MAX_CONCURRENT", "2"))
+
+
+class QueryRejected(Exception):
+    """Raised when a query is refused before running; carries the HTTP status to return."""
+
+    def __init__(self, message, status=400, **details):
+        super().__init__(message)
+        self.status = status
+        self.details = details
+
+
+# Queries running per client; a client is dropped when its last query finishes,
+# so this only ever holds clients with work in flight
+_running = {}
+_slots_lock = threading.Lock()
+_rejections = {"concurrency": 0, "cost": 0}
+
+
+def _record_rejection(reason):
+    with _slots_lock:
+        _rejections[reason] += 1
+
+
+@contextmanager
+def client_slot(client_id):
+    """Hold one of a client's concurrent query slots, rejecting the query if none is free."""
+    with _slots_lock:
+        running = _running.get(client_id, 0)
+        if running >= CUSTOM_QUERY_MAX_CONCURRENT:
+            _rejections["concurrency"] += 1
+            raise QueryRejected(
+                "Too many concurrent queries from this client", status=429,
+                max_concurrent=CUSTOM_QUERY_MAX_CONCURRENT
+            )
+        _running[client_id] = running + 1
+    try:
+        yield
+    finally:
+        with _slots_lock:
+            if _running[client_id] <= 1:
+                del _running[client_id]
+            else:
+                _running[client_id] -= 1
+
+
+def check_cost(query, params=None):
+    """Reject a query whose estimated plan cost exceeds CUSTOM_QUERY_MAX_COST.
+
+    Returns the estimate (None when disabled or not available).
+    """
+    if CUSTOM_QUERY_MAX_COST <= 0:
+        return None
+    cost = estimate_query_cost(query, params)
+    if cost is not None and cost > CUSTOM_QUERY_MAX_COST:
+        _record_rejection("cost")
+        raise QueryRejected(
+            f"Estimated query cost {cost:.2f} exceeds the limit of {CUSTOM_QUERY_MAX_COST:.2f}",
+            status=422, estimated_cost=cost, max_cost=CUSTOM_QUERY_MAX_COST
+        )
+    return cost
+
+
+def row_limit(requested=None):
+    """Rows to return: the client's requested cap, never above CUSTOM_QUERY_MAX_ROWS."""
+    try:
+        requested = int(requested)
+    except (TypeError, ValueError):
+        return CUSTOM_QUERY_MAX_ROWS
+    if requested <= 0:
+        return CUSTOM_QUERY_MAX_ROWS
+    return min(requested, CUSTOM_QUERY_MAX_ROWS)
+
+
+def status():
+    with _slots_lock:
+        running = dict(_running)
+        rejections = dict(_rejections)
+    return {
+        "timeout_seconds": CUSTOM_QUERY_TIMEOUT,
+        "max_rows": CUSTOM_QUERY_MAX_ROWS,
+        "max_cost": CUSTOM_QUERY_MAX_COST or None,
+        "max_concurrent_per_client": CUSTOM_QUERY_MAX_CONCURRENT,
+        "running": running,
+        "rejections": rejections,
+    }
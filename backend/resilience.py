@@ -0,0 +1,284 @@
+import os
+import random
+import re
+import threading
+import time
+
+import pyodbc
+
+# Resilience for database access: timeouts, retry with jittered backoff for
+# transient errors, and a circuit breaker.
+#
+# While Azure SQL is throttled or failing over, every request retrying its own
+# connect makes the outage worse. The breaker counts transient failures across
+# all requests; after BREAKER_FAILURE_THRESHOLD in a row it opens and queries
+# fail immediately with CircuitOpenError (cached responses are served instead,
+# see compression.cached_response). After BREAKER_RESET_SECONDS one trial query
+# is let through; its success closes the breaker again.
+#
+#   DB_CONNECT_TIMEOUT        - login timeout in seconds for new connections
+#   DB_QUERY_TIMEOUT          - ODBC query timeout in seconds (0 disables)
+#   DB_RETRY_ATTEMPTS         - retries after the first attempt for transient errors
+#   DB_RETRY_BASE_DELAY       - backoff base in seconds (full jitter, doubled per attempt)
+#   DB_RETRY_MAX_DELAY        - backoff cap in seconds
+#   BREAKER_FAILURE_THRESHOLD - consecutive transient failures that open the breaker
+#   BREAKER_RESET_SECONDS     - how long the breaker stays open before a trial query
+#   DB_FAULT_INJECTION        - e.g. "rate=0.2,sqlstate=08S01,latency=0.5" to test all of the above
+DB_CONNECT_TIMEOUT = int(os.getenv("DB_CONNECT_TIMEOUT", "15"))
+DB_QUERY_TIMEOUT = int(os.getenv("DB_QUERY_TIMEOUT", "60"))
+DB_RETRY_ATTEMPTS = int(os.getenv("DB_RETRY_ATTEMPTS", "2"))
+DB_RETRY_BASE_DELAY = float(os.getenv("DB_RETRY_BASE_DELAY", "0.2"))
+DB_RETRY_MAX_DELAY = float(os.getenv("DB_RETRY_MAX_DELAY", "2.0"))
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_RESET_SECONDS = float(os.getenv("BREAKER_RESET_SECONDS", "30"))
+DB_FAULT_INJECTION = os.getenv("DB_FAULT_INJECTION", "")
+
+# ODBC SQLSTATEs worth retrying: connection failures and serialization failures
+TRANSIENT_SQLSTATES = {'08001', '08004', '08007', '08S01', '40001'}
+# Timeouts are never retried and do not count against the breaker: a query that
+# hit its timeout would most likely hit it again, and a few runaway ad-hoc
+# queries must not open the breaker for every other route
+TIMEOUT_SQLSTATES = {'HYT00', 'HYT01'}
+# SQL Server / Azure SQL error numbers for throttling, failover and deadlocks
+TRANSIENT_ERROR_NUMBERS = {
+    64, 233, 1205, 4060, 4221, 10053, 10054, 10060, 10928, 10929,
+    40143, 40197, 40501, 40540, 40613, 49918, 49919, 49920,
+}
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of querying while the circuit breaker is open."""
+
+
+def is_transient(error):
+    """Whether a database error is worth retrying (connection loss, throttling, failover, deadlock)."""
+    if not isinstance(error, pyodbc.Error):
+        return False
+    args = error.args or ()
+    if args and str(args[0]) in TIMEOUT_SQLSTATES:
+        return False
+    if args and str(args[0]) in TRANSIENT_SQLSTATES:
+        return True
+    message = " ".join(str(arg) for arg in args)
+    return any(int(number) in TRANSIENT_ERROR_NUMBERS for number in re.findall(r"\((\d+)\)", message))
+
+
+class CircuitBreaker:
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+    def __init__(self, failure_threshold=BREAKER_FAILURE_THRESHOLD, reset_seconds=BREAKER_RESET_SECONDS,
+                 clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.clock = clock
+        self._lock = threading.Lock()
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+        self.counters = {"opened": 0, "rejected": 0, "failures": 0, "successes": 0, "retries": 0}
+
+    def allow(self):
+        """Whether a call may go ahead. In half-open state only one trial call is allowed."""
+        with self._lock:
+            if self.state == self.OPEN and self.clock() - self.opened_at >= self.reset_seconds:
+                self.state = self.HALF_OPEN
+                self.trial_in_flight = False
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.HALF_OPEN and not self.trial_in_flight:
+                self.trial_in_flight = True
+                return True
+            self.counters["rejected"] += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.counters["successes"] += 1
+            self.consecutive_failures = 0
+            self.state = self.CLOSED
+            self.trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.counters["failures"] += 1
+            self.consecutive_failures += 1
+            if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    self.counters["opened"] += 1
+                self.state = self.OPEN
+                self.opened_at = self.clock()
+                self.trial_in_flight = False
+
+    def record_retry(self):
+        with self._lock:
+            self.counters["retries"] += 1
+
+    def release_trial(self):
+        """End a half-open trial that finished without a verdict (e.g. a non-transient error)."""
+        with self._lock:
+            self.trial_in_flight = False
+
+    def is_open(self):
+        with self._lock:
+            return self.state == self.OPEN and self.clock() - self.opened_at < self.reset_seconds
+
+    def status(self):
+        with self._lock:
+            return {
+                "state": self.state,
+                "consecutive_failures": self.consecutive_failures,
+                "failure_threshold": self.failure_threshold,
+                "reset_seconds": self.reset_seconds,
+                "open_for_seconds": round(self.clock() - self.opened_at, 1) if self.state == self.OPEN else None,
+                **self.counters,
+            }
+
+
+db_breaker = CircuitBreaker()
+
+
+def backoff_delay(attempt, base=DB_RETRY_BASE_DELAY, cap=DB_RETRY_MAX_DELAY):
+    """Full-jitter exponential backoff: uniform in [0, min(cap, base * 2**attempt)]."""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def call(fn, breaker=None, retries=None, sleep=time.sleep):
+    """Run fn() through the circuit breaker, retrying transient database errors.
+
+    Non-transient errors (bad SQL, permissions) are raised at once and do not
+    count against the breaker.
+    """
+    breaker = breaker or db_breaker
+    retries = DB_RETRY_ATTEMPTS if retries is None else retries
+    if not breaker.allow():
+        raise CircuitOpenError("Database circuit breaker is open; failing fast")
+    attempt = 0
+    while True:
+        try:
+            result = fn()
+        except Exception as e:
+            if not is_transient(e):
+                breaker.release_trial()
+                raise
+            if attempt >= retries or breaker.is_open():
+                breaker.record_failure()
+                raise
+            breaker.record_retry()
+            sleep(backoff_delay(attempt))
+            attempt += 1
+            continue
+        breaker.record_success()
+        return result
+
+
+# --- Connection factory ---------------------------------------------------------
+
+def default_connection_factory(conn_str):
+    return pyodbc.connect(conn_str, timeout=DB_CONNECT_TIMEOUT)
+
+
+class FaultInjectingConnectionFactory:
+    """Stand-in connection factory that fails or slows connects and queries on demand.
+
+    rate      - probability that a connect or execute raises
+    fail_next - number of upcoming connects/executes that raise regardless of rate
+    sqlstate  - SQLSTATE of the raised pyodbc.OperationalError ('08S01' is transient)
+    latency   - seconds added to every connect and execute
+    """
+
+    def __init__(self, factory=default_connection_factory, rate=0.0, fail_next=0, sqlstate='08S01', latency=0.0,
+                 seed=None):
+        self.factory = factory
+        self.rate = rate
+        self.fail_next = fail_next
+        self.sqlstate = sqlstate
+        self.latency = latency
+        self.random = random.Random(seed)
+        self.injected = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_spec(cls, spec, factory=default_connection_factory):
+        """Build from "rate=0.2,sqlstate=08S01,latency=0.5,fail_next=3"."""
+        options = dict(part.split('=', 1) for part in spec.split(',') if '=' in part)
+        return cls(
+            factory,
+            rate=float(options.get('rate', 0)),
+            fail_next=int(options.get('fail_next', 0)),
+            sqlstate=options.get('sqlstate', '08S01'),
+            latency=float(options.get('latency', 0)),
+        )
+
+    def maybe_fail(self, where):
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            fail = self.fail_next > 0 or self.random.random() < self.rate
+            if self.fail_next > 0:
+                self.fail_next -= 1
+            if fail:
+                self.injected += 1
+        if fail:
+            raise pyodbc.OperationalError(self.sqlstate, f"[{self.sqlstate}] Injected fault during {where}")
+
+    def __call__(self, conn_str):
+        self.maybe_fail('connect')
+        return _FaultyConnection(self.factory(conn_str), self)
+
+
+class _FaultyConnection:
+    def __init__(self, conn, faults):
+        self._conn = conn
+        self._faults = faults
+
+    def cursor(self):
+        return _FaultyCursor(self._conn.cursor(), self._faults)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def __setattr__(self, name, value):
+        if name.startswith('_'):
+            object.__setattr__(self, name, value)
+        else:
+            setattr(self._conn, name, value)
+
+
+class _FaultyCursor:
+    def __init__(self, cursor, faults):
+        self._cursor = cursor
+        self._faults = faults
+
+    def execute(self, *args, **kwargs):
+        self._faults.maybe_fail('execute')
+        return self._cursor.execute(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+connection_factory = (FaultInjectingConnectionFactory.from_spec(DB_FAULT_INJECTION)
+                      if DB_FAULT_INJECTION else default_connection_factory)
+
+
+def set_connection_factory(factory):
+    """Replace how connections are opened, e.g. with a FaultInjectingConnectionFactory in tests."""
+    global connection_factory
+    connection_factory = factory
+
+
+def connect(conn_str):
+    return connection_factory(conn_str)
+
+
+def metrics_lines():
+    """Breaker state and counters in OpenMetrics text format."""
+    status = db_breaker.status()
+    lines = ["# TYPE db_circuit_breaker_state gauge"]
+    for state in (CircuitBreaker.CLOSED, CircuitBreaker.HALF_OPEN, CircuitBreaker.OPEN):
+        lines.append(f'db_circuit_breaker_state{{state="{state}"}} {1 if status["state"] == state else 0}')
+    for name in ("opened", "rejected", "failures", "retries"):
+        lines.append(f"# TYPE db_circuit_breaker_{name} counter")
+        lines.append(f"db_circuit_breaker_{name}_total {status[name]}")
+    return lines
@@ -0,0 +1,55 @@
+import threading
+
+from db_helper import current_generation, get_approx_row_counts, get_table_row_count
+
+# Row counts for the debug routes, cached per ETL load generation.
+#   approx - partition metadata (sys.dm_db_partition_stats / sys.partitions), no table scan
+#   exact  - SELECT COUNT(*), a full scan of the table
+ROW_COUNT_MODES = ('approx', 'exact')
+DEFAULT_ROW_COUNT_MODE = 'approx'
+
+_lock = threading.Lock()
+_cache = {'generation': None, 'approx': None, 'exact': {}}
+
+
+def _current_cache():
+    generation = current_generation()
+    with _lock:
+        if _cache['generation'] != generation:
+            _cache['generation'] = generation
+            _cache['approx'] = None
+            _cache['exact'] = {}
+    return _cache
+
+
+def get_row_count(table_name, mode=DEFAULT_ROW_COUNT_MODE):
+    """Get (row_count, mode_used) for a table.
+
+    An approximate count that is unavailable (e.g. missing permissions) is
+    reported as (None, 'unavailable') rather than falling back to a scan.
+    """
+    if mode not in ROW_COUNT_MODES:
+        raise ValueError(f"Unknown row count mode '{mode}', expected one of {', '.join(ROW_COUNT_MODES)}")
+    cache = _current_cache()
+    if mode == 'exact':
+        if table_name not in cache['exact']:
+            cache['exact'][table_name] = get_table_row_count(table_name)
+        return cache['exact'][table_name], 'exact'
+
+    if cache['approx'] is None:
+        try:
+            cache['approx'] = get_approx_row_counts()
+        except Exception as e:
+            print(f"Error getting approximate row counts: {e}")
+            return None, 'unavailable'
+    if table_name not in cache['approx']:
+        return None, 'unavailable'
+    return cache['approx'][table_name], 'approx'
+
+
+def get_all_row_counts():
+    """Approximate row counts for every dbo table."""
+    cache = _current_cache()
+    if cache['approx'] is None:
+        cache['approx'] = get_approx_row_counts()
+    return dict(cache['approx'])
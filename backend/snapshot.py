@@ -0,0 +1,188 @@
+import threading
+import time
+from datetime import datetime, timezone
+import pandas as pd
+
+from db_helper import execute_query, get_load_generation
+from utils.schema_registry import apply_dtypes
+from query_builder import EV_DISTRIBUTION, top_n_pivot_frame
+
+# In-process columnar snapshot of the warehouse.
+# The six allowed tables are small and read-mostly, so they are held as pandas
+# (NumPy-backed, column-oriented) frames and the analytics routes are answered
+# with vectorized group-bys instead of a round-trip to Azure SQL.
+
+class Snapshot:
+    def __init__(self, tables, generation):
+        self.tables = tables
+        self.generation = generation
+        self.loaded_at = datetime.now(timezone.utc)
+        self._joined = {}
+
+    def __getitem__(self, table_name):
+        return self.tables[table_name]
+
+    def joined(self, fact_table, *dims):
+        """Get a fact table inner-joined to the given dimensions (memoized)."""
+        key = (fact_table, dims)
+        if key not in self._joined:
+            df = self.tables[fact_table]
+            for dim in dims:
+                dim_df = self.tables[f"{dim}_dim"]
+                df = df.merge(dim_df, on=f"{dim}_id", how='inner', suffixes=('', f'_{dim}'))
+            self._joined[key] = df
+        return self._joined[key]
+
+    def row_counts(self):
+        return {name: len(df) for name, df in self.tables.items()}
+
+
+# Local equivalents of the route SQL. Each returns a DataFrame with the same
+# columns and ordering as the query it replaces. Routes built on the semantic
+# layer are evaluated against the snapshot by semantic.evaluate_frame instead.
+
+def _dashboard_ev(snap):
+    e = snap['ev_fact']
+    return pd.DataFrame([{
+        'total_evs': e['TOTAL_EVs'].sum(),
+        'bev_count': e['BEV_COUNT'].sum(),
+        'phev_count': e['PHEV_COUNT'].sum(),
+        'total_records': len(e)
+    }])
+
+def _ev_trends(snap):
+    e = snap.joined('ev_fact', 'time')
+    return e.groupby('YEAR', dropna=False).agg(
+        total_evs=('TOTAL_EVs', 'sum'),
+        bev_count=('BEV_COUNT', 'sum'),
+        phev_count=('PHEV_COUNT', 'sum'),
+        record_count=('TOTAL_EVs', 'size')
+    ).reset_index().sort_values('YEAR')
+
+def _energy_data(snap, limit, year=None, suburb_ids=None):
+    e = snap.joined('energy_fact', 'suburb', 'time')
+    if year:
+        e = e[e['YEAR'] == year]
+    if suburb_ids is not None:
+        e = e[e['suburb_id'].isin(suburb_ids)]
+    columns = ['energy_fact_id', 'ENERGY_CONSUMPTION', 'ENERGY_CHANGE_PCT', 'NO2_LEVEL', 'NO2_CHANGE',
+               'NO2_CHANGE_PCT', 'EV_PER_ENERGY_UNIT', 'NO2_PER_EV', 'SUBURB_NAME', 'YEAR', 'IS_CURRENT_YEAR']
+    e = e.sort_values(['YEAR', 'SUBURB_NAME'], ascending=[False, True])
+    return e[columns].head(limit)
+
+def _ev_distribution(snap, n):
+    spec = EV_DISTRIBUTION
+    e = snap.joined('ev_fact', 'suburb')
+    e = e[e['TOTAL_EVs'].notna() & (e['TOTAL_EVs'] > 0)]
+    return top_n_pivot_frame(e, spec, n)
+
+def _ev_suburb_profile(snap):
+    e = snap.joined('ev_fact', 'suburb')
+    e = e[e['TOTAL_EVs'] > 0]
+    evs = e['TOTAL_EVs'].astype(float)
+    e = e.assign(
+        bev_count=e['TOTAL_EVs'].where(e['FUEL_TYPE'] == 'BEV', 0),
+        phev_count=e['TOTAL_EVs'].where(e['FUEL_TYPE'] == 'PHEV', 0),
+        priced_evs=evs.where(e['AVG_PRICE'].notna()),
+        ranged_evs=evs.where(e['AVG_RANGE_KM'].notna()),
+    )
+    return e.groupby('SUBURB_NAME').agg(
+        total_evs=('TOTAL_EVs', 'sum'),
+        bev_count=('bev_count', 'sum'),
+        phev_count=('phev_count', 'sum'),
+        record_count=('TOTAL_EVs', 'size'),
+        avg_price=('AVG_PRICE', 'mean'),
+        priced_evs=('priced_evs', lambda v: v.sum(min_count=1)),
+        avg_range=('AVG_RANGE_KM', 'mean'),
+        ranged_evs=('ranged_evs', lambda v: v.sum(min_count=1)),
+    ).reset_index()
+
+def _available_years(snap):
+    years = snap['time_dim']['YEAR'].dropna().drop_duplicates().sort_values()
+    return pd.DataFrame({'YEAR': years.values})
+
+LOCAL_QUERIES = {
+    'dashboard_ev': _dashboard_ev,
+    'ev_trends': _ev_trends,
+    'energy_data': _energy_data,
+    'ev_distribution': _ev_distribution,
+    'ev_suburb_profile': _ev_suburb_profile,
+    'available_years': _available_years,
+}
+
+
+_lock = threading.Lock()
+_current = None
+_tables = ()
+_watcher = None
+_last_error = None
+
+def current():
+    """Get the active snapshot, or None when serving from the database."""
+    return _current
+
+def load(tables):
+    """Load a new snapshot and swap it in atomically. Readers never see a partial load."""
+    global _current, _tables, _last_error
+    _tables = tuple(sorted(tables))
+    generation = get_load_generation()
+    try:
+        # Registry dtypes keep the snapshot compact (int16 keys, float32 measures)
+        frames = {name: apply_dtypes(name, execute_query(f"SELECT * FROM dbo.{name}")) for name in _tables}
+        snap = Snapshot(frames, generation)
+        with _lock:
+            _current = snap
+        _last_error = None
+        print(f"Loaded snapshot of {len(frames)} tables (generation {generation})")
+        return snap
+    except Exception as e:
+        # Keep serving the previous snapshot (or the database) on a failed reload
+        _last_error = str(e)
+        print(f"Error loading snapshot: {e}")
+        return None
+
+def reload_if_stale():
+    """Reload the snapshot when the ETL load generation has moved on."""
+    snap = _current
+    generation = get_load_generation()
+    if snap is None or generation != snap.generation:
+        return load(_tables)
+    return snap
+
+def _watch(poll_seconds):
+    while True:
+        time.sleep(poll_seconds)
+        try:
+            reload_if_stale()
+        except Exception as e:
+            print(f"Error checking snapshot generation: {e}")
+
+def start(tables, poll_seconds=60):
+    """Load the initial snapshot and watch for new ETL loads in the background."""
+    global _watcher
+    load(tables)
+    if _watcher is None:
+        _watcher = threading.Thread(target=_watch, args=(poll_seconds,), daemon=True)
+        _watcher.start()
+
+def query(name, sql, params=None, **local_params):
+    """Answer a route query from the snapshot, falling back to the database."""
+    snap = _current
+    if snap is not None:
+        try:
+            return LOCAL_QUERIES[name](snap, **local_params)
+        except Exception as e:
+            print(f"Snapshot query {name} failed, falling back to database: {e}")
+    return execute_query(sql, params=params)
+
+def status():
+    snap = _current
+    if snap is None:
+        return {"active": False, "last_error": _last_error}
+    return {
+        "active": True,
+        "generation": snap.generation,
+        "loaded_at": snap.loaded_at.isoformat(),
+        "row_counts": snap.row_counts(),
+        "last_error": _last_error
+    }
@@ -0,0 +1,188 @@
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import sqlglot
+from sqlglot import exp
+
+# Validation and normalization of ad-hoc SELECTs (/api/custom-query).
+# Queries are parsed into an AST rather than scanned for keywords, so CTEs,
+# subqueries and derived tables are all checked, and valid queries that merely
+# contain a keyword inside a name or string are not rejected.
+#
+# Literals in WHERE/HAVING predicates are then lifted into `?` parameters. The
+# normalized text is the same for every query that differs only in those
+# constants: it compiles to one server plan and keys the result cache below.
+
+CUSTOM_QUERY_CACHE_TTL = int(os.getenv("CUSTOM_QUERY_CACHE_TTL", "300"))
+CUSTOM_QUERY_CACHE_SIZE = int(os.getenv("CUSTOM_QUERY_CACHE_SIZE", "128"))
+
+# Statements and clauses that are never allowed anywhere in the tree
+_FORBIDDEN_NODES = (
+    exp.Insert, exp.Update, exp.Delete, exp.Merge, exp.Drop, exp.Create, exp.Alter,
+    exp.Command, exp.Into, exp.Transaction, exp.Commit, exp.Rollback, exp.Use, exp.Set,
+)
+# Functions that reach outside the database or allowed tables
+_FORBIDDEN_FUNCTIONS = {'OPENROWSET', 'OPENQUERY', 'OPENDATASOURCE', 'OPENXML', 'OPENJSON'}
+# Only predicate values are lifted into parameters. Literals in the select list
+# must stay inline: SQL Server matches GROUP BY/ORDER BY expressions against the
+# select list textually, so `SELECT LEFT(x, ?) ... GROUP BY LEFT(x, 1)` fails (8120).
+_PARAMETERIZED_CLAUSES = (exp.Where, exp.Having)
+# Literals under these nodes stay inline even in a predicate (TOP n, type lengths)
+_INLINE_LITERAL_PARENTS = (exp.Limit, exp.Fetch, exp.Offset, exp.Order, exp.Group, exp.DataType)
+
+
+class UnsafeQuery(Exception):
+    """Raised when a query is not a single SELECT over allowed tables; carries the HTTP status."""
+
+    def __init__(self, message, status=400, **details):
+        super().__init__(message)
+        self.status = status
+        self.details = details
+
+
+class ParsedQuery:
+    def __init__(self, tree, tables, sql, params):
+        self.tree = tree
+        self.tables = tables
+        self.sql = sql
+        self.params = params
+
+
+def parse_select(query, allowed_tables):
+    """Parse a query and check it is a single read-only SELECT over allowed tables.
+
+    Returns a ParsedQuery with the referenced tables and the normalized
+    (literal-free) SQL and its parameters.
+    """
+    try:
+        statements = [s for s in sqlglot.parse(query, read='tsql') if s is not None]
+    except sqlglot.errors.ParseError as e:
+        raise UnsafeQuery(f"Could not parse query: {e}")
+    if len(statements) != 1:
+        raise UnsafeQuery("Exactly one statement is allowed")
+    tree = statements[0]
+    if not isinstance(tree, (exp.Select, exp.Union, exp.Intersect, exp.Except)):
+        raise UnsafeQuery("Only SELECT statements are allowed")
+
+    for node in tree.walk():
+        if isinstance(node, _FORBIDDEN_NODES):
+            raise UnsafeQuery(f"'{node.key.upper()}' is not allowed in a query")
+        if isinstance(node, exp.Func) and node.sql_name().upper() in _FORBIDDEN_FUNCTIONS:
+            raise UnsafeQuery(f"Function '{node.sql_name().upper()}' is not allowed")
+        if isinstance(node, exp.Anonymous) and str(node.this).upper() in _FORBIDDEN_FUNCTIONS:
+            raise UnsafeQuery(f"Function '{str(node.this).upper()}' is not allowed")
+
+    tables = referenced_tables(tree)
+    allowed = {t.lower() for t in allowed_tables}
+    for table in sorted(tables):
+        if table not in allowed:
+            raise UnsafeQuery(
+                f"Access to table '{table}' is not allowed", status=403,
+                allowed_tables=sorted(allowed_tables)
+            )
+    sql, params = normalize(tree)
+    return ParsedQuery(tree, tables, sql, params)
+
+
+def referenced_tables(tree):
+    """Every base table the query reads, including inside CTEs and subqueries.
+
+    CTE names are not tables. Anything outside the dbo schema (sys.*,
+    INFORMATION_SCHEMA.*, other databases) is reported by its qualified name
+    so it fails the allow-list.
+    """
+    cte_names = {cte.alias_or_name.lower() for cte in tree.find_all(exp.CTE)}
+    tables = set()
+    for table in tree.find_all(exp.Table):
+        name = table.name.lower()
+        schema = table.db.lower()
+        if not name:
+            raise UnsafeQuery("Table-valued functions are not allowed")
+        if not schema and not table.catalog and name in cte_names:
+            continue
+        if table.catalog or (schema and schema != 'dbo'):
+            tables.add(".".join(part for part in (table.catalog, table.db, table.name) if part).lower())
+        else:
+            tables.add(name)
+    return tables
+
+
+def _literal_value(literal):
+    if literal.is_string:
+        return literal.this
+    try:
+        return int(literal.this)
+    except ValueError:
+        return float(literal.this)
+
+
+def _parameterizable(literal):
+    """Whether a literal is a value in a WHERE/HAVING predicate of its own SELECT.
+
+    Function arguments (LEFT(x, 1), CONVERT(..., 120)) stay inline: they are
+    lengths and styles, not values, and may have to match the select list.
+    """
+    clause = literal.find_ancestor(*_PARAMETERIZED_CLAUSES, exp.Select)
+    if not isinstance(clause, _PARAMETERIZED_CLAUSES):
+        return False
+    if literal.find_ancestor(*_INLINE_LITERAL_PARENTS):
+        return False
+    parent = literal.parent
+    while isinstance(parent, (exp.Neg, exp.Paren)):
+        parent = parent.parent
+    return not isinstance(parent, exp.Func)
+
+
+def normalize(tree):
+    """Lift predicate literals into `?` parameters. Returns (sql, params) in textual order."""
+    tree = tree.copy()
+    values = {}
+    for i, literal in enumerate(list(tree.find_all(exp.Literal))):
+        if not _parameterizable(literal):
+            continue
+        name = f"__lit{i}"
+        values[name] = _literal_value(literal)
+        literal.replace(exp.Placeholder(this=name))
+    sql = tree.sql(dialect='tsql')
+    params = []
+
+    def to_marker(match):
+        params.append(values[match.group(1)])
+        return "?"
+
+    sql = re.sub(r"[:@](__lit\d+)\b", to_marker, sql)
+    return sql, params
+
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+_cache_stats = {"hits": 0, "misses": 0}
+
+
+def cached_result(key, generation):
+    """Cached result for a key, valid for the same generation and within the TTL."""
+    with _cache_lock:
+        entry = _cache.get(key)
+        if entry is not None and entry[0] == generation and time.monotonic() - entry[1] < CUSTOM_QUERY_CACHE_TTL:
+            _cache.move_to_end(key)
+            _cache_stats["hits"] += 1
+            return entry[2]
+        _cache_stats["misses"] += 1
+    return None
+
+
+def store_result(key, generation, result):
+    with _cache_lock:
+        _cache[key] = (generation, time.monotonic(), result)
+        _cache.move_to_end(key)
+        while len(_cache) > CUSTOM_QUERY_CACHE_SIZE:
+            _cache.popitem(last=False)
+
+
+def cache_status():
+    with _cache_lock:
+        return {"entries": len(_cache), "max_entries": CUSTOM_QUERY_CACHE_SIZE,
+                "ttl_seconds": CUSTOM_QUERY_CACHE_TTL, **_cache_stats}
@@ -0,0 +1,156 @@
+import bisect
+import difflib
+import threading
+import time
+
+from db_helper import execute_query, get_load_generation
+import snapshot
+
+# How often to check whether a new ETL load changed suburb_dim
+INDEX_REFRESH_SECONDS = 60
+
+
+def _trigrams(text):
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class SuburbIndex:
+    """In-memory prefix and trigram index over suburb_dim."""
+
+    def __init__(self, rows, generation=None):
+        self.generation = generation
+        self.names = {}
+        self.ids_by_key = {}
+        self.trigrams = {}
+        for suburb_id, name in rows:
+            if name is None:
+                continue
+            key = name.strip().lower()
+            self.names[int(suburb_id)] = name
+            self.ids_by_key.setdefault(key, set()).add(int(suburb_id))
+        self.keys = sorted(self.ids_by_key)
+        # Word starts, so "park" finds "Macquarie Park"
+        self.word_keys = sorted(
+            (word, key) for key in self.keys for word in key.split()[1:]
+        )
+        for key in self.keys:
+            for gram in _trigrams(key):
+                self.trigrams.setdefault(gram, set()).add(key)
+
+    def suburb_names(self):
+        return sorted(set(self.names.values()))
+
+    def prefix(self, query):
+        """Keys starting with the query, in alphabetical order."""
+        query = query.strip().lower()
+        start = bisect.bisect_left(self.keys, query)
+        matches = []
+        for key in self.keys[start:]:
+            if not key.startswith(query):
+                break
+            matches.append(key)
+        return matches
+
+    def word_prefix(self, query):
+        """Keys with a later word starting with the query."""
+        query = query.strip().lower()
+        start = bisect.bisect_left(self.word_keys, (query, ''))
+        matches = []
+        for word, key in self.word_keys[start:]:
+            if not word.startswith(query):
+                break
+            if key not in matches:
+                matches.append(key)
+        return matches
+
+    def contains(self, query):
+        """Keys containing the query anywhere, like SQL LIKE '%query%'."""
+        query = query.strip().lower()
+        if len(query) < 3:
+            return [key for key in self.keys if query in key]
+        grams = [g for g in _trigrams(query) if g.strip() and len(g.strip()) == 3]
+        if not grams:
+            return [key for key in self.keys if query in key]
+        candidates = set.intersection(*(self.trigrams.get(g, set()) for g in grams))
+        return sorted(key for key in candidates if query in key)
+
+    def fuzzy(self, query, limit=10, cutoff=0.6):
+        """Closest keys by edit similarity, for typos."""
+        query = query.strip().lower()
+        candidates = set()
+        for gram in _trigrams(query):
+            candidates |= self.trigrams.get(gram, set())
+        return difflib.get_close_matches(query, sorted(candidates) or self.keys, n=limit, cutoff=cutoff)
+
+    def resolve(self, query, fuzzy=False):
+        """Resolve a suburb search string to a set of suburb_ids."""
+        keys = self.contains(query)
+        if not keys and fuzzy:
+            keys = self.fuzzy(query)
+        ids = set()
+        for key in keys:
+            ids |= self.ids_by_key[key]
+        return ids
+
+    def autocomplete(self, query, limit=10, fuzzy=True):
+        """Ranked suggestions: prefix, then word prefix, then substring, then fuzzy."""
+        ranked = []
+        for match_type, keys in (
+            ('prefix', self.prefix(query)),
+            ('word_prefix', self.word_prefix(query)),
+            ('contains', self.contains(query)),
+            ('fuzzy', self.fuzzy(query, limit) if fuzzy else []),
+        ):
+            for key in keys:
+                if len(ranked) >= limit:
+                    break
+                if any(key == seen for seen, _ in ranked):
+                    continue
+                ranked.append((key, match_type))
+        suggestions = []
+        for key, match_type in ranked:
+            for suburb_id in sorted(self.ids_by_key[key]):
+                suggestions.append({
+                    "suburb_id": suburb_id,
+                    "SUBURB_NAME": self.names[suburb_id],
+                    "match": match_type
+                })
+        return suggestions[:limit]
+
+
+_lock = threading.Lock()
+_index = None
+_checked_at = 0.0
+
+def load():
+    """Build the index from the snapshot when active, otherwise from the database."""
+    global _index, _checked_at
+    snap = snapshot.current()
+    if snap is not None:
+        # No database round-trip: the snapshot carries its own generation
+        generation = snap.generation
+        df = snap['suburb_dim'][['suburb_id', 'SUBURB_NAME']]
+    else:
+        generation = get_load_generation()
+        df = execute_query("SELECT suburb_id, SUBURB_NAME FROM dbo.suburb_dim")
+    index = SuburbIndex(df.itertuples(index=False, name=None), generation)
+    with _lock:
+        _index = index
+        _checked_at = time.monotonic()
+    print(f"Loaded suburb index with {len(index.keys)} suburbs (generation {generation})")
+    return index
+
+def get_index():
+    """Get the suburb index, rebuilding it when a new ETL load is detected."""
+    global _checked_at
+    index = _index
+    if index is None:
+        return load()
+    if time.monotonic() - _checked_at > INDEX_REFRESH_SECONDS:
+        _checked_at = time.monotonic()
+        snap = snapshot.current()
+        generation = snap.generation if snap is not None else get_load_generation()
+        if generation != index.generation:
+            return load()
+    return index
@@ -0,0 +1,214 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+from flask import g, has_request_context, request
+from flask.json.provider import DefaultJSONProvider
+
+from db_helper import add_trace_hook
+import resilience
+
+# Request-level tracing.
+# Every request records total time, time in the database (and query count),
+# serialization time (DataFrame to records, and JSON encoding), rows fetched
+# and response bytes. Each request is:
+#   - logged as one JSON line on the 'backend.requests' logger
+#   - summarised in a Server-Timing header (visible in browser dev tools)
+#   - added to per-route histograms served at /metrics in OpenMetrics format
+# Queries slower than SLOW_QUERY_MS go to the 'backend.slow_queries' logger
+# with their parameters (and to SLOW_QUERY_LOG, if set).
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "500"))
+SLOW_QUERY_LOG = os.getenv("SLOW_QUERY_LOG")
+SLOW_QUERY_HISTORY = 100
+
+# Histogram buckets, in seconds
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+request_log = logging.getLogger('backend.requests')
+slow_query_log = logging.getLogger('backend.slow_queries')
+
+
+class RequestTrace:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.db_ms = 0.0
+        self.db_queries = 0
+        self.rows = 0
+        self.serialize_ms = 0.0
+
+
+class Histogram:
+    def __init__(self, buckets=DURATION_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+
+_metrics_lock = threading.Lock()
+_request_duration = {}   # (route, method) -> Histogram
+_db_duration = {}        # (route, method) -> Histogram
+_response_bytes = {}     # (route, method) -> total bytes
+_rows_returned = {}      # (route, method) -> total rows
+_slow_queries = deque(maxlen=SLOW_QUERY_HISTORY)
+_slow_query_total = 0
+
+
+def _on_db_event(event, elapsed_ms, rows, template=None, params=None):
+    global _slow_query_total
+    trace = g.get('trace') if has_request_context() else None
+    if event == 'serialize':
+        if trace is not None:
+            trace.serialize_ms += elapsed_ms
+        return
+    if trace is not None:
+        trace.db_ms += elapsed_ms
+        trace.db_queries += 1
+        trace.rows += rows
+    if elapsed_ms >= SLOW_QUERY_MS:
+        entry = {
+            "elapsed_ms": round(elapsed_ms, 2),
+            "rows": rows,
+            "query": template,
+            "params": [p if isinstance(p, (int, float, str, bool)) or p is None else str(p) for p in (params or [])],
+            "route": request.path if has_request_context() else None,
+            "at": time.time(),
+        }
+        with _metrics_lock:
+            _slow_queries.append(entry)
+            _slow_query_total += 1
+        slow_query_log.warning(json.dumps(entry))
+
+
+class TimedJSONProvider(DefaultJSONProvider):
+    """JSON provider that adds encoding time to the current request's trace."""
+
+    def dumps(self, obj, **kwargs):
+        start = time.perf_counter()
+        try:
+            return super().dumps(obj, **kwargs)
+        finally:
+            trace = g.get('trace') if has_request_context() else None
+            if trace is not None:
+                trace.serialize_ms += (time.perf_counter() - start) * 1000
+
+
+def _route_key():
+    rule = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    return rule, request.method
+
+
+def _start_trace():
+    g.trace = RequestTrace()
+
+
+def _finish_trace(response):
+    trace = g.get('trace')
+    if trace is None:
+        return response
+    total_ms = (time.perf_counter() - trace.start) * 1000
+    size = None if response.is_streamed else response.calculate_content_length()
+
+    response.headers['Server-Timing'] = ", ".join([
+        f'db;dur={trace.db_ms:.1f};desc="{trace.db_queries} queries"',
+        f'ser;dur={trace.serialize_ms:.1f}',
+        f'total;dur={total_ms:.1f}',
+    ])
+
+    key = _route_key()
+    with _metrics_lock:
+        _request_duration.setdefault(key, Histogram()).observe(total_ms / 1000)
+        _db_duration.setdefault(key, Histogram()).observe(trace.db_ms / 1000)
+        _response_bytes[key] = _response_bytes.get(key, 0) + (size or 0)
+        _rows_returned[key] = _rows_returned.get(key, 0) + trace.rows
+
+    request_log.info(json.dumps({
+        "method": request.method,
+        "path": request.path,
+        "route": key[0],
+        "status": response.status_code,
+        "total_ms": round(total_ms, 2),
+        "db_ms": round(trace.db_ms, 2),
+        "db_queries": trace.db_queries,
+        "serialize_ms": round(trace.serialize_ms, 2),
+        "rows": trace.rows,
+        "bytes": size,
+        "cache": response.headers.get('X-Cache'),
+    }))
+    return response
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(route, method, **extra):
+    labels = {'route': route, 'method': method, **extra}
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+
+def _histogram_lines(name, histograms):
+    lines = [f"# TYPE {name} histogram", f"# UNIT {name} seconds"]
+    for (route, method), histogram in sorted(histograms.items()):
+        for bound, count in zip(histogram.buckets, histogram.counts):
+            lines.append(f"{name}_bucket{_labels(route, method, le=bound)} {count}")
+        lines.append(f"{name}_bucket{_labels(route, method, le='+Inf')} {histogram.count}")
+        lines.append(f"{name}_count{_labels(route, method)} {histogram.count}")
+        lines.append(f"{name}_sum{_labels(route, method)} {histogram.sum:.6f}")
+    return lines
+
+
+def _counter_lines(name, values, unit=None):
+    lines = [f"# TYPE {name} counter"]
+    if unit:
+        lines.append(f"# UNIT {name} {unit}")
+    for (route, method), value in sorted(values.items()):
+        lines.append(f"{name}_total{_labels(route, method)} {value}")
+    return lines
+
+
+def render_metrics():
+    """All request metrics in OpenMetrics text format."""
+    with _metrics_lock:
+        lines = (
+            _histogram_lines('http_request_duration_seconds', _request_duration)
+            + _histogram_lines('http_request_db_duration_seconds', _db_duration)
+            + _counter_lines('http_response_bytes', _response_bytes, unit='bytes')
+            + _counter_lines('http_rows_returned', _rows_returned)
+            + ["# TYPE db_slow_queries counter", f"db_slow_queries_total {_slow_query_total}"]
+        )
+    lines += resilience.metrics_lines()
+    return "\n".join(lines) + "\n# EOF\n"
+
+
+def slow_queries():
+    with _metrics_lock:
+        return list(_slow_queries)
+
+
+def init_tracing(app):
+    """Trace every request. Call before init_compression so sizes are measured after compression."""
+    if not request_log.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        request_log.addHandler(handler)
+        request_log.setLevel(logging.INFO)
+    if SLOW_QUERY_LOG:
+        handler = logging.FileHandler(SLOW_QUERY_LOG)
+        handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+        slow_query_log.addHandler(handler)
+    app.json = TimedJSONProvider(app)
+    add_trace_hook(_on_db_event)
+    app.before_request(_start_trace)
+    app.after_request(_finish_trace)
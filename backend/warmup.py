@@ -0,0 +1,105 @@
+import os
+import threading
+import time
+
+from db_helper import current_generation, prefill_pool
+from compression import REVALIDATE_ENVIRON_KEY
+
+# Warm-up after startup and after every ETL load.
+# The connection pool is opened and the routes behind the dashboard's first
+# paint are requested through the app itself, so their responses land in the
+# response cache before a visitor asks. /api/ready reports when this is done.
+#
+#   WARMUP_ROUTES        - comma separated paths to pre-request (default below)
+#   WARMUP_POLL_SECONDS  - how often to check for a new load generation
+WARMUP_ROUTES = [
+    path.strip() for path in os.getenv("WARMUP_ROUTES", ",".join([
+        "/api/dashboard-data",
+        "/api/ev-distribution",
+        "/api/ev-price-scatter",
+        "/api/ev-range-scatter",
+        "/api/ev-efficiency-analysis",
+        "/api/energy-environmental-impact",
+    ])).split(",") if path.strip()
+]
+WARMUP_POLL_SECONDS = int(os.getenv("WARMUP_POLL_SECONDS", "60"))
+
+_lock = threading.Lock()
+_state = {
+    "ready": False,        # set once the first warm-up has finished
+    "warming": False,
+    "generation": None,
+    "started_at": None,
+    "finished_at": None,
+    "duration_ms": None,
+    "connections_opened": None,
+    "routes": {},
+    "error": None,
+}
+_watcher = None
+
+
+def warm_up(app, reason="manual"):
+    """Open the pool and pre-request WARMUP_ROUTES. Returns the warm-up status."""
+    with _lock:
+        if _state["warming"]:
+            return status()
+        _state["warming"] = True
+        _state["started_at"] = time.time()
+    start = time.perf_counter()
+    routes, error, opened = {}, None, None
+    generation = current_generation(max_age=0)
+    try:
+        opened = prefill_pool()
+        client = app.test_client()
+        for path in WARMUP_ROUTES:
+            route_start = time.perf_counter()
+            try:
+                # Recompute rather than get a stale entry back
+                response = client.get(path, environ_base={REVALIDATE_ENVIRON_KEY: True})
+                routes[path] = {"status": response.status_code,
+                                "ms": round((time.perf_counter() - route_start) * 1000, 1)}
+            except Exception as e:
+                routes[path] = {"status": None, "error": str(e)}
+    except Exception as e:
+        error = str(e)
+        print(f"Warm-up failed: {e}")
+    succeeded = error is None and all((r.get("status") or 500) < 500 for r in routes.values())
+    with _lock:
+        _state.update({
+            "ready": _state["ready"] or succeeded,
+            "warming": False,
+            "generation": generation,
+            "finished_at": time.time(),
+            "duration_ms": round((time.perf_counter() - start) * 1000, 1),
+            "connections_opened": opened,
+            "routes": routes,
+            "error": error,
+            "reason": reason,
+        })
+    print(f"Warm-up ({reason}) finished in {_state['duration_ms']} ms for generation {generation}")
+    return status()
+
+
+def _watch(app, poll_seconds):
+    warm_up(app, reason="startup")
+    while True:
+        time.sleep(poll_seconds)
+        try:
+            if current_generation() != _state["generation"] or not _state["ready"]:
+                warm_up(app, reason="new load generation" if _state["ready"] else "retry")
+        except Exception as e:
+            print(f"Error checking load generation for warm-up: {e}")
+
+
+def start(app, poll_seconds=WARMUP_POLL_SECONDS):
+    """Warm up in the background now, and again whenever a new ETL load is detected."""
+    global _watcher
+    if _watcher is None:
+        _watcher = threading.Thread(target=_watch, args=(app, poll_seconds), daemon=True)
+        _watcher.start()
+
+
+def status():
+    with _lock:
+        return {**_state, "routes": dict(_state["routes"])}
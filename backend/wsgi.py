@@ -0,0 +1,8 @@
+from app import app, start_services
+
+# WSGI entry point, e.g. `gunicorn --chdir backend wsgi:app`.
+# Each worker imports this module after forking and starts its background
+# services here, so requests (including the health probes) never wait for
+# them. Do not run gunicorn with --preload: threads started in the master
+# process do not survive the fork.
+start_services()
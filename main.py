@@ -1,28 +1,27 @@
 import os
-from azure.identity import DefaultAzureCredential
-from azure.storage.blob import BlobServiceClient, BlobClient, ContainerClient
-from dotenv import load_dotenv
-from sqlalchemy import create_engine, text
-from utils.datasetup import AzureDB
+from functools import lru_cache
+from utils.datasetup import AzureDB, get_engine, pool_status
+from utils.physical_design import update_statistics, time_probe_queries, report_timings, PhysicalDesignError
+from utils.schema_deploy import deploy_star_schema, SchemaDeploymentError
+from utils.schema_registry import conform_frame
 import pandas as pd
 
-# Load environment variables from .env file
-env_path = os.path.join(os.path.dirname(__file__), '..', 'src', '.env')
-load_dotenv(dotenv_path=env_path, override=True)
-print(f"Loaded .env from: {env_path}")
+# Settings, the engine and the Azure client are created lazily so importing this
+# module (tests, --help, tooling) does no credential discovery or network I/O.
 
-# Azure SQL Server database credentials
-server = os.environ.get('DB_SERVER', 'etluts04server.database.windows.net')
-database = os.environ.get('DB_DATABASE', 'etldb04')
-username = os.environ.get('DB_USERNAME', 'vikramdc')
-password = os.environ.get('DB_PASSWORD', 'Whyubuggin$19')
-driver = "ODBC Driver 18 for SQL Server"
-connection_string = (
-    f"mssql+pyodbc://{username}:{password}@{server}:1433/{database}"
-    f"?driver={driver}&Encrypt=yes&TrustServerCertificate=no&Connection+Timeout=30"
-)
-engine = create_engine(connection_string)
-azureDB = AzureDB(engine)
+@lru_cache(maxsize=None)
+def load_environment():
+    """Load environment variables from the .env file once."""
+    from dotenv import load_dotenv
+    env_path = os.path.join(os.path.dirname(__file__), '..', 'src', '.env')
+    load_dotenv(dotenv_path=env_path, override=True)
+    print(f"Loaded .env from: {env_path}")
+
+@lru_cache(maxsize=None)
+def get_azure_db():
+    """Create the AzureDB helper on first use, sharing the ETL engine."""
+    load_environment()
+    return AzureDB(get_engine())
 
 def extract_data(azureDB):
     """Extract data from CSV files"""
@@ -239,65 +238,54 @@ def create_fact_tables(final_df, suburb_dim, vehicle_dim, fuel_dim, time_dim):
         'EV_PER_ENERGY_UNIT': final_df_with_keys['EV_PER_ENERGY_UNIT'],
         'NO2_PER_EV': final_df_with_keys['NO2_PER_EV']
     })
-    # Clean float columns for SQL Server compatibility.
-    float_cols = energy_fact.select_dtypes(include=['float', 'float64']).columns
-    energy_fact[float_cols] = energy_fact[float_cols].replace([float('inf'), float('-inf')], 0.0)
-    energy_fact[float_cols] = energy_fact[float_cols].fillna(0.0)
-    energy_fact[float_cols] = energy_fact[float_cols].round(6)
+    # Conform to the typed schema registry (compact types, rounding, inf/NaN defaults)
+    ev_fact = conform_frame('ev_fact', ev_fact)
+    energy_fact = conform_frame('energy_fact', energy_fact)
     ev_fact.to_csv('ev_fact.csv', index=False)
     energy_fact.to_csv('energy_fact.csv', index=False)
     return ev_fact, energy_fact
 
 
-def load_to_azure(azureDB,ev_fact, energy_fact,suburb_dim, vehicle_dim, fuel_dim,time_dim):
+def load_to_azure(azureDB,ev_fact, energy_fact,suburb_dim, vehicle_dim, fuel_dim,time_dim, columnstore=False):
     print("\n=== LOADING DATA TO AZURE ===")
     
-    # Clear existing tables in the database
-    with engine.connect() as con:
-        for fact_table in ['ev_fact', 'energy_fact']:
-            try:
-                con.execute(text(f"DROP TABLE IF EXISTS [dbo].[{fact_table}]"))
-                print(f"Dropped {fact_table} if it existed.")
-            except Exception as e:
-                print(f"Could not drop {fact_table}: {e}")
+    engine = azureDB.engine
     suburb_dim = suburb_dim.drop_duplicates(subset=['suburb_id'])
     vehicle_dim = vehicle_dim.drop_duplicates(subset=['vehicle_id'])
     fuel_dim = fuel_dim.drop_duplicates(subset=['fuel_id'])
     time_dim = time_dim.drop_duplicates(subset=['time_id'])
 
-    azureDB.upload_dataframe_sqldatabase("suburb_dim", suburb_dim)
-    azureDB.upload_dataframe_sqldatabase("vehicle_dim", vehicle_dim)
-    azureDB.upload_dataframe_sqldatabase("fuel_dim", fuel_dim)
-    azureDB.upload_dataframe_sqldatabase("time_dim", time_dim)
-    azureDB.upload_dataframe_sqldatabase("ev_fact", ev_fact)
-    azureDB.upload_dataframe_sqldatabase("energy_fact", energy_fact)
+    # Tables are created with their PKs and trusted FKs, loaded, then indexed
+    # (FK/covering indexes, optional columnstore), all in one transaction
+    frames = {
+        'suburb_dim': suburb_dim,
+        'vehicle_dim': vehicle_dim,
+        'fuel_dim': fuel_dim,
+        'time_dim': time_dim,
+        'ev_fact': ev_fact,
+        'energy_fact': energy_fact
+    }
+    timings = {}
+    try:
+        deploy_star_schema(engine, frames, columnstore=columnstore,
+                           on_loaded=lambda con: timings.update(before=time_probe_queries(con)))
+    except SchemaDeploymentError as e:
+        print(e)
+        raise
+
+    # A failure raises, so the load generation is not recorded
+    failures = update_statistics(engine)
+    if failures:
+        raise PhysicalDesignError(failures)
+    report_timings(timings['before'], time_probe_queries(engine))
 
-    # Add foreign key constraints
-    with engine.connect() as con:
-        fact_tables = ['ev_fact', 'energy_fact']
-        dimension_tables = [
-            ('suburb_id', 'suburb_dim'),
-            ('vehicle_id', 'vehicle_dim'),
-            ('fuel_id', 'fuel_dim'),
-            ('time_id', 'time_dim')
-        ]
-        for fact_table in fact_tables:
-            for id_column, dim_table in dimension_tables:
-                try:
-                    con.execute(
-                        text(
-                            f'ALTER TABLE [dbo].[{fact_table}] WITH NOCHECK ADD CONSTRAINT [FK_{fact_table}_{id_column}_dim] '
-                            f'FOREIGN KEY ([{id_column}]) REFERENCES [dbo].[{dim_table}] ([{id_column}]) '
-                            'ON UPDATE CASCADE ON DELETE CASCADE;'
-                        )
-                    )
-                    print(f"Added FK constraint FK_{fact_table}_{id_column}_dim")
-                except Exception as e:
-                    print(f"Could not add FK constraint FK_{fact_table}_{id_column}_dim: {e}")
+    azureDB.record_load_generation()
+    print("Connection pool:", pool_status(engine))
     print("All tables loaded to Azure SQL Database GOOD STUFF!")
     
 
 def main():
+    azureDB = get_azure_db()
     # Initialize the blob container client before extracting data
     azureDB.access_container(os.environ.get('CONTAINER_NAME', 'etlblob04'))
 
@@ -346,7 +334,8 @@ def main():
     print("Energy vs Pollution Fact Table:")
     print(energy_fact.head(), "\n")
     
-    load_to_azure(azureDB, ev_fact, energy_fact, suburb_dim, vehicle_dim, fuel_dim, time_dim)
+    load_to_azure(azureDB, ev_fact, energy_fact, suburb_dim, vehicle_dim, fuel_dim, time_dim,
+                  columnstore=os.environ.get('FACT_COLUMNSTORE', '').lower() in ('1', 'true', 'yes'))
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,11 @@
+import os
+import sys
+
+# The backend modules import each other by bare name (they run from backend/).
+# The root goes first, as db_helper arranges, so `utils` is the ETL package
+# rather than backend/utils.py.
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (os.path.join(ROOT, 'backend'), ROOT):
+    if path in sys.path:
+        sys.path.remove(path)
+    sys.path.insert(0, path)
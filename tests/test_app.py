@@ -0,0 +1,48 @@
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("flask")
+pytest.importorskip("flask_cors")
+pytest.importorskip("pyodbc")
+pytest.importorskip("pandas")
+pytest.importorskip("dotenv")
+
+import app as backend_app  # noqa: E402
+
+
+@pytest.fixture
+def fresh_services(monkeypatch):
+    """start_services() not yet called; the startup work blocks until released."""
+    release, calls = threading.Event(), []
+
+    def load_services():
+        calls.append(1)
+        release.wait(5)
+
+    monkeypatch.setattr(backend_app, '_services_started', False)
+    monkeypatch.setattr(backend_app, '_load_services', load_services)
+    yield calls
+    release.set()
+
+
+def test_start_services_runs_once_without_blocking(fresh_services):
+    backend_app.start_services()
+    backend_app.start_services()
+    # Both calls returned while the startup work is still blocked
+    deadline = time.monotonic() + 5
+    while not fresh_services and time.monotonic() < deadline:
+        time.sleep(0.001)
+    assert fresh_services == [1]
+
+
+@pytest.mark.parametrize("path", ["/api/live", "/api/health"])
+def test_liveness_probes_do_no_database_work_on_a_new_worker(monkeypatch, fresh_services, path):
+    import resilience
+    connects = []
+    monkeypatch.setattr(resilience, 'connection_factory', lambda conn_str: connects.append(conn_str))
+    response = backend_app.app.test_client().get(path)
+    assert response.status_code == 200
+    assert connects == []
+    assert fresh_services == []
@@ -0,0 +1,60 @@
+import gzip
+
+import pytest
+
+pytest.importorskip("flask")
+pytest.importorskip("pyodbc")
+pytest.importorskip("pandas")
+pytest.importorskip("dotenv")
+
+import compression  # noqa: E402
+
+
+@pytest.fixture
+def all_codecs(monkeypatch):
+    """Pretend brotli and zstandard are installed; only their presence matters to negotiation."""
+    monkeypatch.setattr(compression, 'brotli', object())
+    monkeypatch.setattr(compression, 'zstandard', object())
+
+
+@pytest.fixture
+def gzip_only(monkeypatch):
+    monkeypatch.setattr(compression, 'brotli', None)
+    monkeypatch.setattr(compression, 'zstandard', None)
+
+
+@pytest.mark.parametrize("header, expected", [
+    (None, None),
+    ('', None),
+    ('identity', None),
+    ('gzip', 'gzip'),
+    ('gzip, deflate, br', 'br'),
+    ('gzip, br, zstd', 'zstd'),
+    ('GZIP, Br', 'br'),
+    ('br;q=0.5, gzip;q=0.8', 'gzip'),
+    ('zstd;q=0, br;q=0, gzip', 'gzip'),
+    ('*', 'zstd'),
+    ('*;q=0.1, gzip;q=0.5', 'gzip'),
+    ('br;q=bogus, gzip', 'gzip'),
+    ('gzip;q=0', None),
+])
+def test_negotiate_encoding(all_codecs, header, expected):
+    assert compression.negotiate_encoding(header) == expected
+
+
+def test_negotiate_encoding_ignores_codecs_that_are_not_installed(gzip_only):
+    assert compression.negotiate_encoding('zstd, br') is None
+    assert compression.negotiate_encoding('zstd, br, gzip;q=0.1') == 'gzip'
+    assert compression.negotiate_encoding('*') == 'gzip'
+
+
+def test_gzip_round_trips_whole_and_streamed():
+    data = b'{"rows": [1, 2, 3]}\n' * 200
+    assert gzip.decompress(compression.compress(data, 'gzip')) == data
+    chunks = [data[:1000], data[1000:].decode('utf-8')]
+    assert gzip.decompress(b''.join(compression._compress_stream(chunks, 'gzip'))) == data
+
+
+def test_unknown_encoding_is_rejected():
+    with pytest.raises(ValueError):
+        compression.compress(b'data', 'deflate')
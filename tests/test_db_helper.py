@@ -0,0 +1,140 @@
+import pytest
+
+pytest.importorskip("pyodbc")
+pytest.importorskip("pandas")
+pytest.importorskip("dotenv")
+
+import db_helper  # noqa: E402
+import resilience  # noqa: E402
+
+
+class FakeConnection:
+    autocommit = False
+    timeout = 0
+
+    def cursor(self):
+        raise AssertionError("the connection should never be reached")
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def timing_out_database(monkeypatch):
+    """Every connect raises HYT00; a fresh, closed breaker; an empty pool."""
+    faults = resilience.FaultInjectingConnectionFactory(lambda conn_str: FakeConnection(), rate=1.0,
+                                                        sqlstate='HYT00')
+    breaker = resilience.CircuitBreaker(failure_threshold=5)
+    monkeypatch.setattr(resilience, 'connection_factory', faults)
+    monkeypatch.setattr(resilience, 'db_breaker', breaker)
+    monkeypatch.setattr(resilience, 'DB_RETRY_ATTEMPTS', 2)
+    monkeypatch.setattr(db_helper, '_pool', db_helper.queue.LifoQueue())
+    return faults, breaker
+
+
+def test_governed_query_timeouts_run_once_and_leave_the_breaker_closed(timing_out_database):
+    faults, breaker = timing_out_database
+    for _ in range(5):
+        with pytest.raises(Exception):
+            db_helper.execute_limited("SELECT * FROM dbo.ev_fact", max_rows=10, timeout=1)
+    assert faults.injected == 5
+    assert breaker.status()["failures"] == 0
+    assert not breaker.is_open()
+
+
+def test_cost_estimate_timeouts_are_not_retried(timing_out_database):
+    faults, breaker = timing_out_database
+    with pytest.raises(Exception):
+        db_helper.estimate_query_cost("SELECT * FROM dbo.ev_fact")
+    assert faults.injected == 1
+    assert breaker.status()["failures"] == 0
+
+
+def test_single_flight_shares_one_execution_and_no_dataframe():
+    import threading
+    import time
+    import pandas as pd
+
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def run():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return pd.DataFrame({'x': [1, 2]})
+
+    results = []
+    key = ('SELECT x FROM t WHERE y = ?', (1,))
+    coalesced = db_helper.single_flight_status()["coalesced"]
+    leader = threading.Thread(target=lambda: results.append(db_helper.single_flight(key, run)))
+    leader.start()
+    started.wait(5)
+    followers = [threading.Thread(target=lambda: results.append(db_helper.single_flight(key, run)))
+                 for _ in range(3)]
+    for thread in followers:
+        thread.start()
+    # Followers register before the leader finishes
+    deadline = time.monotonic() + 5
+    while db_helper.single_flight_status()["coalesced"] < coalesced + 3 and time.monotonic() < deadline:
+        time.sleep(0.001)
+    release.set()
+    for thread in [leader] + followers:
+        thread.join(5)
+
+    assert len(calls) == 1
+    assert len(results) == 4
+    assert len({id(frame) for frame in results}) == 4
+    results[0].loc[0, 'x'] = 99
+    assert all(frame.loc[0, 'x'] == 1 for frame in results[1:])
+
+
+def test_single_flight_leader_keeps_result_without_followers():
+    frame = object()
+    assert db_helper.single_flight(('q', ()), lambda: frame) is frame
+
+
+class RecordingCursor:
+    description = None
+
+    def __init__(self, executed):
+        self.executed = executed
+
+    def execute(self, sql, params):
+        self.executed.append(sql)
+
+    def close(self):
+        pass
+
+
+class RecordingConnection(FakeConnection):
+    def __init__(self, executed):
+        self.executed = executed
+
+    def cursor(self):
+        return RecordingCursor(self.executed)
+
+
+@pytest.fixture
+def recording_database(monkeypatch):
+    """A database that records the SQL text it is asked to execute."""
+    executed = []
+    monkeypatch.setattr(resilience, 'connection_factory', lambda conn_str: RecordingConnection(executed))
+    monkeypatch.setattr(resilience, 'db_breaker', resilience.CircuitBreaker(failure_threshold=5))
+    monkeypatch.setattr(db_helper, '_pool', db_helper.queue.LifoQueue())
+    return executed
+
+
+QUERY_WITH_COMMENT_AND_LITERAL = "SELECT a, 'x   y' AS b -- note\nFROM dbo.t\nWHERE c = ?\nORDER BY a"
+
+
+@pytest.mark.parametrize("run", [
+    lambda: db_helper.execute_query(QUERY_WITH_COMMENT_AND_LITERAL, [1]),
+    lambda: db_helper.execute_limited(QUERY_WITH_COMMENT_AND_LITERAL, [1], max_rows=10),
+    lambda: list(db_helper.iter_query_batches(QUERY_WITH_COMMENT_AND_LITERAL, [1])),
+])
+def test_queries_are_executed_as_written(recording_database, run):
+    run()
+    assert recording_database == [QUERY_WITH_COMMENT_AND_LITERAL]
+    templates = [entry["template"] for entry in db_helper.get_query_stats()]
+    assert db_helper.normalize_template(QUERY_WITH_COMMENT_AND_LITERAL) in templates
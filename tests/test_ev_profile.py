@@ -0,0 +1,43 @@
+import pytest
+
+pytest.importorskip("pyodbc")
+pd = pytest.importorskip("pandas")
+pytest.importorskip("dotenv")
+
+import ev_profile  # noqa: E402
+
+
+@pytest.fixture
+def profile_source(monkeypatch):
+    """Count profile computations; each one checks that the lock is free while it runs."""
+    computed = []
+
+    def query(name, sql):
+        assert ev_profile._lock.acquire(blocking=False), "the lock is held during the computation"
+        ev_profile._lock.release()
+        computed.append(name)
+        return pd.DataFrame({'SUBURB_NAME': ['Avalon'], 'total_evs': [len(computed)]})
+
+    monkeypatch.setattr(ev_profile.snapshot, 'query', query)
+    monkeypatch.setattr(ev_profile, '_state', {"generation": None, "frame": None, "computed_at": None,
+                                               "compute_ms": None})
+    return computed
+
+
+def test_profile_is_built_once_per_generation(monkeypatch, profile_source):
+    monkeypatch.setattr(ev_profile, 'current_generation', lambda: 3)
+    first = ev_profile.profile()
+    assert ev_profile.profile() is first
+    assert profile_source == ['ev_suburb_profile']
+    assert ev_profile.status()["generation"] == 3
+
+    monkeypatch.setattr(ev_profile, 'current_generation', lambda: 4)
+    assert ev_profile.profile()['total_evs'].tolist() == [2]
+
+
+def test_profile_is_not_cached_without_a_generation(monkeypatch, profile_source):
+    monkeypatch.setattr(ev_profile, 'current_generation', lambda: None)
+    ev_profile.profile()
+    ev_profile.profile()
+    assert len(profile_source) == 2
+    assert ev_profile.status()["suburbs"] is None
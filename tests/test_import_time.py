@@ -0,0 +1,30 @@
+import subprocess
+import sys
+
+import pytest
+
+pytest.importorskip("pandas")
+pytest.importorskip("sqlalchemy")
+
+from utils.import_benchmark import DEFAULT_BUDGETS_MS, ROOT, measure_import  # noqa: E402
+
+# Clients and drivers that must only be loaded on first use, not at import
+DEFERRED_MODULES = ('dotenv', 'pyodbc', 'azure.identity', 'azure.storage.blob')
+
+
+@pytest.mark.parametrize("module", sorted(DEFAULT_BUDGETS_MS))
+def test_import_time_is_within_budget(module):
+    total_ms, timings = measure_import(module)
+    slowest = sorted(timings, key=lambda t: t[1], reverse=True)[:5]
+    assert total_ms <= DEFAULT_BUDGETS_MS[module], f"{module}: {total_ms:.1f} ms; slowest: {slowest}"
+
+
+@pytest.mark.parametrize("module", sorted(DEFAULT_BUDGETS_MS))
+def test_import_defers_clients_and_drivers(module):
+    proc = subprocess.run(
+        [sys.executable, '-c', f"import sys, {module}; "
+                               f"print(','.join(m for m in {DEFERRED_MODULES!r} if m in sys.modules))"],
+        cwd=ROOT, capture_output=True, text=True
+    )
+    assert proc.returncode == 0, proc.stderr[-2000:]
+    assert proc.stdout.strip() == ''
@@ -0,0 +1,46 @@
+import pytest
+
+pytest.importorskip("pyodbc")
+pytest.importorskip("pandas")
+pytest.importorskip("dotenv")
+
+import jobs  # noqa: E402
+
+
+@pytest.fixture
+def results_dir(monkeypatch, tmp_path):
+    monkeypatch.setattr(jobs, 'JOB_RESULTS_DIR', str(tmp_path))
+    monkeypatch.setattr(jobs, '_jobs', {})
+    return tmp_path
+
+
+def _queued_job():
+    job = jobs.Job('query', 'test', 'SELECT a FROM dbo.t', [], 'csv')
+    jobs._jobs[job.id] = job
+    return job
+
+
+def test_job_writes_its_result(monkeypatch, results_dir):
+    monkeypatch.setattr(jobs, 'iter_query_batches', lambda *a, **k: iter([([('a', int)], [(1,), (2,)], False)]))
+    job = _queued_job()
+    jobs._run(job)
+    assert job.status == 'succeeded'
+    assert open(job.path).read().split() == ['a', '1', '2']
+
+
+def test_cancelling_a_running_job_publishes_no_result(monkeypatch, results_dir):
+    deleted = []
+
+    def batches(*args, **kwargs):
+        yield [('a', int)], [(1,)], False
+        # DELETE arrives after the last batch, while the file is being finished
+        deleted.append(jobs.cancel(job.id).to_dict()["status"])
+
+    monkeypatch.setattr(jobs, 'iter_query_batches', batches)
+    job = _queued_job()
+    jobs._run(job)
+    assert deleted == ['cancelling']
+    assert job.status == 'cancelled'
+    assert job.path is None
+    assert list(results_dir.iterdir()) == []
+    assert jobs.get(job.id) is None
@@ -0,0 +1,52 @@
+import pytest
+
+pd = pytest.importorskip("pandas")
+
+from query_builder import EV_DISTRIBUTION, build_top_n_pivot_query, series_payload, top_n_pivot_frame  # noqa: E402
+
+
+def _normalized(query):
+    return ' '.join(query.split())
+
+
+def test_query_pivots_each_series_with_a_parameter():
+    query, params = build_top_n_pivot_query(EV_DISTRIBUTION, 10)
+    assert params == [10, 'BEV', 'PHEV']
+    assert _normalized(query) == (
+        "SELECT TOP (?) s.SUBURB_NAME as label, "
+        "SUM(CASE WHEN e.FUEL_TYPE = ? THEN e.TOTAL_EVs ELSE 0 END) as series_0, "
+        "SUM(CASE WHEN e.FUEL_TYPE = ? THEN e.TOTAL_EVs ELSE 0 END) as series_1, "
+        "SUM(e.TOTAL_EVs) as total "
+        "FROM dbo.ev_fact e JOIN dbo.suburb_dim s ON e.suburb_id = s.suburb_id "
+        "WHERE e.TOTAL_EVs IS NOT NULL AND e.TOTAL_EVs > 0 "
+        "GROUP BY s.SUBURB_NAME ORDER BY total DESC, label"
+    )
+
+
+def test_query_without_where_has_no_where_clause():
+    spec = EV_DISTRIBUTION._replace(where=())
+    query, params = build_top_n_pivot_query(spec, '5')
+    assert "WHERE" not in query
+    assert params[0] == 5
+
+
+def test_frame_matches_query_semantics():
+    df = pd.DataFrame({
+        'SUBURB_NAME': ['Carlton', 'Carlton', 'Bondi', 'Bondi', 'Avalon', 'Manly'],
+        'FUEL_TYPE': ['BEV', 'PHEV', 'BEV', 'HEV', 'PHEV', 'BEV'],
+        'TOTAL_EVs': [5, 3, 8, 4, 12, 1],
+    })
+    out = top_n_pivot_frame(df, EV_DISTRIBUTION, 3)
+    # Ties on the total (Bondi and Avalon) are broken by label, as in ORDER BY total DESC, label
+    assert out['label'].tolist() == ['Avalon', 'Bondi', 'Carlton']
+    assert out['series_0'].tolist() == [0, 8, 5]
+    assert out['series_1'].tolist() == [12, 0, 3]
+    # Unpivoted values still count toward the total
+    assert out['total'].tolist() == [12, 12, 8]
+
+
+def test_series_payload_uses_spec_keys_and_integers_when_whole():
+    df = pd.DataFrame({'label': ['A', 'B'], 'series_0': [2.0, None], 'series_1': [1.5, 3.0]})
+    payload = series_payload(df, EV_DISTRIBUTION)
+    assert payload == {'labels': ['A', 'B'], 'bev_data': [2, 0], 'phev_data': [1.5, 3.0]}
+    assert all(isinstance(v, int) for v in payload['bev_data'])
@@ -0,0 +1,140 @@
+import pytest
+
+pyodbc = pytest.importorskip("pyodbc")
+
+import resilience  # noqa: E402
+from resilience import CircuitBreaker, CircuitOpenError, FaultInjectingConnectionFactory  # noqa: E402
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeCursor:
+    def __init__(self):
+        self.executed = []
+
+    def execute(self, sql, *params):
+        self.executed.append(sql)
+        return self
+
+    def fetchone(self):
+        return (1,)
+
+
+class FakeConnection:
+    def cursor(self):
+        return FakeCursor()
+
+
+def fake_factory(conn_str):
+    return FakeConnection()
+
+
+def query_through(factory):
+    """A unit of work like db_helper's: connect, then execute once."""
+    def run():
+        cursor = factory("DSN=test").cursor()
+        cursor.execute("SELECT 1")
+        return cursor.fetchone()
+    return run
+
+
+def no_sleep(seconds):
+    pass
+
+
+@pytest.fixture
+def breaker():
+    return CircuitBreaker(failure_threshold=3, reset_seconds=30, clock=FakeClock())
+
+
+def test_transient_errors_are_retried_until_success(breaker):
+    faults = FaultInjectingConnectionFactory(fake_factory, fail_next=2, sqlstate='08S01')
+    assert resilience.call(query_through(faults), breaker=breaker, retries=2, sleep=no_sleep) == (1,)
+    assert faults.injected == 2
+    status = breaker.status()
+    assert status["retries"] == 2
+    assert status["failures"] == 0
+    assert status["state"] == CircuitBreaker.CLOSED
+
+
+def test_exhausted_retries_count_one_failure(breaker):
+    faults = FaultInjectingConnectionFactory(fake_factory, fail_next=10, sqlstate='08S01')
+    with pytest.raises(pyodbc.OperationalError):
+        resilience.call(query_through(faults), breaker=breaker, retries=2, sleep=no_sleep)
+    assert faults.injected == 3
+    assert breaker.status()["failures"] == 1
+
+
+def test_timeouts_are_not_retried_or_counted(breaker):
+    faults = FaultInjectingConnectionFactory(fake_factory, rate=1.0, sqlstate='HYT00')
+    for _ in range(5):
+        with pytest.raises(pyodbc.OperationalError):
+            resilience.call(query_through(faults), breaker=breaker, retries=2, sleep=no_sleep)
+    # One execution per call, and the breaker never opens
+    assert faults.injected == 5
+    status = breaker.status()
+    assert status["failures"] == 0
+    assert status["retries"] == 0
+    assert status["state"] == CircuitBreaker.CLOSED
+
+
+def test_non_transient_errors_are_raised_at_once(breaker):
+    def run():
+        raise pyodbc.ProgrammingError('42S02', "[42S02] Invalid object name 'missing'. (208)")
+    with pytest.raises(pyodbc.ProgrammingError):
+        resilience.call(run, breaker=breaker, retries=2, sleep=no_sleep)
+    assert breaker.status()["failures"] == 0
+
+
+def test_breaker_opens_fails_fast_and_recovers_after_a_trial(breaker):
+    faults = FaultInjectingConnectionFactory(fake_factory, fail_next=3, sqlstate='08S01')
+    for _ in range(3):
+        with pytest.raises(pyodbc.OperationalError):
+            resilience.call(query_through(faults), breaker=breaker, retries=0)
+    assert breaker.is_open()
+
+    calls = []
+    with pytest.raises(CircuitOpenError):
+        resilience.call(lambda: calls.append(1), breaker=breaker)
+    assert calls == []
+
+    breaker.clock.now += 30
+    # Half-open: exactly one trial goes through
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.status()["state"] == CircuitBreaker.CLOSED
+    assert resilience.call(query_through(faults), breaker=breaker) == (1,)
+
+
+def test_failed_trial_reopens_the_breaker(breaker):
+    for _ in range(3):
+        breaker.record_failure()
+    breaker.clock.now += 30
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.is_open()
+    assert breaker.status()["opened"] == 2
+
+
+@pytest.mark.parametrize("sqlstate, message, transient", [
+    ('08S01', "[08S01] Communication link failure", True),
+    ('42000', "[42000] Resource ID : 1. The request limit for the database is 30 (10928)", True),
+    ('40001', "[40001] Transaction was deadlocked (1205)", True),
+    ('HYT00', "[HYT00] Query timeout expired (0)", False),
+    ('HYT01', "[HYT01] Connection timeout expired (0)", False),
+    ('42S02', "[42S02] Invalid object name 'x'. (208)", False),
+])
+def test_is_transient(sqlstate, message, transient):
+    assert resilience.is_transient(pyodbc.OperationalError(sqlstate, message)) is transient
+
+
+def test_fault_spec_parsing():
+    faults = FaultInjectingConnectionFactory.from_spec("rate=0.25,sqlstate=HYT00,latency=0.5,fail_next=2")
+    assert (faults.rate, faults.sqlstate, faults.latency, faults.fail_next) == (0.25, 'HYT00', 0.5, 2)
@@ -0,0 +1,35 @@
+import pytest
+
+pd = pytest.importorskip("pandas")
+pytest.importorskip("sqlalchemy")
+
+from utils.schema_deploy import SchemaDeploymentError, add_unknown_members  # noqa: E402
+
+SCHEMA = {
+    'vehicle_dim': {},
+    'ev_fact': {'foreign_keys': {'vehicle_id': 'vehicle_dim'}},
+}
+
+
+@pytest.mark.parametrize("text_dtype", [object, 'string'])
+def test_unknown_member_labels_text_columns(text_dtype):
+    frames = {
+        'vehicle_dim': pd.DataFrame({'vehicle_id': [1, 2], 'MAKE': pd.Series(['Tesla', 'BYD'], dtype=text_dtype),
+                                     'RANGE_KM': [500.0, 420.0]}),
+        'ev_fact': pd.DataFrame({'vehicle_id': [0, 1, 2]}),
+    }
+    dim = add_unknown_members(frames, SCHEMA)['vehicle_dim']
+    unknown = dim[dim['vehicle_id'] == 0].iloc[0]
+    assert unknown['MAKE'] == 'Unknown'
+    assert pd.isna(unknown['RANGE_KM'])
+    assert dim['vehicle_id'].dtype == frames['vehicle_dim']['vehicle_id'].dtype
+    assert len(frames['vehicle_dim']) == 2
+
+
+def test_keys_missing_from_the_dimension_are_rejected():
+    frames = {
+        'vehicle_dim': pd.DataFrame({'vehicle_id': [1], 'MAKE': ['Tesla']}),
+        'ev_fact': pd.DataFrame({'vehicle_id': [1, 7]}),
+    }
+    with pytest.raises(SchemaDeploymentError):
+        add_unknown_members(frames, SCHEMA)
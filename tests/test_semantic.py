@@ -0,0 +1,146 @@
+import pytest
+
+pytest.importorskip("pyodbc")
+pytest.importorskip("pandas")
+pytest.importorskip("dotenv")
+
+import semantic  # noqa: E402
+
+
+def test_single_fact_groups_and_rounds_in_sql():
+    sql, params = semantic.compile_query(['avg_energy'], dimensions=['year'])
+    assert sql == (
+        "WITH q0 AS (SELECT t.YEAR as [YEAR], AVG(CAST(f.[ENERGY_CONSUMPTION] AS FLOAT)) as [avg_energy] "
+        "FROM dbo.energy_fact f JOIN dbo.time_dim t ON f.time_id = t.time_id GROUP BY t.YEAR) "
+        "SELECT q0.[YEAR] as [YEAR], ROUND(q0.[avg_energy], 2) as [avg_energy] FROM q0"
+    )
+    assert params == []
+
+
+def test_measures_from_two_facts_join_on_dimensions():
+    sql, _ = semantic.compile_query(['avg_energy', 'total_evs'], dimensions=['suburb'])
+    assert "q0 AS (SELECT s.SUBURB_NAME as [SUBURB_NAME], AVG(" in sql
+    assert "q1 AS (SELECT s.SUBURB_NAME as [SUBURB_NAME], SUM(f.[TOTAL_EVs]) as [total_evs] FROM dbo.ev_fact f" in sql
+    assert "COALESCE(q0.[SUBURB_NAME], q1.[SUBURB_NAME]) as [SUBURB_NAME]" in sql
+    assert sql.endswith("FROM q0 FULL OUTER JOIN q1 ON q0.[SUBURB_NAME] = q1.[SUBURB_NAME]")
+
+
+def test_measures_from_two_facts_without_dimensions_cross_join():
+    sql, _ = semantic.compile_query(['energy_records', 'ev_records'])
+    assert sql.endswith("FROM q0 CROSS JOIN q1")
+    assert "GROUP BY" not in sql
+
+
+def test_filters_having_order_and_limit_are_parameters_in_order():
+    sql, params = semantic.compile_query(
+        ['total_evs'], dimensions=['suburb'],
+        filters=[('year', 'in', [2022, 2023]), ('ev_fact.AVG_PRICE', 'not_null', None)],
+        having=[('total_evs', '>', 10)], order_by=['-total_evs', 'suburb'], limit=5,
+    )
+    assert "WHERE t.YEAR IN (?, ?) AND f.[AVG_PRICE] IS NOT NULL" in sql
+    assert "SELECT TOP (?) " in sql
+    assert "WHERE q0.[total_evs] > ?" in sql
+    assert sql.endswith("ORDER BY q0.[total_evs] DESC, q0.[SUBURB_NAME] ASC")
+    assert params == [2022, 2023, 5, 10]
+
+
+def test_fact_column_filter_applies_only_to_its_fact():
+    sql, params = semantic.compile_query(['avg_energy', 'total_evs'], filters=[('ev_fact.FUEL_TYPE', '=', 'BEV')])
+    energy_cte, ev_cte = sql.split("), q1 AS (")
+    assert "WHERE" not in energy_cte
+    assert "WHERE f.[FUEL_TYPE] = ?" in ev_cte
+    assert params == ['BEV']
+
+
+def test_measure_reference_overrides_alias_and_rounding():
+    sql, _ = semantic.compile_query([semantic.measure('avg_price', alias='price', decimals=None)])
+    assert "AVG(CAST(f.[AVG_PRICE] AS FLOAT)) as [price]" in sql
+    assert "SELECT q0.[price] as [price] FROM q0" in sql
+
+
+@pytest.mark.parametrize("kwargs", [
+    dict(measures=['no_such_measure']),
+    dict(measures=['avg_energy'], dimensions=['colour']),
+    dict(measures=['avg_energy'], filters=[('year', 'like', 2023)]),
+    dict(measures=['avg_energy'], filters=[('energy_fact.NOPE', '=', 1)]),
+    dict(measures=['avg_energy'], having=[('total_evs', '>', 1)]),
+    dict(measures=['avg_energy'], order_by=['suburb']),
+])
+def test_invalid_queries_are_rejected(kwargs):
+    with pytest.raises(ValueError):
+        semantic.compile_query(**kwargs)
+
+
+def test_cube_lists_every_subset_finest_first():
+    assert semantic.cube(['fuel', 'year']) == [('fuel', 'year'), ('year',), ('fuel',), ()]
+
+
+def test_grouping_sets_compile_to_one_scan_per_fact():
+    sql, params, dimensions = semantic.compile_grouping_sets(
+        'energy_fact', ['avg_energy', 'total_evs'], [('year',), ('suburb', 'year'), ()],
+        filters=[('year', '>=', 2020)],
+    )
+    assert dimensions == ['year', 'suburb']
+    assert sql == (
+        "SELECT t.YEAR as [YEAR], s.SUBURB_NAME as [SUBURB_NAME], "
+        "GROUPING_ID(t.YEAR, s.SUBURB_NAME) as [_grouping_id], "
+        "ROUND(AVG(CAST(f.[ENERGY_CONSUMPTION] AS FLOAT)), 2) as [avg_energy] "
+        "FROM dbo.energy_fact f JOIN dbo.time_dim t ON f.time_id = t.time_id "
+        "JOIN dbo.suburb_dim s ON f.suburb_id = s.suburb_id WHERE t.YEAR >= ? "
+        "GROUP BY GROUPING SETS ((t.YEAR), (s.SUBURB_NAME, t.YEAR), ())"
+    )
+    assert params == [2020]
+
+
+def test_grand_total_only_has_no_group_by():
+    sql, _, dimensions = semantic.compile_grouping_sets('ev_fact', ['total_evs'], [()])
+    assert dimensions == []
+    assert "0 as [_grouping_id]" in sql
+    assert "GROUP BY" not in sql
+
+
+@pytest.mark.parametrize("grouping_set, expected", [
+    (('year', 'suburb'), 0),
+    (('year',), 1),
+    (('suburb',), 2),
+    ((), 3),
+])
+def test_grouping_id_matches_sql_server_bit_order(grouping_set, expected):
+    assert semantic._grouping_id(['year', 'suburb'], grouping_set) == expected
+
+
+def test_parse_grouping_args_combines_sets_and_cube():
+    MultiDict = pytest.importorskip("werkzeug.datastructures").MultiDict
+    parsed = semantic.parse_grouping_args(MultiDict({
+        'measures': 'avg_energy, total_evs', 'grouping_sets': 'year;suburb,year;', 'cube': 'fuel',
+    }))
+    assert parsed['measures'] == ['avg_energy', 'total_evs']
+    assert parsed['grouping_sets'] == [('year',), ('suburb', 'year'), (), ('fuel',), ()]
+
+
+@pytest.fixture
+def snap():
+    import pandas as pd
+    import snapshot
+    from utils.schema_registry import apply_dtypes
+    frames = {
+        'suburb_dim': pd.DataFrame({'suburb_id': [1, 2, 3], 'SUBURB_NAME': ['Avalon', 'Bondi', 'Carlton']}),
+        'ev_fact': pd.DataFrame({'suburb_id': [1, 1, 2], 'FUEL_TYPE': ['BEV', 'PHEV', 'BEV'],
+                                 'TOTAL_EVs': [5, 7, 3], 'AVG_PRICE': [50000.4, 60000.2, None]}),
+        'energy_fact': pd.DataFrame({'suburb_id': [1, 3], 'ENERGY_CONSUMPTION': [1.234, 2.345]}),
+    }
+    return snapshot.Snapshot({name: apply_dtypes(name, df) for name, df in frames.items()}, generation=1)
+
+
+def test_snapshot_results_serialize_like_the_sql_path(snap):
+    from db_helper import dataframe_to_json_serializable
+    df = semantic.evaluate_frame(snap, ['total_evs', 'ev_records', 'avg_price', 'avg_energy'],
+                                 dimensions=['suburb'], order_by=['suburb'])
+    records = dataframe_to_json_serializable(df)
+    assert records == [
+        {'SUBURB_NAME': 'Avalon', 'total_evs': 12, 'ev_records': 2, 'avg_price': 55000.0, 'avg_energy': 1.23},
+        {'SUBURB_NAME': 'Bondi', 'total_evs': 3, 'ev_records': 1, 'avg_price': None, 'avg_energy': None},
+        {'SUBURB_NAME': 'Carlton', 'total_evs': None, 'ev_records': None, 'avg_price': None, 'avg_energy': 2.35},
+    ]
+    assert all(isinstance(r['total_evs'], int) for r in records[:2])
+    assert all(isinstance(r['ev_records'], int) for r in records[:2])
@@ -0,0 +1,87 @@
+import pytest
+
+pytest.importorskip("sqlglot")
+
+from sql_guard import UnsafeQuery, parse_select  # noqa: E402
+
+ALLOWED = {'energy_fact', 'ev_fact', 'fuel_dim', 'suburb_dim', 'time_dim', 'vehicle_dim'}
+
+
+def normalized(query):
+    parsed = parse_select(query, ALLOWED)
+    return parsed.sql, parsed.params
+
+
+def test_where_literals_become_parameters():
+    sql, params = normalized("SELECT * FROM ev_fact WHERE TOTAL_EVs > 10 AND FUEL_TYPE IN ('BEV', 'PHEV')")
+    assert sql == "SELECT * FROM ev_fact WHERE TOTAL_EVs > ? AND FUEL_TYPE IN (?, ?)"
+    assert params == [10, 'BEV', 'PHEV']
+
+
+def test_queries_differing_in_constants_share_text():
+    first, _ = normalized("SELECT * FROM time_dim WHERE YEAR = 2022")
+    second, _ = normalized("SELECT * FROM time_dim WHERE YEAR = 2023")
+    assert first == second
+
+
+def test_grouped_function_expression_stays_inline():
+    sql, params = normalized(
+        "SELECT LEFT(SUBURB_NAME, 1) AS initial, COUNT(*) FROM suburb_dim GROUP BY LEFT(SUBURB_NAME, 1)"
+    )
+    assert "LEFT(SUBURB_NAME, 1) AS initial" in sql
+    assert sql.endswith("GROUP BY LEFT(SUBURB_NAME, 1)")
+    assert params == []
+
+
+def test_grouped_case_bucket_stays_inline():
+    bucket = "CASE WHEN TOTAL_EVs > 100 THEN 1 ELSE 0 END"
+    sql, params = normalized(f"SELECT {bucket} AS large, COUNT(*) FROM ev_fact GROUP BY {bucket}")
+    assert sql.count(bucket) == 2
+    assert params == []
+
+
+def test_convert_style_stays_inline():
+    sql, params = normalized("SELECT CONVERT(VARCHAR(10), GETDATE(), 120) AS d FROM time_dim WHERE YEAR = 2023")
+    assert "CONVERT(VARCHAR(10), GETDATE(), 120)" in sql
+    assert params == [2023]
+
+
+def test_function_arguments_in_predicates_stay_inline():
+    sql, params = normalized("SELECT * FROM suburb_dim WHERE LEFT(SUBURB_NAME, 2) = 'Ab'")
+    assert "LEFT(SUBURB_NAME, 2) = ?" in sql
+    assert params == ['Ab']
+
+
+def test_top_and_order_by_position_stay_inline():
+    sql, params = normalized("SELECT TOP 5 * FROM ev_fact WHERE TOTAL_EVs > 0 ORDER BY 1")
+    assert sql.startswith("SELECT TOP 5 ")
+    assert sql.endswith("ORDER BY 1")
+    assert params == [0]
+
+
+def test_subquery_predicates_are_parameterized():
+    sql, params = normalized(
+        "SELECT * FROM ev_fact WHERE suburb_id IN "
+        "(SELECT suburb_id FROM suburb_dim WHERE SUBURB_NAME = 'Abbotsford' GROUP BY suburb_id HAVING COUNT(*) > 1)"
+    )
+    assert params == ['Abbotsford', 1]
+    assert "GROUP BY suburb_id HAVING COUNT(*) > ?" in sql
+
+
+@pytest.mark.parametrize("query, status", [
+    ("DELETE FROM ev_fact", 400),
+    ("SELECT 1; DROP TABLE ev_fact", 400),
+    ("SELECT * INTO copy FROM ev_fact", 400),
+    ("SELECT * FROM sys.tables", 403),
+    ("SELECT * FROM secrets", 403),
+    ("SELECT * FROM OPENROWSET('SQLNCLI', 'x', 'SELECT 1')", 400),
+])
+def test_rejects_unsafe_queries(query, status):
+    with pytest.raises(UnsafeQuery) as error:
+        parse_select(query, ALLOWED)
+    assert error.value.status == status
+
+
+def test_cte_names_are_not_tables():
+    parsed = parse_select("WITH recent AS (SELECT * FROM time_dim WHERE YEAR > 2020) SELECT * FROM recent", ALLOWED)
+    assert parsed.tables == {'time_dim'}
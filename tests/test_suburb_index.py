@@ -0,0 +1,89 @@
+import pytest
+
+pytest.importorskip("pyodbc")
+pytest.importorskip("pandas")
+pytest.importorskip("dotenv")
+
+from suburb_index import SuburbIndex  # noqa: E402
+
+ROWS = [
+    (1, 'Carlton'),
+    (2, 'Carlton North'),
+    (3, 'North Melbourne'),
+    (4, 'Macquarie Park'),
+    (5, 'CARLTON '),
+    (6, None),
+]
+
+
+@pytest.fixture
+def index():
+    return SuburbIndex(ROWS, generation=7)
+
+
+def test_names_are_keyed_case_and_whitespace_insensitively(index):
+    assert index.ids_by_key['carlton'] == {1, 5}
+    assert 6 not in index.names
+    assert index.generation == 7
+
+
+@pytest.mark.parametrize("query, expected", [
+    ('carl', {1, 2, 5}),
+    ('  NORTH ', {2, 3}),
+    ('rth mel', {3}),
+    ('pa', {4}),
+    ('o', {1, 2, 3, 5}),
+    ('carltn', set()),
+    ('zzz', set()),
+])
+def test_resolve_matches_substrings_like_sql_like(index, query, expected):
+    assert index.resolve(query) == expected
+
+
+def test_resolve_matches_every_substring_the_scan_would(index):
+    for key in index.keys:
+        for start in range(len(key)):
+            for end in range(start + 1, len(key) + 1):
+                query = key[start:end]
+                # resolve() trims the query, as the search box does
+                expected = {i for k, ids in index.ids_by_key.items() if query.strip() in k for i in ids}
+                assert index.resolve(query) == expected, query
+
+
+def test_resolve_falls_back_to_fuzzy_only_when_asked(index):
+    assert index.resolve('melborne') == set()
+    assert index.resolve('melborne', fuzzy=True) == {3}
+    assert index.resolve('zzz', fuzzy=True) == set()
+
+
+def test_autocomplete_ranks_prefix_before_word_prefix(index):
+    suggestions = index.autocomplete('north', fuzzy=False)
+    assert [(s['suburb_id'], s['match']) for s in suggestions] == [(3, 'prefix'), (2, 'word_prefix')]
+
+
+def test_autocomplete_respects_limit(index):
+    assert len(index.autocomplete('carlton', limit=2)) == 2
+
+
+def test_load_builds_from_the_active_snapshot_without_the_database(monkeypatch):
+    import time
+    import pandas as pd
+    import snapshot
+    import suburb_index
+
+    def no_database(*args, **kwargs):
+        raise AssertionError("the database should not be queried")
+
+    snap = snapshot.Snapshot({'suburb_dim': pd.DataFrame({'suburb_id': [1, 2], 'SUBURB_NAME': ['Avalon', 'Bondi']})},
+                             generation=4)
+    monkeypatch.setattr(snapshot, '_current', snap)
+    monkeypatch.setattr(suburb_index, 'execute_query', no_database)
+    monkeypatch.setattr(suburb_index, 'get_load_generation', no_database)
+    monkeypatch.setattr(suburb_index, '_index', None)
+
+    index = suburb_index.get_index()
+    assert index.generation == 4
+    assert index.resolve('bon') == {2}
+
+    monkeypatch.setattr(suburb_index, '_checked_at', time.monotonic() - suburb_index.INDEX_REFRESH_SECONDS - 1)
+    assert suburb_index.get_index() is index
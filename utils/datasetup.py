@@ -1,35 +1,130 @@
 import os
-from azure.identity import DefaultAzureCredential
-from azure.storage.blob import BlobServiceClient
 import io
-from dotenv import load_dotenv
+import time
+from functools import lru_cache
 import pandas as pd
-from sqlalchemy import create_engine, text
-import pyodbc
-print(pyodbc.drivers())
-
-# Load environment variables
-load_dotenv()
-
-# Azure Blob Storage credentials
-account_storage = os.environ.get('ACCOUNT_STORAGE', 'etluts04')
-connect_str = os.environ.get('AZURE_STORAGE_CONNECTION_STRING')
-server = os.environ.get('DB_SERVER', 'etluts04server.database.windows.net')
-database = os.environ.get('DB_DATABASE', 'etldb04')
-username = os.environ.get('DB_USERNAME', 'vikramdc')
-password = os.environ.get('DB_PASSWORD', 'Whyubuggin$19')
-container_name = os.environ.get('CONTAINER_NAME', 'etlblob04')
-
-# Validate environment variables
-if not account_storage:
-    raise ValueError("ACCOUNT_STORAGE environment variable is missing.")
-print("Loaded ACCOUNT_STORAGE:", account_storage)
-print("Loaded AZURE_STORAGE_CONNECTION_STRING:", connect_str if connect_str else "None (will use DefaultAzureCredential)")
-
-engine = create_engine(f'mssql+pyodbc://{username}:{password}@{server}/{database}?driver=ODBC+Driver+18+for+SQL+Server')
+from sqlalchemy import text
+
+# Nothing here touches the network or the environment at import time: settings,
+# the engine and the Azure clients are built on first use and then cached.
+
+@lru_cache(maxsize=None)
+def load_settings():
+    """Load environment variables once and return the Azure settings."""
+    from dotenv import load_dotenv
+    load_dotenv()
+    settings = {
+        'account_storage': os.environ.get('ACCOUNT_STORAGE', 'etluts04'),
+        'connect_str': os.environ.get('AZURE_STORAGE_CONNECTION_STRING'),
+        'server': os.environ.get('DB_SERVER', 'etluts04server.database.windows.net'),
+        'database': os.environ.get('DB_DATABASE', 'etldb04'),
+        'username': os.environ.get('DB_USERNAME', 'vikramdc'),
+        'password': os.environ.get('DB_PASSWORD', 'Whyubuggin$19'),
+        'container_name': os.environ.get('CONTAINER_NAME', 'etlblob04'),
+    }
+    # Validate environment variables
+    if not settings['account_storage']:
+        raise ValueError("ACCOUNT_STORAGE environment variable is missing.")
+    print("Loaded ACCOUNT_STORAGE:", settings['account_storage'])
+    print("Loaded AZURE_STORAGE_CONNECTION_STRING:", settings['connect_str'] if settings['connect_str'] else "None (will use DefaultAzureCredential)")
+    return settings
+
+class PoolStats:
+    """Connection and checkout counters for an engine's pool."""
+
+    def __init__(self):
+        self.connections_opened = 0
+        self.checkouts = 0
+        self.checkout_wait_ms_total = 0.0
+        self.checkout_wait_ms_max = 0.0
+
+    def record_wait(self, elapsed_ms):
+        self.checkouts += 1
+        self.checkout_wait_ms_total += elapsed_ms
+        self.checkout_wait_ms_max = max(self.checkout_wait_ms_max, elapsed_ms)
+
+    def as_dict(self):
+        return {
+            'connections_opened': self.connections_opened,
+            'checkouts': self.checkouts,
+            'checkout_wait_ms_avg': round(self.checkout_wait_ms_total / self.checkouts, 3) if self.checkouts else 0.0,
+            'checkout_wait_ms_max': round(self.checkout_wait_ms_max, 3),
+        }
+
+def _timed_queue_pool():
+    from sqlalchemy.pool import QueuePool
+
+    class TimedQueuePool(QueuePool):
+        """QueuePool that records how long each checkout waited for a connection."""
+
+        def _do_get(self):
+            start = time.perf_counter()
+            try:
+                return super()._do_get()
+            finally:
+                stats = getattr(self, 'stats', None)
+                if stats is not None:
+                    stats.record_wait((time.perf_counter() - start) * 1000)
+
+    return TimedQueuePool
+
+def create_etl_engine(settings=None, pool_size=5, max_overflow=5, pool_timeout=30, pool_recycle=1800,
+                      insertmanyvalues_page_size=1000):
+    """Build a pooled SQLAlchemy engine for the ETL.
+
+    Pass a custom `settings` dict (see load_settings) or pool options to inject a
+    different database or pool shape, e.g. in tooling or tests.
+    """
+    import pyodbc
+    from sqlalchemy import create_engine, event
+    print(pyodbc.drivers())
+    s = settings or load_settings()
+    engine = create_engine(
+        f"mssql+pyodbc://{s['username']}:{s['password']}@{s['server']}:1433/{s['database']}"
+        "?driver=ODBC+Driver+18+for+SQL+Server&Encrypt=yes&TrustServerCertificate=no&Connection+Timeout=30",
+        poolclass=_timed_queue_pool(),
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_timeout=pool_timeout,
+        pool_recycle=pool_recycle,
+        pool_pre_ping=True,
+        fast_executemany=True,
+        use_insertmanyvalues=True,
+        insertmanyvalues_page_size=insertmanyvalues_page_size,
+    )
+    stats = PoolStats()
+    engine.pool.stats = stats
+
+    @event.listens_for(engine, 'connect')
+    def _on_connect(dbapi_connection, connection_record):
+        stats.connections_opened += 1
+
+    return engine
+
+@lru_cache(maxsize=None)
+def get_engine():
+    """Get the single shared ETL engine, created on first use."""
+    return create_etl_engine()
+
+def pool_status(engine=None):
+    """Report pool size, connections in use and checkout waits for an engine."""
+    engine = engine or get_engine()
+    pool = engine.pool
+    status = {
+        'size': pool.size(),
+        'checked_out': pool.checkedout(),
+        'overflow': pool.overflow(),
+        'idle': pool.checkedin(),
+    }
+    stats = getattr(pool, 'stats', None)
+    if stats is not None:
+        status.update(stats.as_dict())
+    return status
 
 class AzureDB:
-    def __init__(self, engine, local_path=None, account_storage=None, container_name=None):
+    def __init__(self, engine=None, local_path=None, account_storage=None, container_name=None):
+        if engine is None:
+            engine = get_engine()
         if local_path is None:
             local_path = os.path.join(os.path.dirname(__file__), '..', 'data')
         self.engine = engine
@@ -40,30 +135,51 @@ class AzureDB:
         if container_name is None:
             container_name = os.environ.get('CONTAINER_NAME', 'etlblob04')
         self.account_url = f"https://{account_storage}.blob.core.windows.net"
-        self.default_credential = DefaultAzureCredential()
-        connect_str = os.environ.get('AZURE_STORAGE_CONNECTION_STRING')
-        try:
-            if connect_str and "AccountKey" in connect_str:
-                self.blob_service_client = BlobServiceClient.from_connection_string(connect_str)
-                print("Initialized BlobServiceClient with connection string")
-            else:
-                self.blob_service_client = BlobServiceClient(account_url=self.account_url, credential=self.default_credential)
-                print("Initialized BlobServiceClient with DefaultAzureCredential")
-        except Exception as e:
-            print(f"Failed to initialize BlobServiceClient: {str(e)}")
-            raise
-        # Initialize container_client
-        self.access_container(container_name)
+        self.container_name = container_name
+        # Credential discovery and container creation are deferred to first blob access
+        self._default_credential = None
+        self._blob_service_client = None
+        self._container_client = None
+
+    @property
+    def default_credential(self):
+        if self._default_credential is None:
+            from azure.identity import DefaultAzureCredential
+            self._default_credential = DefaultAzureCredential()
+        return self._default_credential
+
+    @property
+    def blob_service_client(self):
+        if self._blob_service_client is None:
+            from azure.storage.blob import BlobServiceClient
+            connect_str = os.environ.get('AZURE_STORAGE_CONNECTION_STRING')
+            try:
+                if connect_str and "AccountKey" in connect_str:
+                    self._blob_service_client = BlobServiceClient.from_connection_string(connect_str)
+                    print("Initialized BlobServiceClient with connection string")
+                else:
+                    self._blob_service_client = BlobServiceClient(account_url=self.account_url, credential=self.default_credential)
+                    print("Initialized BlobServiceClient with DefaultAzureCredential")
+            except Exception as e:
+                print(f"Failed to initialize BlobServiceClient: {str(e)}")
+                raise
+        return self._blob_service_client
+
+    @property
+    def container_client(self):
+        if self._container_client is None:
+            self.access_container(self.container_name)
+        return self._container_client
         
     def access_container(self, container_name): 
         self.container_name = container_name
         try:
-            self.container_client = self.blob_service_client.get_container_client(container=container_name)
-            self.container_client.create_container()
+            self._container_client = self.blob_service_client.get_container_client(container=container_name)
+            self._container_client.create_container()
             print(f"Created container {container_name}")
         except Exception as ex:
             print(f"Accessing existing container {container_name}: {ex}")
-            self.container_client = self.blob_service_client.get_container_client(container=container_name)
+            self._container_client = self.blob_service_client.get_container_client(container=container_name)
             
     def delete_container(self):
         print("Deleting blob container...")
@@ -114,26 +230,9 @@ class AzureDB:
         content = self.container_client.download_blob(blob_name).readall().decode('utf-8')
         return pd.read_csv(io.StringIO(content), **read_csv_kwargs)
 
-    def upload_dataframe_sqldatabase(self, blob_name, blob_data):
-        print("\nUploading to Azure SQL server as table:\n\t" + blob_name)
-        blob_data.to_sql(blob_name, engine, if_exists='replace', index=False)
-        primary = blob_name.replace('dim', 'id')
-        if 'fact' in blob_name.lower():
-            with engine.connect() as con:
-                trans = con.begin()
-                con.execute(text(f'ALTER TABLE [dbo].[{blob_name}] alter column {blob_name}_id bigint NOT NULL'))
-                con.execute(text(f'ALTER TABLE [dbo].[{blob_name}] ADD CONSTRAINT [PK_{blob_name}] PRIMARY KEY CLUSTERED ([{blob_name}_id] ASC);'))
-                trans.commit() 
-        else:        
-            with engine.connect() as con:
-                trans = con.begin()
-                con.execute(text(f'ALTER TABLE [dbo].[{blob_name}] alter column {primary} bigint NOT NULL'))
-                con.execute(text(f'ALTER TABLE [dbo].[{blob_name}] ADD CONSTRAINT [PK_{blob_name}] PRIMARY KEY CLUSTERED ([{primary}] ASC);'))
-                trans.commit() 
-                
     def append_dataframe_sqldatabase(self, blob_name, blob_data):
         print(f"Appending to table: {blob_name}")
-        blob_data.to_sql(blob_name, self.engine, if_exists='append', index=False)
+        blob_data.to_sql(blob_name, self.engine, if_exists='append', index=False, chunksize=1000)
 
     def delete_sqldatabase(self, table_name):
         with self.engine.connect() as con:
@@ -142,6 +241,20 @@ class AzureDB:
             trans.commit()
             print(f"Table '{table_name}' deleted successfully.")
 
+    def record_load_generation(self):
+        """Bump the ETL load generation so the backend can detect fresh data."""
+        with self.engine.connect() as con:
+            trans = con.begin()
+            con.execute(text(
+                "IF OBJECT_ID('dbo.etl_load_generation', 'U') IS NULL "
+                "CREATE TABLE [dbo].[etl_load_generation] ("
+                "generation_id int IDENTITY(1,1) PRIMARY KEY, "
+                "loaded_at datetime2 NOT NULL DEFAULT SYSUTCDATETIME())"
+            ))
+            con.execute(text("INSERT INTO [dbo].[etl_load_generation] DEFAULT VALUES"))
+            trans.commit()
+        print("Recorded new ETL load generation")
+
     def get_sql_table(self, query):        
         try:
             df = pd.read_sql_query(query, self.engine)
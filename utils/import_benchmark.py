@@ -0,0 +1,73 @@
+"""Cold-start guard: measure module import time with `python -X importtime`.
+
+Run from the repository root:
+
+    python -m utils.import_benchmark
+    python -m utils.import_benchmark --budget-ms 1500 main utils.datasetup
+
+Exits non-zero when a module's cumulative import time exceeds its budget.
+tests/test_import_time.py checks DEFAULT_BUDGETS_MS as part of the test suite;
+this script is for investigating a regression (it lists the slowest imports).
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# Default cumulative import budgets in milliseconds. pandas dominates both;
+# anything on top of it (credentials, engines, network) should stay small.
+DEFAULT_BUDGETS_MS = {
+    'utils.datasetup': 2000,
+    'main': 2500,
+}
+
+
+def measure_import(module, runs=3):
+    """Import `module` in fresh interpreters and return (best cumulative ms, per-import timings)."""
+    best_ms, best_timings = None, []
+    for _ in range(runs):
+        proc = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+            cwd=ROOT, capture_output=True, text=True
+        )
+        if proc.returncode != 0:
+            raise RuntimeError(f"Importing {module} failed:\n{proc.stderr[-2000:]}")
+        timings = []
+        for line in proc.stderr.splitlines():
+            if not line.startswith('import time:') or '[us]' in line:
+                continue
+            self_us, cumulative_us, name = (part.strip() for part in line[len('import time:'):].split('|'))
+            timings.append((name, int(self_us) / 1000, int(cumulative_us) / 1000))
+        total_ms = next((cumulative for name, _, cumulative in timings if name == module), None)
+        if total_ms is None:
+            raise RuntimeError(f"No importtime entry found for {module}")
+        if best_ms is None or total_ms < best_ms:
+            best_ms, best_timings = total_ms, timings
+    return best_ms, best_timings
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Guard cold-start import time.")
+    parser.add_argument('modules', nargs='*', help="Modules to measure (default: main, utils.datasetup)")
+    parser.add_argument('--budget-ms', type=float, help="Budget applied to every module")
+    parser.add_argument('--runs', type=int, default=3, help="Fresh interpreters per module; the best run counts")
+    parser.add_argument('--top', type=int, default=10, help="Slowest imports to list per module")
+    args = parser.parse_args(argv)
+
+    modules = args.modules or list(DEFAULT_BUDGETS_MS)
+    failed = False
+    for module in modules:
+        budget = args.budget_ms or DEFAULT_BUDGETS_MS.get(module, 2000)
+        total_ms, timings = measure_import(module, runs=args.runs)
+        status = "OK" if total_ms <= budget else "OVER BUDGET"
+        failed = failed or total_ms > budget
+        print(f"{module}: {total_ms:.1f} ms (budget {budget:.0f} ms) {status}")
+        for name, self_ms, _ in sorted(timings, key=lambda t: t[1], reverse=True)[:args.top]:
+            print(f"    {self_ms:8.1f} ms  {name}")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
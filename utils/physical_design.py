@@ -0,0 +1,196 @@
+import time
+from contextlib import contextmanager
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+# Declarative physical design for the star schema.
+# Every fact table gets a nonclustered index per foreign key, plus covering
+# indexes shaped after the joins/filters used by the Flask API routes.
+PHYSICAL_DESIGN = {
+    'ev_fact': {
+        'foreign_keys': ['suburb_id', 'time_id', 'fuel_id', 'vehicle_id'],
+        'covering_indexes': [
+            {
+                # ev-price-scatter, ev-range-scatter, ev-distribution
+                'name': 'IX_ev_fact_suburb_time_covering',
+                'keys': ['suburb_id', 'time_id'],
+                'include': ['TOTAL_EVs', 'FUEL_TYPE', 'AVG_PRICE', 'AVG_RANGE_KM', 'EV_ADOPTION_SCORE'],
+            },
+        ],
+        'columnstore': True,
+    },
+    'energy_fact': {
+        'foreign_keys': ['suburb_id', 'time_id', 'fuel_id', 'vehicle_id'],
+        'covering_indexes': [
+            {
+                # energy-trends, suburb-data, energy-vs-no2, environmental-impact
+                'name': 'IX_energy_fact_suburb_time_covering',
+                'keys': ['suburb_id', 'time_id'],
+                'include': ['ENERGY_CONSUMPTION', 'ENERGY_CHANGE_PCT', 'NO2_LEVEL', 'NO2_CHANGE',
+                            'NO2_CHANGE_PCT', 'EV_PER_ENERGY_UNIT', 'NO2_PER_EV'],
+            },
+            {
+                # energy-trends groups by year only
+                'name': 'IX_energy_fact_time_covering',
+                'keys': ['time_id'],
+                'include': ['ENERGY_CONSUMPTION', 'ENERGY_CHANGE_PCT', 'NO2_LEVEL'],
+            },
+        ],
+        'columnstore': True,
+    },
+    'suburb_dim': {},
+    'vehicle_dim': {},
+    'fuel_dim': {},
+    'time_dim': {},
+}
+
+# The hot API queries, used to measure the effect of the physical design.
+PROBE_QUERIES = {
+    'energy_trends': """
+        SELECT t.YEAR, COUNT(*), AVG(e.ENERGY_CONSUMPTION), AVG(e.NO2_LEVEL)
+        FROM dbo.energy_fact e
+        JOIN dbo.time_dim t ON e.time_id = t.time_id
+        WHERE e.ENERGY_CONSUMPTION IS NOT NULL
+        GROUP BY t.YEAR
+    """,
+    'suburb_data': """
+        SELECT s.SUBURB_NAME, t.YEAR, AVG(e.ENERGY_CONSUMPTION), AVG(e.NO2_LEVEL), AVG(e.EV_PER_ENERGY_UNIT)
+        FROM dbo.energy_fact e
+        JOIN dbo.suburb_dim s ON e.suburb_id = s.suburb_id
+        JOIN dbo.time_dim t ON e.time_id = t.time_id
+        GROUP BY s.SUBURB_NAME, t.YEAR
+    """,
+    'ev_price_scatter': """
+        SELECT s.SUBURB_NAME, AVG(e.AVG_PRICE), SUM(e.TOTAL_EVs)
+        FROM dbo.ev_fact e
+        JOIN dbo.suburb_dim s ON e.suburb_id = s.suburb_id
+        JOIN dbo.time_dim t ON e.time_id = t.time_id
+        WHERE e.TOTAL_EVs > 0
+        GROUP BY s.SUBURB_NAME
+    """,
+    'ev_distribution': """
+        SELECT s.SUBURB_NAME, e.FUEL_TYPE, SUM(e.TOTAL_EVs)
+        FROM dbo.ev_fact e
+        JOIN dbo.suburb_dim s ON e.suburb_id = s.suburb_id
+        WHERE e.TOTAL_EVs > 0
+        GROUP BY s.SUBURB_NAME, e.FUEL_TYPE
+    """,
+}
+
+
+def fk_index_name(table_name, column):
+    return f"IX_{table_name}_{column}"
+
+
+def generate_index_ddl(table_name, design, columnstore=False):
+    """Build the index statements for one table from its design entry."""
+    statements = []
+    if columnstore and design.get('columnstore'):
+        # A clustered columnstore replaces the rowstore clustered PK, so the
+        # PK is rebuilt as nonclustered to keep the uniqueness guarantee.
+        statements.append(f"ALTER TABLE [dbo].[{table_name}] DROP CONSTRAINT [PK_{table_name}]")
+        statements.append(
+            f"CREATE CLUSTERED COLUMNSTORE INDEX [CCI_{table_name}] ON [dbo].[{table_name}]"
+        )
+        statements.append(
+            f"ALTER TABLE [dbo].[{table_name}] ADD CONSTRAINT [PK_{table_name}] "
+            f"PRIMARY KEY NONCLUSTERED ([{table_name}_id] ASC)"
+        )
+    for column in design.get('foreign_keys', []):
+        statements.append(
+            f"CREATE NONCLUSTERED INDEX [{fk_index_name(table_name, column)}] "
+            f"ON [dbo].[{table_name}] ([{column}])"
+        )
+    for index in design.get('covering_indexes', []):
+        keys = ", ".join(f"[{c}]" for c in index['keys'])
+        statement = f"CREATE NONCLUSTERED INDEX [{index['name']}] ON [dbo].[{table_name}] ({keys})"
+        if index.get('include'):
+            statement += " INCLUDE (" + ", ".join(f"[{c}]" for c in index['include']) + ")"
+        statements.append(statement)
+    return statements
+
+
+@contextmanager
+def _connection(bind):
+    """A connection for an Engine, or the given Connection itself (e.g. inside a transaction)."""
+    if isinstance(bind, Engine):
+        with bind.connect() as con:
+            yield con
+    else:
+        yield bind
+
+
+def time_probe_queries(bind, repeat=3):
+    """Run each probe query `repeat` times on an engine or connection and return the best time in ms."""
+    timings = {}
+    with _connection(bind) as con:
+        for name, query in PROBE_QUERIES.items():
+            best = None
+            for _ in range(repeat):
+                start = time.perf_counter()
+                con.execute(text(query)).fetchall()
+                elapsed = (time.perf_counter() - start) * 1000
+                best = elapsed if best is None else min(best, elapsed)
+            timings[name] = round(best, 2)
+    return timings
+
+
+class PhysicalDesignError(Exception):
+    """Raised when any index or statistics statement fails; carries every failure."""
+
+    def __init__(self, failures):
+        self.failures = failures
+        super().__init__("Physical design failed:\n" + "\n".join(
+            f"  {table_name}: {error}" for table_name, error in failures
+        ))
+
+
+def apply_physical_design(engine, design=PHYSICAL_DESIGN, columnstore=False):
+    """Create the declared indexes on an already loaded schema and update statistics.
+
+    The ETL builds indexes inside schema_deploy.deploy_star_schema; this is for
+    re-applying the design to existing tables. Every table is attempted; if any step failed, PhysicalDesignError is
+    raised at the end so the load is not recorded as successful.
+    """
+    print("\n=== APPLYING PHYSICAL DESIGN ===")
+    failures = []
+    with engine.connect() as con:
+        for table_name, table_design in design.items():
+            trans = con.begin()
+            try:
+                for statement in generate_index_ddl(table_name, table_design, columnstore):
+                    con.execute(text(statement))
+                trans.commit()
+                print(f"Indexed {table_name}")
+            except Exception as e:
+                trans.rollback()
+                print(f"Could not index {table_name}: {e}")
+                failures.append((table_name, e))
+
+    failures += update_statistics(engine, design)
+    if failures:
+        raise PhysicalDesignError(failures)
+
+
+def update_statistics(engine, tables=PHYSICAL_DESIGN):
+    """UPDATE STATISTICS WITH FULLSCAN on every table. Returns [(table, error)] for failures."""
+    failures = []
+    with engine.connect() as con:
+        for table_name in tables:
+            try:
+                con.execute(text(f"UPDATE STATISTICS [dbo].[{table_name}] WITH FULLSCAN"))
+                con.commit()
+            except Exception as e:
+                con.rollback()
+                print(f"Could not update statistics on {table_name}: {e}")
+                failures.append((table_name, e))
+    if not failures:
+        print("Statistics updated")
+    return failures
+
+
+def report_timings(before, after):
+    """Print before/after probe timings side by side."""
+    print(f"\n{'query':<20}{'before (ms)':>14}{'after (ms)':>14}")
+    for name in PROBE_QUERIES:
+        print(f"{name:<20}{before.get(name, float('nan')):>14.2f}{after.get(name, float('nan')):>14.2f}")
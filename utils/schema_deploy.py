@@ -0,0 +1,117 @@
+import pandas as pd
+from sqlalchemy import text
+
+from utils.physical_design import PHYSICAL_DESIGN, generate_index_ddl
+from utils.schema_registry import SCHEMA_REGISTRY, conform_frame
+
+class SchemaDeploymentError(Exception):
+    """Raised when a DDL statement or table load fails; the whole batch is rolled back."""
+
+    def __init__(self, step, statement, error):
+        self.step = step
+        self.statement = statement
+        self.error = error
+        super().__init__(f"Schema deployment failed during {step}: {error}\n  Statement: {statement}")
+
+
+def generate_create_table(table_name, schema=SCHEMA_REGISTRY):
+    """CREATE TABLE with registry column types and the primary/foreign keys declared inline."""
+    spec = schema[table_name]
+    lines = [
+        f"[{column.name}] {column.sql_type} {'NULL' if column.nullable else 'NOT NULL'}"
+        for column in spec['columns']
+    ]
+    lines.append(f"CONSTRAINT [PK_{table_name}] PRIMARY KEY CLUSTERED ([{spec['primary_key']}] ASC)")
+    for column, dim_table in spec.get('foreign_keys', {}).items():
+        lines.append(
+            f"CONSTRAINT [FK_{table_name}_{column}_dim] FOREIGN KEY ([{column}]) "
+            f"REFERENCES [dbo].[{dim_table}] ([{column}]) ON UPDATE CASCADE ON DELETE CASCADE"
+        )
+    return f"CREATE TABLE [dbo].[{table_name}] (\n    " + ",\n    ".join(lines) + "\n)"
+
+
+def generate_ddl(schema=SCHEMA_REGISTRY, design=PHYSICAL_DESIGN, columnstore=False):
+    """Generate the full star schema DDL up front.
+
+    Returns a dict of phases: 'drop' and 'create' run before the load,
+    'indexes' runs after it so bulk inserts are not slowed by index upkeep.
+    """
+    order = list(schema)
+    return {
+        'drop': [f"DROP TABLE IF EXISTS [dbo].[{name}]" for name in reversed(order)],
+        'create': [generate_create_table(name, schema) for name in order],
+        'indexes': [
+            statement
+            for name in order
+            for statement in generate_index_ddl(name, design.get(name, {}), columnstore)
+        ],
+    }
+
+
+def _is_text(series):
+    # object columns, and pandas' string dtype (the default for text from pandas 3)
+    return pd.api.types.is_object_dtype(series) or pd.api.types.is_string_dtype(series)
+
+
+def add_unknown_members(frames, schema=SCHEMA_REGISTRY):
+    """Add an id 0 'Unknown' row to any dimension that facts reference with key 0.
+
+    Facts use 0 for a missing vehicle/fuel; with trusted foreign keys that key
+    has to exist in the dimension.
+    """
+    frames = dict(frames)
+    for table_name, spec in schema.items():
+        for column, dim_table in spec.get('foreign_keys', {}).items():
+            dim = frames[dim_table]
+            referenced = set(frames[table_name][column].unique())
+            missing = referenced - set(dim[column].unique())
+            if missing == {0}:
+                unknown = {c: ('Unknown' if _is_text(dim[c]) else None) for c in dim.columns}
+                unknown[column] = 0
+                frames[dim_table] = pd.concat([pd.DataFrame([unknown]), dim], ignore_index=True).astype(
+                    {column: dim[column].dtype}
+                )
+                print(f"Added unknown member to {dim_table}")
+            elif missing:
+                raise SchemaDeploymentError(
+                    'validation', f"{table_name}.{column}",
+                    f"keys {sorted(missing)} have no row in {dim_table}"
+                )
+    return frames
+
+
+def _run(con, step, statements):
+    for statement in statements:
+        try:
+            con.execute(text(statement))
+        except Exception as e:
+            raise SchemaDeploymentError(step, statement, e) from e
+
+
+def deploy_star_schema(engine, frames, schema=SCHEMA_REGISTRY, design=PHYSICAL_DESIGN, columnstore=False,
+                       on_loaded=None):
+    """Drop, create, load and index the star schema in a single transaction.
+
+    Tables are created with their final keys before any data is inserted, so
+    nothing is rewritten afterwards; indexes are built after the load. Any
+    failure rolls back every step. on_loaded(con), if given, runs between the
+    load and the index phase on the transaction's connection.
+    """
+    frames = add_unknown_members(frames, schema)
+    frames = {name: conform_frame(name, frames[name]) for name in schema}
+    ddl = generate_ddl(schema, design, columnstore)
+    print("\n=== DEPLOYING STAR SCHEMA ===")
+    with engine.begin() as con:
+        _run(con, 'drop', ddl['drop'])
+        _run(con, 'create', ddl['create'])
+        for table_name in schema:
+            try:
+                frames[table_name].to_sql(table_name, con, schema='dbo', if_exists='append', index=False, chunksize=1000)
+            except Exception as e:
+                raise SchemaDeploymentError('load', f"INSERT INTO [dbo].[{table_name}]", e) from e
+            print(f"Loaded {len(frames[table_name])} rows into {table_name}")
+        if on_loaded is not None:
+            on_loaded(con)
+        _run(con, 'indexes', ddl['indexes'])
+    print("Star schema deployed")
+    return frames
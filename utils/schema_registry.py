@@ -0,0 +1,139 @@
+from collections import namedtuple
+import numpy as np
+import pandas as pd
+
+# Declarative schema for the star schema. The loader creates tables from it and
+# conforms DataFrames to it before inserting; the API uses it to cast query
+# results to compact dtypes before serializing.
+#
+# sql_type  - SQL Server column type
+# dtype     - pandas dtype for the column in memory
+# nullable  - whether the column allows NULL
+# scale     - decimal places kept when loading (DECIMAL columns)
+# default   - value used for missing and non-finite measures before loading
+Column = namedtuple('Column', ['name', 'sql_type', 'dtype', 'nullable', 'scale', 'default'],
+                    defaults=[True, None, None])
+
+_DIM_KEYS = {
+    'suburb_id': 'suburb_dim',
+    'vehicle_id': 'vehicle_dim',
+    'fuel_id': 'fuel_dim',
+    'time_id': 'time_dim',
+}
+
+def _key(name):
+    return Column(name, 'SMALLINT', 'int16', nullable=False)
+
+# Dimensions are listed before the facts that reference them (creation order)
+SCHEMA_REGISTRY = {
+    'suburb_dim': {
+        'primary_key': 'suburb_id',
+        'columns': [
+            _key('suburb_id'),
+            Column('SUBURB_NAME', 'VARCHAR(100)', 'object'),
+        ],
+    },
+    'vehicle_dim': {
+        'primary_key': 'vehicle_id',
+        'columns': [
+            _key('vehicle_id'),
+            Column('VEHICLE_TYPE', 'VARCHAR(50)', 'object'),
+        ],
+    },
+    'fuel_dim': {
+        'primary_key': 'fuel_id',
+        'columns': [
+            _key('fuel_id'),
+            Column('FUEL_TYPE', 'VARCHAR(10)', 'object'),
+        ],
+    },
+    'time_dim': {
+        'primary_key': 'time_id',
+        'columns': [
+            _key('time_id'),
+            Column('YEAR', 'SMALLINT', 'int16', nullable=False),
+            Column('IS_CURRENT_YEAR', 'BIT', 'bool', nullable=False),
+        ],
+    },
+    'ev_fact': {
+        'primary_key': 'ev_fact_id',
+        'foreign_keys': _DIM_KEYS,
+        'columns': [
+            Column('ev_fact_id', 'INT', 'int32', nullable=False),
+            _key('suburb_id'),
+            _key('vehicle_id'),
+            _key('fuel_id'),
+            _key('time_id'),
+            Column('TOTAL_EVs', 'INT', 'int32', nullable=False, default=0),
+            Column('FUEL_TYPE', 'VARCHAR(10)', 'object'),
+            Column('AVG_RANGE_KM', 'REAL', 'float32'),
+            Column('AVG_PRICE', 'DECIMAL(12,2)', 'float64', scale=2),
+            Column('EV_ADOPTION_SCORE', 'REAL', 'float32'),
+        ],
+    },
+    'energy_fact': {
+        'primary_key': 'energy_fact_id',
+        'foreign_keys': _DIM_KEYS,
+        'columns': [
+            Column('energy_fact_id', 'INT', 'int32', nullable=False),
+            _key('suburb_id'),
+            _key('vehicle_id'),
+            _key('fuel_id'),
+            _key('time_id'),
+            Column('ENERGY_CONSUMPTION', 'DECIMAL(14,2)', 'float64', scale=2, default=0.0),
+            Column('ENERGY_CHANGE_PCT', 'DECIMAL(9,6)', 'float64', scale=6, default=0.0),
+            Column('NO2_LEVEL', 'DECIMAL(6,2)', 'float64', scale=2, default=0.0),
+            Column('NO2_CHANGE', 'DECIMAL(6,2)', 'float64', scale=2, default=0.0),
+            Column('NO2_CHANGE_PCT', 'DECIMAL(9,6)', 'float64', scale=6, default=0.0),
+            Column('EV_PER_ENERGY_UNIT', 'DECIMAL(9,6)', 'float64', scale=6, default=0.0),
+            Column('NO2_PER_EV', 'DECIMAL(9,6)', 'float64', scale=6, default=0.0),
+        ],
+    },
+}
+
+
+def get_columns(table_name):
+    return SCHEMA_REGISTRY[table_name]['columns']
+
+
+def conform_frame(table_name, df):
+    """Shape a DataFrame to its registry entry for loading.
+
+    Columns are ordered as declared, missing and non-finite measures take the
+    column default, DECIMAL columns are rounded to their scale and every column
+    is cast to its compact dtype.
+    """
+    out = pd.DataFrame(index=df.index)
+    for column in get_columns(table_name):
+        values = df[column.name]
+        if pd.api.types.is_float_dtype(values.dtype):
+            values = values.replace([np.inf, -np.inf], np.nan)
+        if column.default is not None:
+            values = values.fillna(column.default)
+        if column.scale is not None:
+            values = values.round(column.scale)
+        if column.dtype == 'object':
+            values = values.astype(object).where(values.notna(), None)
+        else:
+            values = values.astype(column.dtype)
+        out[column.name] = values
+    return out
+
+
+def apply_dtypes(table_name, df):
+    """Cast query results to the registry dtypes (e.g. DECIMAL values to floats).
+
+    Columns not in the registry, and tables without an entry, are left as they are.
+    """
+    if table_name not in SCHEMA_REGISTRY:
+        return df
+    df = df.copy()
+    for column in get_columns(table_name):
+        if column.name not in df.columns or column.dtype == 'object':
+            continue
+        values = df[column.name]
+        if column.dtype.startswith('float'):
+            df[column.name] = pd.to_numeric(values, errors='coerce').astype(column.dtype)
+        elif values.notna().all():
+            df[column.name] = values.astype(column.dtype)
+    return df